@@ -0,0 +1,81 @@
+# /scripts/bench_async_overlap.py
+"""
+Comprueba con el servidor sustituto que engine="async" solapa el replay
+simbólico con las llamadas LLM: mientras se ejecuta el replay de la run k+1
+el servidor debe tener en vuelo la petición de la run k. Sale con código 1 si
+algún replay (salvo el primero, que no tiene nada que solapar) no coincide
+con peticiones en vuelo.
+"""
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from llm.standin_server import LatencyModel, StandinBackend, serve_in_thread
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="async engine: symbolic replay / LLM overlap check")
+    ap.add_argument("--runs", type=int, default=6)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--time-scale", type=float, default=0.2, help="stand-in latency scale")
+    ap.add_argument("--replay-delay-s", type=float, default=0.5,
+                    help="blocking delay added to each replay (emulates a slow owlready replay)")
+    ap.add_argument("--no-reasoner", action="store_true", help="skip the OWL reasoner (no Java available)")
+    args = ap.parse_args()
+
+    backend = StandinBackend("synth", latency=LatencyModel(time_scale=args.time_scale))
+    _, url = serve_in_thread(backend=backend)
+    os.environ.update(LOCAL_OPENAI_BASE_URL=url, LOCAL_OPENAI_API_KEY="standin", LOCAL_OPENAI_MODEL="standin")
+    os.environ.pop("LOCAL_OPENAI_BASE_URLS", None)
+
+    from experiments import runner
+    from scenarios.medicine_lost import cfg_unexpected
+
+    windows = []
+    current = {"active": False, "peak": 0}
+
+    def monitor() -> None:
+        while True:
+            if current["active"]:
+                current["peak"] = max(current["peak"], backend.in_flight)
+            time.sleep(0.005)
+
+    threading.Thread(target=monitor, daemon=True, name="overlap-monitor").start()
+
+    capture = runner._capture_trigger
+
+    def timed_capture(*a, **kw):
+        before = backend.requests
+        current.update(active=True, peak=backend.in_flight)
+        t0 = time.time()
+        try:
+            out = capture(*a, **kw)
+            if args.replay_delay_s:
+                time.sleep(args.replay_delay_s)
+            return out
+        finally:
+            current["active"] = False
+            windows.append({"replay_s": time.time() - t0, "peak_in_flight": current["peak"],
+                            "requests_received": backend.requests - before})
+
+    runner._capture_trigger = timed_capture
+
+    cfg = copy.deepcopy(cfg_unexpected)
+    if args.no_reasoner:
+        cfg.enable_reasoner = False
+    with tempfile.TemporaryDirectory() as out_dir:
+        t0 = time.time()
+        runner.run_c2_batch(cfg=cfg, out_dir=out_dir, n_runs=args.runs, mode="replay",
+                            engine="async", concurrency=args.concurrency, sleep_s=0)
+        elapsed = time.time() - t0
+
+    print(f"\n{'replay':>6} {'secs':>6} {'in_flight':>9} {'received':>8}")
+    for i, w in enumerate(windows, 1):
+        print(f"{i:6d} {w['replay_s']:6.2f} {w['peak_in_flight']:9d} {w['requests_received']:8d}")
+    overlapped = [w for w in windows[1:] if w["peak_in_flight"] > 0 or w["requests_received"] > 0]
+    print(f"overlap: {len(overlapped)}/{len(windows) - 1} replays with LLM requests in flight; "
+          f"batch {elapsed:.2f}s, server {backend.stats()}")
+    sys.exit(0 if len(overlapped) == len(windows) - 1 else 1)
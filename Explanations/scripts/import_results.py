@@ -0,0 +1,12 @@
+from experiments.results_store import DEFAULT_RESULTS_DB, ResultsStore
+import sys
+
+if __name__ == "__main__":
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else "results"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_RESULTS_DB
+
+    with ResultsStore(db_path) as store:
+        imported = store.import_history(results_dir)
+        for path, n in imported.items():
+            print(f"{n:4d}  {path}")
+        print("Stored in:", db_path, store.stats())
@@ -0,0 +1,24 @@
+from experiments.sweep import run_grid
+from scenarios.medicine_lost import cfg_unexpected
+import copy
+
+if __name__ == "__main__":
+    cfg = copy.deepcopy(cfg_unexpected)
+    cfg.enable_reasoner = False
+    cfg.extra_ontology_paths = ["data/ontologies/TMO.owl"]
+
+    out_path = run_grid(
+        cfg=cfg,
+        out_dir="results",
+        n_runs=10,
+        config="C3",
+        grid={
+            "temperature": [0.0, 0.3, 0.7],
+            "hops": [1, 2],
+            "max_ctx_triples": [40, 80],
+            "max_eventtype_items": [120, 250],
+        },
+        base_params={"max_tokens": 850},
+        concurrency=8,
+    )
+    print("Saved to:", out_path)
@@ -0,0 +1,38 @@
+from llm.standin_server import LatencyModel, StandinBackend, serve
+import argparse
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="OpenAI-compatible stand-in server (replay/synth)")
+    ap.add_argument("--mode", choices=["replay", "synth"], default="replay")
+    ap.add_argument("--results-dir", default="results")
+    ap.add_argument("--config", default=None, help="force C0..C3 pool (default: detect from prompt)")
+    ap.add_argument("--only-valid", action="store_true", help="replay only ok_schema records")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ttft-ms", type=float, default=150.0)
+    ap.add_argument("--ttft-sigma", type=float, default=0.3)
+    ap.add_argument("--tokens-per-s", type=float, default=40.0)
+    ap.add_argument("--tokens-per-s-std", type=float, default=5.0)
+    ap.add_argument("--time-scale", type=float, default=1.0, help="0 = no delay")
+    ap.add_argument("--prefill-tokens-per-s", type=float, default=0.0, help="0 = prefill not modelled")
+    ap.add_argument("--prefix-cache-entries", type=int, default=64, help="0 = no prefix cache")
+    ap.add_argument("--no-n", action="store_true", help="ignore the n parameter (single choice)")
+    ap.add_argument("--no-structured", action="store_true", help="reject requests with response_format (HTTP 400)")
+    args = ap.parse_args()
+
+    backend = StandinBackend(
+        mode=args.mode,
+        results_dir=args.results_dir,
+        config=args.config,
+        seed=args.seed,
+        only_valid=args.only_valid,
+        latency=LatencyModel(args.ttft_ms, args.ttft_sigma, args.tokens_per_s,
+                             args.tokens_per_s_std, args.time_scale, args.prefill_tokens_per_s),
+        prefix_cache_entries=args.prefix_cache_entries,
+        supports_n=not args.no_n,
+        supports_structured=not args.no_structured,
+    )
+    server = serve(args.host, args.port, backend)
+    print(f"Stand-in server ({args.mode}) on http://{args.host}:{server.server_address[1]}/v1", backend.stats())
+    server.serve_forever()
@@ -0,0 +1,18 @@
+from experiments.sweep import run_sweep
+from scenarios.medicine_lost import cfg_unexpected
+import copy
+
+if __name__ == "__main__":
+    cfg_c3 = copy.deepcopy(cfg_unexpected)
+    cfg_c3.enable_reasoner = False
+    cfg_c3.extra_ontology_paths = ["data/ontologies/TMO.owl"]
+
+    outputs = run_sweep(
+        cfg=cfg_unexpected,
+        out_dir="results",
+        n_runs=20,
+        configs=("C0", "C1", "C2", "C3"),
+        cfg_by_config={"C3": cfg_c3},
+    )
+    for label, path in outputs.items():
+        print(f"{label} saved to:", path)
@@ -0,0 +1,19 @@
+from experiments.metrics import format_summary, iter_jsonl, results_paths, summarize
+from experiments.results_store import ResultsStore
+import json
+import sys
+
+if __name__ == "__main__":
+    # uso: summarize_results.py [results_dir | results.sqlite] [--json]
+    source = next((a for a in sys.argv[1:] if not a.startswith("--")), "results")
+
+    if source.endswith(".sqlite"):
+        with ResultsStore(source) as store:
+            rows = summarize(store.get_records(fields=("candidates", "vocab")))
+    else:
+        rows = summarize(iter_jsonl(results_paths(source)))
+
+    if "--json" in sys.argv:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(format_summary(rows))
@@ -0,0 +1,306 @@
+# /src/experiments/metrics.py
+import glob
+import json
+import math
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# parámetros que distinguen un conjunto de resultados dentro de una configuración
+PARAM_KEYS = ("temperature", "max_tokens", "hops", "max_ctx_triples", "max_eventtype_items", "context_window",
+              "prompt_layout", "structured_output", "grid_point")
+
+
+def iter_jsonl(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Recorre los registros de varios .jsonl línea a línea (sin cargarlos enteros)."""
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # última línea truncada de un batch interrumpido
+                    break
+
+
+def results_paths(results_dir: str = "results") -> List[str]:
+    paths = sorted(glob.glob(os.path.join(results_dir, "*", "*", "*.jsonl")))
+    paths += sorted(glob.glob(os.path.join(results_dir, "grid", "*", "*", "*.jsonl")))
+    return paths
+
+
+class LogHistogram:
+    """
+    Histograma logarítmico para percentiles en memoria acotada: cada cubeta
+    cubre un factor (1 + rel_error), así que el error relativo del percentil
+    está acotado por rel_error y el nº de cubetas crece con log(max/min).
+    """
+
+    def __init__(self, rel_error: float = 0.01):
+        self._log_base = math.log1p(rel_error)
+        self._buckets: Dict[int, int] = {}
+        self._zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        self.total += x
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        if x <= 0:
+            self._zeros += 1
+            return
+        k = int(math.floor(math.log(x) / self._log_base))
+        self._buckets[k] = self._buckets.get(k, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for k in sorted(self._buckets):
+            seen += self._buckets[k]
+            if rank < seen:
+                # punto medio (geométrico) de la cubeta, acotado por min/max observados
+                x = math.exp((k + 0.5) * self._log_base)
+                return min(max(x, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "n": self.count,
+            "mean": (self.total / self.count) if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class TimingStats:
+    """
+    Agregado de los `timings` de los registros: histograma por etapa, tiempo
+    simbólico frente a tiempo de LLM (symbolic_share = fracción simbólica del
+    total) y tamaño del prompt.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.stages: Dict[str, LogHistogram] = {}
+        self.symbolic = LogHistogram()
+        self.llm = LogHistogram()
+        self.prompt_tokens = LogHistogram()
+        self.prompt_chars = LogHistogram()
+
+    def add(self, timings: Any) -> None:
+        if not isinstance(timings, dict):
+            return
+        self.records += 1
+        for name, v in (timings.get("stages_s") or {}).items():
+            if isinstance(v, (int, float)):
+                self.stages.setdefault(name, LogHistogram()).add(float(v))
+        for key, hist in (("symbolic_s", self.symbolic), ("llm_s", self.llm),
+                          ("prompt_tokens", self.prompt_tokens), ("prompt_chars", self.prompt_chars)):
+            v = timings.get(key)
+            if isinstance(v, (int, float)):
+                hist.add(float(v))
+
+    def summary(self) -> Dict[str, Any]:
+        total = self.symbolic.total + self.llm.total
+        return {
+            "records": self.records,
+            "stages_s": {k: h.summary() for k, h in sorted(self.stages.items())},
+            "symbolic_s": self.symbolic.summary(),
+            "llm_s": self.llm.summary(),
+            "symbolic_share": (self.symbolic.total / total) if total > 0 else None,
+            "prompt_tokens": self.prompt_tokens.summary(),
+            "prompt_chars": self.prompt_chars.summary(),
+        }
+
+
+class _Rate:
+    __slots__ = ("ok", "n")
+
+    def __init__(self):
+        self.ok = 0
+        self.n = 0
+
+    def add(self, v: Any) -> None:
+        if v is None:
+            return
+        self.n += 1
+        self.ok += int(bool(v))
+
+    def value(self) -> Optional[float]:
+        return (self.ok / self.n) if self.n else None
+
+
+class GroupMetrics:
+    """
+    Acumuladores de un grupo (config, parámetros). Memoria independiente del nº
+    de registros; las runs sin retract no explicado se cuentan aparte y no entran
+    en las tasas.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.ok_schema = _Rate()
+        self.ok_json = _Rate()
+        self.ok_vocab_strict = _Rate()
+        # C3: vocabulario tras la reparación, local o con el LLM (vocab_repaired si la hubo; si no, vocab)
+        self.ok_vocab_repaired = _Rate()
+        self.flag_fail: Dict[str, _Rate] = {}
+        self.event_classes: Set[str] = set()
+        self.latency = LogHistogram()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.no_trigger = 0
+        # C3: segundas llamadas de reparación hechas / evitadas con salida estructurada
+        self.repair_calls = 0
+        self.repairs_avoided = 0
+        # registros salvados por la recuperación tolerante de JSON, por tipo de arreglo
+        self.json_recovered = 0
+        self.json_recovery: Dict[str, int] = {}
+        # tiempo por etapa (simbólico frente a LLM) y tamaño del prompt
+        self.timings = TimingStats()
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        self.records += 1
+        if rec.get("schema_error_type") == "no_unexplained_trigger":
+            self.no_trigger += 1
+            return
+
+        self.ok_schema.add(rec.get("ok_schema"))
+        self.ok_json.add(rec.get("ok_json"))
+
+        vocab = rec.get("vocab")
+        if isinstance(vocab, dict):
+            self.ok_vocab_strict.add(vocab.get("ok_vocab_strict"))
+            if isinstance(rec.get("repair"), dict):
+                effective = rec.get("vocab_repaired") or vocab
+                self.ok_vocab_repaired.add(effective.get("ok_vocab_strict"))
+            for hyp in vocab.get("per_hypothesis") or []:
+                for flag, ok in (hyp or {}).items():
+                    # tasa de fallo por hipótesis para cada flag
+                    self.flag_fail.setdefault(flag, _Rate()).add(not ok)
+
+        for cand in rec.get("candidates") or []:
+            if isinstance(cand, dict):
+                cls = cand.get("event_class") or cand.get("event_type")
+                if isinstance(cls, str) and cls:
+                    self.event_classes.add(cls)
+
+        lat = rec.get("latency_s")
+        if isinstance(lat, (int, float)):
+            self.latency.add(float(lat))
+
+        repair = rec.get("repair")
+        if isinstance(repair, dict):
+            self.repair_calls += int(bool(repair.get("llm_call")))
+            self.repairs_avoided += int(bool(repair.get("avoided")))
+
+        recovered = rec.get("json_recovery")
+        if recovered:
+            self.json_recovered += 1
+            for kind in recovered:
+                self.json_recovery[kind] = self.json_recovery.get(kind, 0) + 1
+
+        self.timings.add(rec.get("timings"))
+
+        # tokens de la primera llamada y, en C3, de la de reparación
+        for usage in (rec.get("usage") or {}, rec.get("repair_usage") or {}):
+            self.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+            self.completion_tokens += int(usage.get("completion_tokens") or 0)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "no_trigger": self.no_trigger,
+            "ok_json_rate": self.ok_json.value(),
+            "ok_schema_rate": self.ok_schema.value(),
+            "ok_vocab_strict_rate": self.ok_vocab_strict.value(),
+            "ok_vocab_strict_repaired_rate": self.ok_vocab_repaired.value(),
+            "vocab_flag_fail_rate": {k: r.value() for k, r in sorted(self.flag_fail.items())},
+            "distinct_event_classes": len(self.event_classes),
+            "event_classes": sorted(self.event_classes),
+            "latency_s": self.latency.summary(),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "repair_calls": self.repair_calls,
+            "repairs_avoided": self.repairs_avoided,
+            "json_recovered": self.json_recovered,
+            "json_recovery": dict(sorted(self.json_recovery.items())),
+            "timings": self.timings.summary(),
+        }
+
+
+GroupKey = Tuple[Any, ...]
+
+
+def group_key(rec: Dict[str, Any]) -> GroupKey:
+    return (rec.get("config"),) + tuple(rec.get(k) for k in PARAM_KEYS)
+
+
+def aggregate(records: Iterable[Dict[str, Any]]) -> Dict[GroupKey, GroupMetrics]:
+    groups: Dict[GroupKey, GroupMetrics] = {}
+    for rec in records:
+        key = group_key(rec)
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = GroupMetrics()
+        g.add(rec)
+    return groups
+
+
+def summarize(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Métricas por (config, conjunto de parámetros), ordenadas por config."""
+    out: List[Dict[str, Any]] = []
+    groups = aggregate(records)
+    for key in sorted(groups, key=lambda k: tuple("" if v is None else str(v) for v in k)):
+        params = {k: v for k, v in zip(PARAM_KEYS, key[1:]) if v is not None}
+        out.append({"config": key[0], "params": params, **groups[key].summary()})
+    return out
+
+
+def format_summary(rows: List[Dict[str, Any]]) -> str:
+    def pct(v: Optional[float]) -> str:
+        return "   -  " if v is None else f"{100 * v:5.1f}%"
+
+    def sec(v: Optional[float]) -> str:
+        return "   -  " if v is None else f"{v:6.2f}"
+
+    lines = [
+        f"{'config':6} {'params':44} {'n':>5} {'schema':>7} {'vocab':>7} {'cls':>4} "
+        f"{'p50':>6} {'p95':>6} {'p99':>6} {'prompt':>8} {'compl':>8}"
+    ]
+    for r in rows:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items())
+        lat = r["latency_s"]
+        lines.append(
+            f"{str(r['config']):6} {params[:44]:44} {r['records']:5d} {pct(r['ok_schema_rate']):>7} "
+            f"{pct(r['ok_vocab_strict_rate']):>7} {r['distinct_event_classes']:4d} "
+            f"{sec(lat['p50'])} {sec(lat['p95'])} {sec(lat['p99'])} "
+            f"{r['prompt_tokens']:8d} {r['completion_tokens']:8d}"
+        )
+        if r["repair_calls"] or r["repairs_avoided"]:
+            lines.append(f"       repairs: llm_calls={r['repair_calls']}, avoided={r['repairs_avoided']}, "
+                         f"vocab after repair={pct(r['ok_vocab_strict_repaired_rate']).strip()}")
+        if r["json_recovered"]:
+            lines.append(f"       json recovered: {r['json_recovered']} "
+                         f"({', '.join(f'{k}={v}' for k, v in r['json_recovery'].items())})")
+        timings = r["timings"]
+        if timings["records"]:
+            sym = timings["symbolic_s"]
+            lines.append(f"       symbolic: p50={sym['p50']:.3f}s p95={sym['p95']:.3f}s "
+                         f"({pct(timings['symbolic_share']).strip()} of generation time)")
+        fails = {k: v for k, v in r["vocab_flag_fail_rate"].items() if v}
+        if fails:
+            lines.append("       vocab fails: " + ", ".join(f"{k}={pct(v).strip()}" for k, v in fails.items()))
+    return "\n".join(lines)
@@ -0,0 +1,121 @@
+# /src/experiments/result_sink.py
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+_STOP = object()
+
+
+class JsonlSink:
+    """
+    Escritor JSONL con buffer: mantiene el fichero abierto, acumula registros y
+    los vuelca desde un hilo en segundo plano cada `flush_every` registros o cada
+    `flush_interval_s` segundos (lo que ocurra antes), con fsync opcional.
+    append() es thread-safe y no bloquea en disco, así que se puede llamar desde
+    el bucle asyncio o desde el hilo que recoge los resultados del pool.
+    Cada volcado escribe líneas completas; el formato es el mismo que el del
+    append original (una línea json.dumps(record, ensure_ascii=False) por registro).
+    """
+
+    def __init__(self, path: str, flush_every: int = 32, flush_interval_s: float = 1.0, fsync: bool = False):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.flush_interval_s = flush_interval_s
+        self.fsync = fsync
+
+        self.records = 0
+        self.flushes = 0
+        self.bytes_written = 0
+
+        self._f = open(path, "a", encoding="utf-8")
+        self._q: "queue.Queue[Any]" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"JsonlSink({os.path.basename(path)})", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "JsonlSink":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        if self._closed:
+            raise ValueError(f"JsonlSink already closed: {self.path}")
+        self._raise_if_failed()
+        # la serialización se hace en el hilo llamante: el registro puede mutar después
+        self._q.put(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def flush(self) -> None:
+        """Bloquea hasta que todo lo encolado esté en disco."""
+        done = threading.Event()
+        self._q.put(done)
+        done.wait()
+        self._raise_if_failed()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_STOP)
+        self._thread.join()
+        self._f.close()
+        self._raise_if_failed()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "flushes": self.flushes,
+            "bytes_written": self.bytes_written,
+            "flush_every": self.flush_every,
+            "flush_interval_s": self.flush_interval_s,
+            "fsync": self.fsync,
+        }
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"JsonlSink failed writing {self.path}") from self._error
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        chunk = "".join(lines)
+        self._f.write(chunk)
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self.records += len(lines)
+        self.flushes += 1
+        self.bytes_written += len(chunk.encode("utf-8"))
+
+    def _run(self) -> None:
+        buf: List[str] = []
+        deadline: Optional[float] = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            try:
+                if isinstance(item, str):
+                    buf.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval_s
+                    if len(buf) < self.flush_every and time.monotonic() < deadline:
+                        continue
+                self._write(buf)
+            except BaseException as e:  # se relanza en el hilo llamante
+                self._error = e
+            buf = []
+            deadline = None
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
@@ -0,0 +1,239 @@
+# /src/experiments/results_store.py
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+DEFAULT_RESULTS_DB = "results/results.sqlite"
+
+# campos grandes o repetidos en cada línea: se guardan comprimidos y deduplicados
+BLOB_FIELDS = ("raw_text", "errors", "observed_retract", "candidates", "vocab")
+
+# columnas indexadas/consultables (copia de valores del registro)
+_COLUMNS = (
+    "config", "scenario_id", "run_id", "grid_point", "timestamp",
+    "ok_json", "ok_schema", "ok_vocab_strict", "schema_error_type",
+    "latency_s", "prompt_tokens", "completion_tokens", "total_tokens",
+    "temperature", "max_tokens", "hops", "max_ctx_triples", "max_eventtype_items",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    source_path TEXT UNIQUE,
+    config TEXT,
+    scenario_id TEXT,
+    ts TEXT,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER,
+    data BLOB
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER REFERENCES batches(id) ON DELETE CASCADE,
+    config TEXT,
+    scenario_id TEXT,
+    run_id INTEGER,
+    grid_point INTEGER,
+    timestamp TEXT,
+    ok_json INTEGER,
+    ok_schema INTEGER,
+    ok_vocab_strict INTEGER,
+    schema_error_type TEXT,
+    latency_s REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    temperature REAL,
+    max_tokens INTEGER,
+    hops INTEGER,
+    max_ctx_triples INTEGER,
+    max_eventtype_items INTEGER,
+    body TEXT,
+    raw_text TEXT REFERENCES blobs(hash),
+    errors TEXT REFERENCES blobs(hash),
+    observed_retract TEXT REFERENCES blobs(hash),
+    candidates TEXT REFERENCES blobs(hash),
+    vocab TEXT REFERENCES blobs(hash)
+);
+CREATE INDEX IF NOT EXISTS idx_records_key ON records(config, scenario_id, run_id);
+CREATE INDEX IF NOT EXISTS idx_records_batch ON records(batch_id, run_id);
+CREATE INDEX IF NOT EXISTS idx_records_ok ON records(config, ok_schema, ok_vocab_strict);
+CREATE INDEX IF NOT EXISTS idx_records_latency ON records(latency_s);
+CREATE INDEX IF NOT EXISTS idx_records_tokens ON records(total_tokens);
+"""
+
+
+def _bool(v: Any) -> Optional[int]:
+    return None if v is None else int(bool(v))
+
+
+class ResultsStore:
+    """
+    Almacén SQLite de resultados: una fila por registro con las columnas de
+    análisis indexadas (config, escenario, run_id, ok_schema, latencia, tokens),
+    y los campos grandes (raw_text, errors, candidates...) comprimidos con zlib y
+    deduplicados por hash en `blobs`. Los .jsonl siguen siendo la fuente; el
+    almacén se rellena importándolos, y get_records() reconstruye los registros.
+    """
+
+    def __init__(self, path: str = DEFAULT_RESULTS_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # --- escritura ---
+
+    def _put_blob(self, value: Any) -> Optional[str]:
+        if value is None:
+            return None
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        h = hashlib.sha1(raw).hexdigest()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO blobs(hash, size, data) VALUES (?, ?, ?)",
+            (h, len(raw), zlib.compress(raw, 6)),
+        )
+        return h
+
+    def _record_row(self, batch_id: int, scenario_id: Optional[str], rec: Dict[str, Any]) -> tuple:
+        usage = rec.get("usage") or {}
+        vocab = rec.get("vocab") or {}
+        cols = {
+            "config": rec.get("config"),
+            "scenario_id": scenario_id,
+            "run_id": rec.get("run_id"),
+            "grid_point": rec.get("grid_point"),
+            "timestamp": rec.get("timestamp"),
+            "ok_json": _bool(rec.get("ok_json")),
+            "ok_schema": _bool(rec.get("ok_schema")),
+            "ok_vocab_strict": _bool(vocab.get("ok_vocab_strict")) if isinstance(vocab, dict) else None,
+            "schema_error_type": rec.get("schema_error_type"),
+            "latency_s": rec.get("latency_s"),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "total_tokens": usage.get("total_tokens"),
+            "temperature": rec.get("temperature"),
+            "max_tokens": rec.get("max_tokens"),
+            "hops": rec.get("hops"),
+            "max_ctx_triples": rec.get("max_ctx_triples"),
+            "max_eventtype_items": rec.get("max_eventtype_items"),
+        }
+        # el resto del registro (orden de claves incluido) va en body; los campos
+        # grandes quedan como marcador para reinsertarlos en su sitio
+        body = {k: (None if k in BLOB_FIELDS else v) for k, v in rec.items()}
+        blobs = [self._put_blob(rec[f]) if f in rec else None for f in BLOB_FIELDS]
+        return (batch_id, *[cols[c] for c in _COLUMNS], json.dumps(body, ensure_ascii=False), *blobs)
+
+    def add_batch(self, records: Iterable[Dict[str, Any]], source_path: str,
+                  meta: Optional[Dict[str, Any]] = None) -> int:
+        """Inserta (o reemplaza, si ya se importó source_path) un batch completo."""
+        meta = meta or {}
+        recs = list(records)
+        config = meta.get("config") or (recs[0].get("config") if recs else None)
+        scenario_id = meta.get("scenario_id")
+        ts = os.path.basename(source_path).rsplit(".", 1)[0]
+
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE batch_id IN (SELECT id FROM batches WHERE source_path = ?)",
+                              (source_path,))
+            self.conn.execute("DELETE FROM batches WHERE source_path = ?", (source_path,))
+            cur = self.conn.execute(
+                "INSERT INTO batches(source_path, config, scenario_id, ts, meta) VALUES (?, ?, ?, ?, ?)",
+                (source_path, config, scenario_id, ts, json.dumps(meta, ensure_ascii=False)),
+            )
+            batch_id = cur.lastrowid
+            placeholders = ", ".join("?" * (1 + len(_COLUMNS) + 1 + len(BLOB_FIELDS)))
+            self.conn.executemany(
+                f"INSERT INTO records(batch_id, {', '.join(_COLUMNS)}, body, {', '.join(BLOB_FIELDS)}) "
+                f"VALUES ({placeholders})",
+                [self._record_row(batch_id, scenario_id, r) for r in recs],
+            )
+        return batch_id
+
+    def import_jsonl(self, jsonl_path: str) -> int:
+        """Importa un .jsonl de resultados (y su _meta.json si existe). Devuelve nº de registros."""
+        meta_path = jsonl_path[: -len(".jsonl")] + "_meta.json"
+        meta: Dict[str, Any] = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if not meta.get("scenario_id"):
+            # results/<cX>/<scenario_id>/<ts>.jsonl
+            meta["scenario_id"] = os.path.basename(os.path.dirname(jsonl_path))
+
+        records: List[Dict[str, Any]] = []
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # última línea truncada de un batch interrumpido
+                    break
+        self.add_batch(records, os.path.normpath(jsonl_path), meta)
+        return len(records)
+
+    def import_history(self, results_dir: str = "results") -> Dict[str, int]:
+        """Importa todos los results/<cX>/<scenario_id>/*.jsonl (y results/grid/...)."""
+        paths = sorted(glob.glob(os.path.join(results_dir, "*", "*", "*.jsonl")))
+        paths += sorted(glob.glob(os.path.join(results_dir, "grid", "*", "*", "*.jsonl")))
+        return {p: self.import_jsonl(p) for p in paths}
+
+    # --- lectura ---
+
+    def _get_blob(self, h: Optional[str]) -> Any:
+        if h is None:
+            return None
+        row = self.conn.execute("SELECT data FROM blobs WHERE hash = ?", (h,)).fetchone()
+        return json.loads(zlib.decompress(row[0]).decode("utf-8")) if row else None
+
+    def get_records(self, where: str = "1=1", params: tuple = (),
+                    fields: Sequence[str] = BLOB_FIELDS) -> Iterator[Dict[str, Any]]:
+        """
+        Reconstruye los registros originales que cumplen `where` (SQL sobre records).
+        Solo se descomprimen los campos grandes de `fields`; el resto queda a None.
+        """
+        sql = (f"SELECT body, {', '.join(BLOB_FIELDS)} FROM records WHERE {where} "
+               f"ORDER BY batch_id, run_id, id")
+        for row in self.conn.execute(sql, params):
+            rec = json.loads(row[0])
+            for field, h in zip(BLOB_FIELDS, row[1:]):
+                if field in rec and field in fields:
+                    rec[field] = self._get_blob(h)
+            yield rec
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def stats(self) -> Dict[str, Any]:
+        n_batches, = self.conn.execute("SELECT COUNT(*) FROM batches").fetchone()
+        n_records, = self.conn.execute("SELECT COUNT(*) FROM records").fetchone()
+        n_blobs, raw, stored = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+        ).fetchone()
+        return {
+            "batches": n_batches,
+            "records": n_records,
+            "blobs": n_blobs,
+            "blob_bytes_raw": raw,
+            "blob_bytes_stored": stored,
+        }
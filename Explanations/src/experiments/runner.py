@@ -1,21 +1,36 @@
 # /src/experiments/runner.py
+import asyncio
 import json
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from owlready2 import get_ontology
 
 from llm.client import client
-from hypotheses.c0 import generate_hypotheses_c0
+from llm.concurrency import AdaptiveConcurrency
+from hypotheses.c0 import prepare_c0, complete_c0, acomplete_c0, complete_c0_n, acomplete_c0_n
 from validator.runtime import ExperimentConfig, run_experiment
 
 from utils.tbox_vocab import extract_tbox_vocab
-from hypotheses.c1 import generate_hypotheses_c1
+from utils.symbolic_cache import SymbolicCache
+from experiments.metrics import TimingStats
+from experiments.result_sink import JsonlSink
+from experiments.results_store import ResultsStore
+from hypotheses.c1 import prepare_c1, complete_c1, acomplete_c1, complete_c1_n, acomplete_c1_n
 
-from hypotheses.c2 import generate_hypotheses_c2
+from hypotheses.c2 import prepare_c2, complete_c2, acomplete_c2, complete_c2_n, acomplete_c2_n
 
-from hypotheses.c3 import generate_hypotheses_c3
+from hypotheses.c3 import prepare_c3, complete_c3, acomplete_c3, complete_c3_n, acomplete_c3_n
 
+# (registro base, petición preparada para el LLM)
+Job = Tuple[Dict[str, Any], Dict[str, Any]]
+JobsFn = Callable[..., List[Job]]
+NoTriggerFn = Callable[..., Dict[str, Any]]
 
 
 def extract_known_entities_from_runtime(rt: Any) -> set:
@@ -42,6 +57,897 @@ def extract_known_entities_from_runtime(rt: Any) -> set:
     return names
 
 
+def _known_entities(payload: Dict[str, Any], rt: Any) -> set:
+    # en modo snapshot se precalcula una sola vez para todas las muestras
+    known = payload.get("known_entities", None)
+    if known is not None:
+        return set(known)
+    return extract_known_entities_from_runtime(rt) if rt is not None else set()
+
+
+def _causal_graph_path(base_dir: str, ts: str, run_id: int) -> str:
+    return os.path.join(base_dir, f"{ts}_causal", f"run_{run_id:03d}.json")
+
+
+# ---------- registros por configuración ----------
+
+def _c0_jobs(run_id: int, payload: Dict[str, Any],
+             temperature: float, max_tokens: int, structured_output: bool = False) -> List[Job]:
+    step = payload["step"]
+    step_index = payload["step_index"]
+    errors = payload["errors"]
+    if not errors:
+        return []
+
+    out: List[Job] = []
+    for r in getattr(step, "retracts", []) or []:
+        record: Dict[str, Any] = {
+            "run_id": run_id,
+            "config": "C0",
+            "timestamp": datetime.now().isoformat(),
+            "failed_step_index": step_index,
+            "failed_step_name": step.name,
+            "errors": errors,
+            "observed_retract": list(r),
+            "grounding_rule": {"min_part_rate": 0.5, "min_where_rate": 0.0},
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if structured_output:
+            record["structured_output"] = True
+
+        prepared = prepare_c0(
+            observed_retract=r,
+            step_name=step.name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            structured_output=structured_output,
+        )
+        out.append((record, prepared))
+    return out
+
+
+def _c1_jobs(run_id: int, payload: Dict[str, Any],
+             allowed_event_types: List[str], allowed_obj_props: List[str],
+             temperature: float, max_tokens: int,
+             context_window: Optional[int] = None, prompt_layout: str = "default",
+             structured_output: bool = False) -> List[Job]:
+    step = payload["step"]
+    step_index = payload["step_index"]
+    errors = payload["errors"]
+
+    payload_keys = sorted(list(payload.keys()))
+    rt = payload.get("runtime", None) or payload.get("rt", None)
+    known_entities = _known_entities(payload, rt)
+
+    out: List[Job] = []
+    for r in getattr(step, "retracts", []) or []:
+        record: Dict[str, Any] = {
+            "run_id": run_id,
+            "config": "C1",
+            "timestamp": datetime.now().isoformat(),
+            "failed_step_index": step_index,
+            "failed_step_name": step.name,
+            "errors": errors,
+            "observed_retract": list(r),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "debug_payload_keys": payload_keys,
+            "debug_known_entities_n": len(known_entities),
+
+        }
+        if context_window is not None:
+            record["context_window"] = context_window
+        if prompt_layout != "default":
+            record["prompt_layout"] = prompt_layout
+        if structured_output:
+            record["structured_output"] = True
+
+        prepared = prepare_c1(
+            observed_retract=r,
+            step_name=step.name,
+            allowed_entities=known_entities,
+            allowed_event_types=allowed_event_types,
+            allowed_obj_props=allowed_obj_props,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            context_window=context_window,
+            prompt_layout=prompt_layout,
+            structured_output=structured_output,
+        )
+        out.append((record, prepared))
+    return out
+
+
+def _c2_jobs(run_id: int, payload: Dict[str, Any],
+             allowed_event_classes: List[str], allowed_obj_props: List[str],
+             temperature: float, max_tokens: int,
+             hops: int, max_ctx_triples: int,
+             context_window: Optional[int] = None, prompt_layout: str = "default",
+             structured_output: bool = False) -> List[Job]:
+    step = payload["step"]
+    step_index = payload["step_index"]
+    errors = payload["errors"]
+
+    rt = payload.get("runtime", None) or payload.get("rt", None)
+    known_entities = _known_entities(payload, rt)
+
+    out: List[Job] = []
+    for r in getattr(step, "retracts", []) or []:
+        record: Dict[str, Any] = {
+            "run_id": run_id,
+            "config": "C2",
+            "timestamp": datetime.now().isoformat(),
+            "failed_step_index": step_index,
+            "failed_step_name": step.name,
+            "errors": errors,
+            "observed_retract": list(r),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "hops": hops,
+            "max_ctx_triples": max_ctx_triples,
+        }
+        if context_window is not None:
+            record["context_window"] = context_window
+        if prompt_layout != "default":
+            record["prompt_layout"] = prompt_layout
+        if structured_output:
+            record["structured_output"] = True
+
+        prepared = prepare_c2(
+            observed_retract=r,
+            step_name=step.name,
+            allowed_entities=known_entities,
+            allowed_event_classes=allowed_event_classes,
+            allowed_obj_props=allowed_obj_props,
+            runtime=rt,
+            hops=hops,
+            max_ctx_triples=max_ctx_triples,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            shared=payload.get("symbolic_cache"),
+            context_window=context_window,
+            prompt_layout=prompt_layout,
+            structured_output=structured_output,
+        )
+        out.append((record, prepared))
+    return out
+
+
+def _c3_jobs(run_id: int, payload: Dict[str, Any],
+             allowed_obj_props: List[str], extra_ontology_paths: List[str],
+             temperature: float, max_tokens: int,
+             hops: int, max_ctx_triples: int, max_eventtype_items: int,
+             context_window: Optional[int] = None, prompt_layout: str = "default",
+             structured_output: bool = False) -> List[Job]:
+    step = payload["step"]
+    step_index = payload["step_index"]
+    errors = payload["errors"]
+
+    rt = payload.get("runtime", None) or payload.get("rt", None)
+    known_entities = _known_entities(payload, rt)
+
+    out: List[Job] = []
+    for r in getattr(step, "retracts", []) or []:
+        record: Dict[str, Any] = {
+            "run_id": run_id,
+            "config": "C3",
+            "timestamp": datetime.now().isoformat(),
+            "failed_step_index": step_index,
+            "failed_step_name": step.name,
+            "errors": errors,
+            "observed_retract": list(r),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "hops": hops,
+            "max_ctx_triples": max_ctx_triples,
+            "max_eventtype_items": max_eventtype_items,
+            "extra_ontology_paths": extra_ontology_paths,
+        }
+        if context_window is not None:
+            record["context_window"] = context_window
+        if prompt_layout != "default":
+            record["prompt_layout"] = prompt_layout
+        if structured_output:
+            record["structured_output"] = True
+
+        prepared = prepare_c3(
+            observed_retract=r,
+            step_name=step.name,
+            allowed_entities=known_entities,
+            allowed_obj_props=allowed_obj_props,
+            runtime=rt,
+            hops=hops,
+            max_ctx_triples=max_ctx_triples,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_eventtype_items=max_eventtype_items,
+            shared=payload.get("symbolic_cache"),
+            context_window=context_window,
+            prompt_layout=prompt_layout,
+            structured_output=structured_output,
+        )
+        out.append((record, prepared))
+    return out
+
+
+def _no_trigger_record(run_id: int, config: str, temperature: float, max_tokens: int,
+                       **extra: Any) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        "run_id": run_id,
+        "config": config,
+        "timestamp": datetime.now().isoformat(),
+        "failed_step_index": None,
+        "failed_step_name": None,
+        "errors": [],
+        "observed_retract": None,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "ok_schema": False,
+        "schema_error_type": "no_unexplained_trigger",
+        "schema_error_msg": "No unexplained retracts were detected.",
+        "candidates": None,
+        "vocab": None,
+        "latency_s": None,
+        "usage": {},
+        "raw_text": "",
+    }
+    record.update(extra)
+    return record
+
+
+def _c0_no_trigger(run_id: int, temperature: float, max_tokens: int, **_: Any) -> Dict[str, Any]:
+    return _no_trigger_record(run_id, "C0", temperature, max_tokens)
+
+
+def _c1_no_trigger(run_id: int, temperature: float, max_tokens: int, **_: Any) -> Dict[str, Any]:
+    return _no_trigger_record(run_id, "C1", temperature, max_tokens)
+
+
+def _c2_no_trigger(run_id: int, temperature: float, max_tokens: int,
+                   hops: int, max_ctx_triples: int, **_: Any) -> Dict[str, Any]:
+    return _no_trigger_record(
+        run_id, "C2", temperature, max_tokens,
+        retrieval={"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": 0},
+    )
+
+
+def _c3_no_trigger(run_id: int, temperature: float, max_tokens: int,
+                   hops: int, max_ctx_triples: int, max_eventtype_items: int, **_: Any) -> Dict[str, Any]:
+    return _no_trigger_record(
+        run_id, "C3", temperature, max_tokens,
+        retrieval={"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": 0},
+        catalog={"n_types": 0, "max_items": max_eventtype_items},
+    )
+
+
+@dataclass(frozen=True)
+class _ConfigSpec:
+    jobs: JobsFn
+    complete: Callable[[client, Dict[str, Any]], Dict[str, Any]]
+    acomplete: Callable[..., Any]
+    # n muestras del mismo prompt en una sola petición (n choices)
+    complete_n: Callable[[client, Dict[str, Any], int], List[Dict[str, Any]]]
+    acomplete_n: Callable[..., Any]
+    no_trigger: NoTriggerFn
+
+
+_CONFIGS: Dict[str, _ConfigSpec] = {
+    "C0": _ConfigSpec(_c0_jobs, complete_c0, acomplete_c0, complete_c0_n, acomplete_c0_n,
+                        _c0_no_trigger),
+    "C1": _ConfigSpec(_c1_jobs, complete_c1, acomplete_c1, complete_c1_n, acomplete_c1_n,
+                        _c1_no_trigger),
+    "C2": _ConfigSpec(_c2_jobs, complete_c2, acomplete_c2, complete_c2_n, acomplete_c2_n,
+                        _c2_no_trigger),
+    "C3": _ConfigSpec(_c3_jobs, complete_c3, acomplete_c3, complete_c3_n, acomplete_c3_n,
+                        _c3_no_trigger),
+}
+
+
+# ---------- ejecución de runs ----------
+
+def _capture_trigger(cfg: ExperimentConfig, causal_graph_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Ejecuta el escenario y devuelve el payload del primer paso no explicado.
+    Al cortar ahí el experimento, el runtime queda congelado en ese estado (snapshot).
+    """
+    captured: List[Dict[str, Any]] = []
+
+    def on_unexplained(payload: Dict[str, Any]) -> None:
+        if not captured:
+            captured.append(payload)
+
+    run_experiment(cfg, on_unexplained=on_unexplained, causal_graph_path=causal_graph_path)
+    if not captured:
+        return None
+
+    payload = dict(captured[0])
+    rt = payload.get("runtime", None) or payload.get("rt", None)
+    payload["known_entities"] = extract_known_entities_from_runtime(rt) if rt is not None else set()
+    payload["symbolic_cache"] = SymbolicCache()
+    return payload
+
+
+def _run_jobs(label: str, run_id: int, payload: Optional[Dict[str, Any]],
+              params: Dict[str, Any]) -> List[Job]:
+    spec = _CONFIGS[label]
+    if payload is None:
+        return []
+    jobs = spec.jobs(run_id, payload, **params)
+    for record, prepared in jobs:
+        if "prompt_stats" in prepared:
+            record["prompt_stats"] = prepared["prompt_stats"]
+    return jobs
+
+
+def _run_records(label: str, run_id: int, payload: Optional[Dict[str, Any]],
+                 llm: client, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    spec = _CONFIGS[label]
+    records: List[Dict[str, Any]] = []
+    for record, prepared in _run_jobs(label, run_id, payload, params):
+        record.update(spec.complete(llm, prepared))
+        records.append(record)
+    if not records:
+        records.append(spec.no_trigger(run_id, **params))
+    return records
+
+
+def _sample_groups(run_ids: List[int], n_samples: int) -> List[List[int]]:
+    return [run_ids[i:i + n_samples] for i in range(0, len(run_ids), max(1, n_samples))]
+
+
+def _fan_out(label: str, run_ids: List[int], jobs_by_run: List[List[Job]],
+             results_by_job: List[List[Dict[str, Any]]], params: Dict[str, Any]) -> List[Tuple[int, List[Dict[str, Any]]]]:
+    """Reparte la muestra i de cada retract al registro de la i-ésima run del grupo."""
+    spec = _CONFIGS[label]
+    out: List[Tuple[int, List[Dict[str, Any]]]] = []
+    for i, (run_id, jobs) in enumerate(zip(run_ids, jobs_by_run)):
+        records: List[Dict[str, Any]] = []
+        for (record, _), results in zip(jobs, results_by_job):
+            record.update(results[i])
+            records.append(record)
+        out.append((run_id, records or [spec.no_trigger(run_id, **params)]))
+    return out
+
+
+def _run_records_n(label: str, run_ids: List[int], payload: Optional[Dict[str, Any]],
+                   llm: client, params: Dict[str, Any]) -> List[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Runs de un mismo snapshot (mismo prompt) con una petición de len(run_ids)
+    choices por retract; cada choice se convierte en el registro de una run.
+    """
+    spec = _CONFIGS[label]
+    jobs_by_run = [_run_jobs(label, run_id, payload, params) for run_id in run_ids]
+    results_by_job = [spec.complete_n(llm, prepared, len(run_ids)) for _, prepared in jobs_by_run[0]]
+    return _fan_out(label, run_ids, jobs_by_run, results_by_job, params)
+
+
+def _replay_run(label: str, cfg: ExperimentConfig, run_id: int, llm: client,
+                params: Dict[str, Any], causal_graph_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    payload = _capture_trigger(cfg, causal_graph_path)
+    return _run_records(label, run_id, payload, llm, params)
+
+
+# estado por proceso del pool (ontologías precargadas y cliente LLM propio)
+_WORKER_LLM: Optional[client] = None
+
+
+def _init_worker(ontology_paths: List[str], llm_settings: Dict[str, Any]) -> None:
+    global _WORKER_LLM
+    for p in ontology_paths:
+        get_ontology(p if p.startswith("file://") else "file://" + p).load()
+    # misma política que el cliente del batch (timeouts, reintentos, hedge, streaming, caché)
+    _WORKER_LLM = client.from_settings(llm_settings)
+
+
+def _counters_delta(after: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _counters_delta(v, before.get(k, {})) if isinstance(v, dict) else v - before.get(k, 0)
+            for k, v in after.items()}
+
+
+def _worker_run(label: str, cfg: ExperimentConfig, run_id: int, params: Dict[str, Any],
+                causal_graph_path: Optional[str]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """(registros, contadores del cliente del worker durante esta run)."""
+    before = _WORKER_LLM.counters()
+    records = _replay_run(label, cfg, run_id, _WORKER_LLM, params, causal_graph_path)
+    return records, _counters_delta(_WORKER_LLM.counters(), before)
+
+
+class _OrderedWriter:
+    """Escribe los registros en orden de run_id aunque las runs terminen desordenadas."""
+
+    def __init__(self, append: Callable[[Dict[str, Any]], None], run_ids: List[int]):
+        self.append = append
+        self.order = list(run_ids)
+        self.pos = 0
+        self.pending: Dict[int, List[Dict[str, Any]]] = {}
+
+    def put(self, run_id: int, records: List[Dict[str, Any]]) -> None:
+        self.pending[run_id] = records
+        while self.pos < len(self.order) and self.order[self.pos] in self.pending:
+            for rec in self.pending.pop(self.order[self.pos]):
+                self.append(rec)
+            self.pos += 1
+
+
+def _execute_runs(
+    label: str,
+    cfg: ExperimentConfig,
+    n_runs: int,
+    llm: client,
+    params: Dict[str, Any],
+    append: Callable[[Dict[str, Any]], None],
+    sleep_s: float = 0.0,
+    workers: int = 1,
+    graph_path_fn: Optional[Callable[[int], str]] = None,
+    mode: str = "replay",
+    engine: str = "sync",
+    concurrency: int = 4,
+    payload_fn: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+    run_ids: Optional[List[int]] = None,
+    n_samples: int = 1,
+    adaptive_concurrency: bool = False,
+) -> Dict[str, Any]:
+    """
+    Ejecuta las runs 1..n_runs y devuelve estadísticas de throughput.
+    - mode="replay": cada run reejecuta el escenario completo.
+    - mode="snapshot": el escenario se ejecuta una vez y las n_runs muestras se
+      generan desde el runtime congelado en el paso no explicado (solo coste LLM).
+    - engine="sync": secuencial, o pool de procesos con workers > 1 (solo replay;
+      cada worker precarga las ontologías una vez y crea su propio cliente LLM).
+    - engine="async": la parte simbólica de la run k+1 se solapa con la
+      generación en curso de la run k, con hasta `concurrency` llamadas LLM en vuelo.
+    Los registros se escriben siempre en orden de run_id. sleep_s solo aplica
+    en modo secuencial. payload_fn permite inyectar el snapshot ya capturado
+    (p. ej. desde un sweep). run_ids limita la ejecución a esas runs (reanudación).
+    Con n_samples > 1 (solo snapshot) cada grupo de n_samples runs se genera con
+    una petición de n choices (o peticiones concurrentes si el servidor no admite n).
+    Con adaptive_concurrency (solo async) `concurrency` es el máximo y el cliente
+    ajusta el nº de llamadas en vuelo según throughput y latencia (AIMD); el nivel
+    elegido y la curva van en las estadísticas (concurrency_controller).
+    """
+    if mode not in ("replay", "snapshot"):
+        raise ValueError(f"Unknown mode: {mode}")
+    if engine not in ("sync", "async"):
+        raise ValueError(f"Unknown engine: {engine}")
+    if engine == "async" and workers > 1:
+        raise ValueError("engine='async' cannot be combined with workers > 1")
+    if mode == "snapshot" and workers > 1:
+        raise ValueError("mode='snapshot' cannot be combined with workers > 1")
+    if n_samples > 1 and mode != "snapshot":
+        raise ValueError("n_samples > 1 requires mode='snapshot' (all runs share the prompt)")
+    if adaptive_concurrency and engine != "async":
+        raise ValueError("adaptive_concurrency requires engine='async'")
+
+    if run_ids is None:
+        run_ids = list(range(1, n_runs + 1))
+
+    if payload_fn is None:
+        def payload_fn() -> Optional[Dict[str, Any]]:
+            return _capture_trigger(cfg, graph_path_fn(0) if graph_path_fn else None)
+
+    controller = None
+    if adaptive_concurrency:
+        target = os.getenv("LOCAL_OPENAI_TARGET_LATENCY_S")
+        controller = AdaptiveConcurrency(max_limit=max(1, concurrency),
+                                         target_latency_s=float(target) if target else None)
+        llm.concurrency = controller
+
+    t0 = time.time()
+    level = 1
+    if engine == "async":
+        level = max(1, concurrency)
+        asyncio.run(_execute_runs_async(label, cfg, n_runs, llm, params, append,
+                                        level, graph_path_fn, mode, payload_fn, run_ids, n_samples))
+    elif mode == "snapshot" and n_samples > 1:
+        payload = payload_fn()
+        for group in _sample_groups(run_ids, n_samples):
+            for run_id, records in _run_records_n(label, group, payload, llm, params):
+                for rec in records:
+                    append(rec)
+                print(f"[{label}] sample {run_id}/{n_runs} finished (snapshot, n={len(group)})")
+
+            if sleep_s:
+                time.sleep(sleep_s)
+    elif mode == "snapshot":
+        payload = payload_fn()
+        for run_id in run_ids:
+            for rec in _run_records(label, run_id, payload, llm, params):
+                append(rec)
+            print(f"[{label}] sample {run_id}/{n_runs} finished (snapshot)")
+
+            if sleep_s:
+                time.sleep(sleep_s)
+    elif workers <= 1:
+        for run_id in run_ids:
+            records = _replay_run(label, cfg, run_id, llm, params,
+                                  graph_path_fn(run_id) if graph_path_fn else None)
+            for rec in records:
+                append(rec)
+            print(f"[{label}] run {run_id}/{n_runs} finished")
+
+            if sleep_s:
+                time.sleep(sleep_s)
+    else:
+        level = workers
+        _execute_runs_pool(label, cfg, n_runs, llm, params, append, workers, graph_path_fn, run_ids)
+
+    elapsed = time.time() - t0
+    stats = {
+        "engine": engine,
+        "mode": mode,
+        "concurrency": level,
+        "elapsed_s": elapsed,
+        "runs": len(run_ids),
+        "n_samples": n_samples,
+        "throughput_runs_per_min": (60.0 * len(run_ids) / elapsed) if elapsed > 0 else None,
+    }
+    if controller is not None:
+        llm.concurrency = None
+        summary = controller.summary()
+        # sin ventanas válidas (todas con errores o latencia excesiva): el último límite
+        stats["concurrency"] = summary["best_limit"] or summary["final_limit"]
+        stats["concurrency_controller"] = summary
+    return stats
+
+
+def _execute_runs_pool(label: str, cfg: ExperimentConfig, n_runs: int, llm: client, params: Dict[str, Any],
+                       append: Callable[[Dict[str, Any]], None], workers: int,
+                       graph_path_fn: Optional[Callable[[int], str]], run_ids: List[int]) -> None:
+    ontology_paths = [cfg.ontology_path] + list(getattr(cfg, "extra_ontology_paths", []) or [])
+    # fork hereda el world ya parseado (copy-on-write); spawn lo recarga en _init_worker
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+
+    writer = _OrderedWriter(append, run_ids)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(ontology_paths, llm.settings())) as ex:
+        futures = {
+            ex.submit(_worker_run, label, cfg, run_id, params,
+                      graph_path_fn(run_id) if graph_path_fn else None): run_id
+            for run_id in run_ids
+        }
+        for fut in as_completed(futures):
+            run_id = futures[fut]
+            records, counters = fut.result()
+            # las estadísticas del _meta.json (caché, prefijos, endpoints) incluyen las de los workers
+            llm.absorb(counters)
+            writer.put(run_id, records)
+            print(f"[{label}] run {run_id}/{n_runs} finished")
+    if llm.cache is not None:
+        # los workers escriben en el mismo directorio de caché
+        llm.cache.reload()
+
+
+def _symbolic_executor() -> ThreadPoolExecutor:
+    """
+    Hilo único para la parte simbólica (replay, retrieval, prompt) del motor async:
+    fuera del event loop, para que las peticiones en vuelo se envíen y reciban
+    mientras se ejecuta, y siempre en el mismo hilo porque owlready2 no es thread-safe.
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="symbolic")
+
+
+async def _execute_runs_async(label: str, cfg: ExperimentConfig, n_runs: int, llm: client,
+                              params: Dict[str, Any], append: Callable[[Dict[str, Any]], None],
+                              concurrency: int, graph_path_fn: Optional[Callable[[int], str]],
+                              mode: str, payload_fn: Callable[[], Optional[Dict[str, Any]]],
+                              run_ids: List[int], n_samples: int = 1) -> None:
+    spec = _CONFIGS[label]
+    sem = asyncio.Semaphore(concurrency)
+    writer = _OrderedWriter(append, run_ids)
+    loop = asyncio.get_running_loop()
+    executor = _symbolic_executor()
+    snapshot: Optional[Dict[str, Any]] = None
+
+    def symbolic(run_id: int) -> List[Job]:
+        # en el hilo simbólico: replay (o snapshot ya capturado), retrieval y prompt
+        if mode == "snapshot":
+            payload = snapshot
+        else:
+            payload = _capture_trigger(cfg, graph_path_fn(run_id) if graph_path_fn else None)
+        return _run_jobs(label, run_id, payload, params)
+
+    async def generate(run_id: int, jobs: List[Job]) -> None:
+        try:
+            records: List[Dict[str, Any]] = []
+            for record, prepared in jobs:
+                record.update(await spec.acomplete(llm, prepared))
+                records.append(record)
+        finally:
+            sem.release()
+        writer.put(run_id, records)
+        print(f"[{label}] run {run_id}/{n_runs} finished (async)")
+
+    async def generate_n(group: List[int], jobs_by_run: List[List[Job]]) -> None:
+        try:
+            results_by_job = [await spec.acomplete_n(llm, prepared, len(group)) for _, prepared in jobs_by_run[0]]
+        finally:
+            sem.release()
+        for run_id, records in _fan_out(label, group, jobs_by_run, results_by_job, params):
+            writer.put(run_id, records)
+            print(f"[{label}] sample {run_id}/{n_runs} finished (async, n={len(group)})")
+
+    tasks = []
+    try:
+        if mode == "snapshot":
+            snapshot = await loop.run_in_executor(executor, payload_fn)
+
+        if n_samples > 1:
+            # snapshot: un grupo de n_samples runs ocupa un hueco de concurrencia (una petición con n choices)
+            for group in _sample_groups(run_ids, n_samples):
+                jobs_by_run = [await loop.run_in_executor(executor, symbolic, run_id) for run_id in group]
+                if not jobs_by_run[0]:
+                    for run_id in group:
+                        writer.put(run_id, [spec.no_trigger(run_id, **params)])
+                    continue
+                await sem.acquire()
+                tasks.append(asyncio.create_task(generate_n(group, jobs_by_run)))
+        else:
+            for run_id in run_ids:
+                # la parte simbólica va a su hilo; mientras, el loop atiende las generaciones en vuelo
+                jobs = await loop.run_in_executor(executor, symbolic, run_id)
+                if not jobs:
+                    writer.put(run_id, [spec.no_trigger(run_id, **params)])
+                    continue
+
+                await sem.acquire()
+                tasks.append(asyncio.create_task(generate(run_id, jobs)))
+
+        await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown(wait=True)
+
+
+# parámetros que deben coincidir para reanudar un batch sobre el mismo .jsonl
+_RESUME_KEYS = (
+    "scenario_id", "config", "mode", "model", "temperature", "max_tokens",
+    "hops", "max_ctx_triples", "max_eventtype_items", "extra_ontology_paths", "tbox_vocab",
+    "context_window", "prompt_layout", "structured_output",
+)
+
+# estadísticas de una ejecución (segmento) del batch; tras reanudar, las de primer
+# nivel se recalculan sobre todo el .jsonl y las de cada segmento van en `resumed`
+_SEGMENT_KEYS = ("throughput", "sink", "timings", "repairs")
+
+
+def _batch_paths(base_dir: str, resume: Optional[str]) -> Tuple[str, str, str, str]:
+    """
+    (ts, base_dir, out_path, meta_path) de un batch nuevo, o del batch a reanudar.
+    resume puede ser la ruta del .jsonl / _meta.json o solo su timestamp.
+    """
+    if resume:
+        name = os.path.basename(resume)
+        for suffix in ("_meta.json", ".jsonl"):
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+        ts = name
+        base_dir = os.path.dirname(resume) or base_dir
+    else:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return ts, base_dir, os.path.join(base_dir, f"{ts}.jsonl"), os.path.join(base_dir, f"{ts}_meta.json")
+
+
+def _completed_run_ids(out_path: str) -> List[int]:
+    """
+    run_ids ya escritos en out_path. Si el batch murió a mitad de escritura se
+    recorta el fichero: una última línea incompleta y los registros de la última
+    run si tiene menos que las anteriores (se vuelve a ejecutar entera).
+    """
+    if not os.path.exists(out_path):
+        return []
+    with open(out_path, "rb") as f:
+        data = f.read()
+
+    counts: Dict[int, int] = {}
+    starts: Dict[int, int] = {}
+    end = 0
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        if line.strip():
+            try:
+                run_id = int(json.loads(line)["run_id"])
+            except (ValueError, KeyError, TypeError):
+                break
+            starts.setdefault(run_id, end)
+            counts[run_id] = counts.get(run_id, 0) + 1
+        end += len(line)
+
+    if len(counts) > 1:
+        last = list(counts)[-1]
+        if counts[last] < max(counts.values()):
+            end = starts.pop(last)
+            counts.pop(last)
+
+    if end < len(data):
+        with open(out_path, "r+b") as f:
+            f.truncate(end)
+        print(f"[resume] truncated {len(data) - end} trailing bytes from {out_path}")
+    return sorted(counts)
+
+
+def _start_meta(meta_path: str, meta: Dict[str, Any], out_path: str, n_runs: int,
+                resume: Optional[str]) -> Tuple[Dict[str, Any], List[int]]:
+    """Escribe el _meta.json inicial y devuelve (meta, run_ids pendientes)."""
+    if not resume:
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        return meta, list(range(1, n_runs + 1))
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        prev = json.load(f)
+    # normaliza tuplas/listas como quedan tras pasar por JSON; las claves que un
+    # _meta.json antiguo no registraba (p. ej. mode) no se comparan
+    current = json.loads(json.dumps(meta, ensure_ascii=False))
+    mismatched = {k: (prev.get(k), current.get(k)) for k in _RESUME_KEYS
+                  if k in prev and prev[k] != current.get(k)}
+    if mismatched:
+        raise ValueError(f"Cannot resume {out_path}: parameters differ {mismatched}")
+
+    done = set(_completed_run_ids(out_path))
+    run_ids = [i for i in range(1, n_runs + 1) if i not in done]
+    prev["n_runs"] = n_runs
+    segment = {k: prev.pop(k) for k in _SEGMENT_KEYS if k in prev}
+    if "resumed" not in prev and segment:
+        # las de primer nivel aún son las de la ejecución original (si llegó a terminar)
+        prev["first_segment"] = segment
+    prev.setdefault("resumed", []).append({
+        "at": datetime.now().isoformat(),
+        "completed_run_ids": len(done),
+        "pending_run_ids": run_ids,
+        "workers": meta.get("workers"),
+        "engine": meta.get("engine"),
+    })
+    prev.pop("finished_at", None)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(prev, f, ensure_ascii=False, indent=2)
+    print(f"[resume] {len(done)} run(s) already in {out_path}, {len(run_ids)} pending")
+    return prev, run_ids
+
+
+def _whole_file_stats(meta: Dict[str, Any], out_path: str) -> Dict[str, Any]:
+    """throughput/sink/timings/repairs de todo el .jsonl de un batch reanudado."""
+    timings = TimingStats()
+    repairs = _RepairTally(lambda rec: None)
+    run_ids = set()
+    records = 0
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            records += 1
+            run_ids.add(rec.get("run_id"))
+            timings.add(rec.get("timings"))
+            repairs(rec)
+
+    # solo cuentan para el ritmo los segmentos que llegaron a terminar
+    segments = [meta.get("first_segment") or {}] + list(meta["resumed"])
+    timed = [seg["throughput"] for seg in segments if "throughput" in seg]
+    elapsed = sum(t["elapsed_s"] for t in timed)
+    timed_runs = sum(t["runs"] for t in timed)
+    out = {
+        "throughput": {
+            "engine": meta.get("engine"),
+            "mode": meta.get("mode"),
+            "runs": len(run_ids),
+            "segments": len(segments),
+            "timed_segments": len(timed),
+            "elapsed_s": elapsed,
+            "throughput_runs_per_min": (60.0 * timed_runs / elapsed) if elapsed > 0 else None,
+        },
+        "sink": {"records": records, "bytes": os.path.getsize(out_path)},
+        "timings": timings.summary(),
+    }
+    if "repairs" in meta["resumed"][-1]:
+        out["repairs"] = repairs.summary()
+    return out
+
+
+def _finalize_meta(meta_path: str, meta: Dict[str, Any], out_path: Optional[str] = None, **extra: Any) -> None:
+    if out_path is not None and meta.get("resumed"):
+        segment = meta["resumed"][-1]
+        for key in _SEGMENT_KEYS:
+            if key in extra:
+                segment[key] = extra.pop(key)
+        extra.update(_whole_file_stats(meta, out_path))
+    meta.update(extra)
+    meta["finished_at"] = datetime.now().isoformat()
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def _llm_meta(llm: client) -> Dict[str, Any]:
+    # estadísticas del cliente del batch; con workers > 1 incluyen las de los workers (absorb)
+    out: Dict[str, Any] = {
+        "llm_policy": {
+            "timeout_s": getattr(llm, "timeout_s", None),
+            "max_retries": getattr(llm, "max_retries", None),
+            "hedge_percentile": getattr(llm, "hedge_percentile", None),
+            "stream": getattr(llm, "stream", None),
+        },
+    }
+    if getattr(llm, "cache", None) is not None:
+        out["llm_cache"] = llm.cache_stats()
+    if getattr(llm, "prefix_reporting", 0):
+        out["prefix_cache"] = llm.prefix_cache_stats()
+    endpoints = getattr(llm, "endpoints", None)
+    if endpoints is not None and len(endpoints) > 1:
+        out["endpoints"] = endpoints.stats()
+    return out
+
+
+class _RepairTally:
+    """
+    Envuelve el append del sink y cuenta las llamadas de reparación de C3: las
+    hechas y las evitadas (salida con response_format que ya cumplía las reglas,
+    o reparación local suficiente), y los arreglos locales por campo.
+    """
+
+    def __init__(self, append: Callable[[Dict[str, Any]], None]):
+        self.append = append
+        self.records = 0
+        self.llm_calls = 0
+        self.avoided = 0
+        self.structured = 0
+        self.local_only = 0
+        self.reasons: Dict[str, int] = {}
+        self.local_fixes: Dict[str, int] = {}
+
+    def __call__(self, rec: Dict[str, Any]) -> None:
+        repair = rec.get("repair")
+        if repair is not None:
+            self.records += 1
+            self.llm_calls += int(repair["llm_call"])
+            self.avoided += int(repair["avoided"])
+            self.structured += int(bool(rec.get("llm_structured")))
+            self.local_only += int(bool(repair["reasons"]) and not repair["remaining"])
+            for reason in repair["reasons"]:
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            for fix in repair["local_fixes"]:
+                self.local_fixes[fix["field"]] = self.local_fixes.get(fix["field"], 0) + 1
+        self.append(rec)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "structured_records": self.structured,
+            "llm_calls": self.llm_calls,
+            "avoided": self.avoided,
+            "avoided_by_local_repair": self.local_only,
+            "reasons": dict(sorted(self.reasons.items())),
+            "local_fixes": dict(sorted(self.local_fixes.items())),
+        }
+
+
+class _TimingTally:
+    """
+    Envuelve el append del sink y agrega los `timings` de cada registro (tiempo
+    por etapa, simbólico frente a LLM, tamaño del prompt) para el _meta.json.
+    """
+
+    def __init__(self, append: Callable[[Dict[str, Any]], None]):
+        self.append = append
+        self.stats = TimingStats()
+
+    def __call__(self, rec: Dict[str, Any]) -> None:
+        self.stats.add(rec.get("timings"))
+        self.append(rec)
+
+    def summary(self) -> Dict[str, Any]:
+        return self.stats.summary()
+
+
+def _mirror_to_store(results_db: Optional[str], out_path: str) -> None:
+    # el .jsonl sigue siendo la salida principal; el almacén SQLite es una copia consultable
+    if not results_db:
+        return
+    with ResultsStore(results_db) as store:
+        n = store.import_jsonl(out_path)
+    print(f"[results_db] {n} record(s) from {out_path} stored in {results_db}")
+
+
 
 def run_c0_batch(
     cfg: ExperimentConfig,
@@ -50,15 +956,23 @@ def run_c0_batch(
     temperature: float = 0.3,
     max_tokens: int = 600,
     sleep_s: float = 0.0,
+    export_causal_graph: bool = False,
+    workers: int = 1,
+    mode: str = "replay",
+    engine: str = "sync",
+    concurrency: int = 4,
+    fsync: bool = False,
+    resume: Optional[str] = None,
+    results_db: Optional[str] = None,
+    n_samples: int = 1,
+    structured_output: bool = False,
+    adaptive_concurrency: bool = False,
 ) -> str:
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     scenario_id = getattr(cfg, "scenario_id", None) or "medicine_lost"
-    base_dir = os.path.join(out_dir, "c0", scenario_id)
+    ts, base_dir, out_path, meta_path = _batch_paths(os.path.join(out_dir, "c0", scenario_id), resume)
     os.makedirs(base_dir, exist_ok=True)
-    out_path = os.path.join(base_dir, f"{ts}.jsonl")
 
     llm = client()
-    meta_path = os.path.join(base_dir, f"{ts}_meta.json")
     meta = {
         "scenario_id": scenario_id,
         "n_runs": n_runs,
@@ -67,77 +981,34 @@ def run_c0_batch(
         "model": getattr(llm, "model", None),
         "base_url": getattr(llm, "base_url", None),
         "started_at": datetime.now().isoformat(),
+        "workers": workers,
+        "mode": mode,
+        "engine": engine,
+        "n_samples": n_samples,
+        "structured_output": structured_output,
     }
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-
-    def append(record: Dict[str, Any]) -> None:
-        with open(out_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-    for run_id in range(1, n_runs + 1):
-        wrote_any = False
-
-        def on_unexplained(payload: Dict[str, Any]) -> None:
-            nonlocal wrote_any
-            step = payload["step"]
-            step_index = payload["step_index"]
-            errors = payload["errors"]
-            if not errors:
-                return
-
-            for r in getattr(step, "retracts", []) or []:
-                record: Dict[str, Any] = {
-                    "run_id": run_id,
-                    "config": "C0",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": step_index,
-                    "failed_step_name": step.name,
-                    "errors": errors,
-                    "observed_retract": list(r),
-                    "grounding_rule": {"min_part_rate": 0.5, "min_where_rate": 0.0},
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                }
-
-                res = generate_hypotheses_c0(
-                    llm=llm,
-                    observed_retract=r,
-                    step_name=step.name,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-                record.update(res)
-                append(record)
-                wrote_any = True
-
-        run_experiment(cfg, on_unexplained=on_unexplained)
-
-        print(f"[C0] run {run_id}/{n_runs} finished")
-        if not wrote_any:
-            append(
-                {
-                    "run_id": run_id,
-                    "config": "C0",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": None,
-                    "failed_step_name": None,
-                    "errors": [],
-                    "observed_retract": None,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "ok_schema": False,
-                    "schema_error_type": "no_unexplained_trigger",
-                    "schema_error_msg": "No unexplained retracts were detected.",
-                    "candidates": None,
-                    "vocab": None,
-                    "latency_s": None,
-                    "usage": {},
-                    "raw_text": "",
-                }
-            )
-        if sleep_s:
-            time.sleep(sleep_s)
+    meta, run_ids = _start_meta(meta_path, meta, out_path, n_runs, resume)
+
+    with JsonlSink(out_path, fsync=fsync) as sink:
+        timings = _TimingTally(sink.append)
+        stats = _execute_runs(
+            "C0", cfg, n_runs, llm,
+            params={"temperature": temperature, "max_tokens": max_tokens,
+                    "structured_output": structured_output},
+            append=timings,
+            sleep_s=sleep_s,
+            workers=workers,
+            mode=mode,
+            engine=engine,
+            concurrency=concurrency,
+            graph_path_fn=(lambda run_id: _causal_graph_path(base_dir, ts, run_id)) if export_causal_graph else None,
+            run_ids=run_ids,
+            n_samples=n_samples,
+            adaptive_concurrency=adaptive_concurrency,
+        )
+    _finalize_meta(meta_path, meta, out_path, throughput=stats, sink=sink.stats(), timings=timings.summary(),
+                   **_llm_meta(llm))
+    _mirror_to_store(results_db, out_path)
 
     return out_path
 
@@ -150,12 +1021,23 @@ def run_c1_batch(
     temperature: float = 0.3,
     max_tokens: int = 700,
     sleep_s: float = 0.0,
+    export_causal_graph: bool = False,
+    workers: int = 1,
+    mode: str = "replay",
+    engine: str = "sync",
+    concurrency: int = 4,
+    fsync: bool = False,
+    resume: Optional[str] = None,
+    results_db: Optional[str] = None,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    n_samples: int = 1,
+    structured_output: bool = False,
+    adaptive_concurrency: bool = False,
 ) -> str:
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     scenario_id = getattr(cfg, "scenario_id", None) or "medicine_lost"
-    base_dir = os.path.join(out_dir, "c1", scenario_id)
+    ts, base_dir, out_path, meta_path = _batch_paths(os.path.join(out_dir, "c1", scenario_id), resume)
     os.makedirs(base_dir, exist_ok=True)
-    out_path = os.path.join(base_dir, f"{ts}.jsonl")
 
     llm = client()
 
@@ -163,7 +1045,6 @@ def run_c1_batch(
     allowed_event_types = vocab.event_types
     allowed_obj_props = vocab.object_properties
 
-    meta_path = os.path.join(base_dir, f"{ts}_meta.json")
     meta = {
         "scenario_id": scenario_id,
         "n_runs": n_runs,
@@ -177,91 +1058,43 @@ def run_c1_batch(
             "n_object_properties": len(allowed_obj_props),
             "ontology_path": getattr(cfg, "ontology_path", None),
         },
+        "workers": workers,
+        "mode": mode,
+        "engine": engine,
+        "n_samples": n_samples,
+        "context_window": context_window,
+        "prompt_layout": prompt_layout,
+        "structured_output": structured_output,
     }
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-
-    def append(record: Dict[str, Any]) -> None:
-        with open(out_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-
-    for run_id in range(1, n_runs + 1):
-        wrote_any = False
-
-        def on_unexplained(payload: Dict[str, Any]) -> None:
-            nonlocal wrote_any
-
-            step = payload["step"]
-            step_index = payload["step_index"]
-            errors = payload["errors"]
-
-            payload_keys = sorted(list(payload.keys()))
-            rt = payload.get("runtime", None) or payload.get("rt", None)
-            known_entities = extract_known_entities_from_runtime(rt) if rt is not None else set()
-            
-            print("rt is None?", rt is None, "type:", type(rt))
-            print("payload keys:", list(payload.keys()))
-
-            for r in getattr(step, "retracts", []) or []:
-                record: Dict[str, Any] = {
-                    "run_id": run_id,
-                    "config": "C1",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": step_index,
-                    "failed_step_name": step.name,
-                    "errors": errors,
-                    "observed_retract": list(r),
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "debug_payload_keys": payload_keys,
-                    "debug_known_entities_n": len(known_entities),
-
-                }
-
-                res = generate_hypotheses_c1(
-                    llm=llm,
-                    observed_retract=r,
-                    step_name=step.name,
-                    allowed_entities=known_entities,
-                    allowed_event_types=allowed_event_types,
-                    allowed_obj_props=allowed_obj_props,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-                record.update(res)
-                append(record)
-                wrote_any = True
-
-        run_experiment(cfg, on_unexplained=on_unexplained)
-        print(f"[C1] run {run_id}/{n_runs} finished")
-
-        if not wrote_any:
-            append(
-                {
-                    "run_id": run_id,
-                    "config": "C1",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": None,
-                    "failed_step_name": None,
-                    "errors": [],
-                    "observed_retract": None,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "ok_schema": False,
-                    "schema_error_type": "no_unexplained_trigger",
-                    "schema_error_msg": "No unexplained retracts were detected.",
-                    "candidates": None,
-                    "vocab": None,
-                    "latency_s": None,
-                    "usage": {},
-                    "raw_text": "",
-                }
-            )
-            
-            
-        if sleep_s:
-            time.sleep(sleep_s)
+    meta, run_ids = _start_meta(meta_path, meta, out_path, n_runs, resume)
+
+    with JsonlSink(out_path, fsync=fsync) as sink:
+        timings = _TimingTally(sink.append)
+        stats = _execute_runs(
+            "C1", cfg, n_runs, llm,
+            params={
+                "allowed_event_types": allowed_event_types,
+                "allowed_obj_props": allowed_obj_props,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "context_window": context_window,
+                "prompt_layout": prompt_layout,
+                "structured_output": structured_output,
+            },
+            append=timings,
+            sleep_s=sleep_s,
+            workers=workers,
+            mode=mode,
+            engine=engine,
+            concurrency=concurrency,
+            graph_path_fn=(lambda run_id: _causal_graph_path(base_dir, ts, run_id)) if export_causal_graph else None,
+            run_ids=run_ids,
+            n_samples=n_samples,
+            adaptive_concurrency=adaptive_concurrency,
+        )
+    _finalize_meta(meta_path, meta, out_path, throughput=stats, sink=sink.stats(), timings=timings.summary(),
+                   **_llm_meta(llm))
+    _mirror_to_store(results_db, out_path)
 
     return out_path
 
@@ -276,12 +1109,23 @@ def run_c2_batch(
     hops: int = 2,
     max_ctx_triples: int = 80,
     sleep_s: float = 0.05,
+    export_causal_graph: bool = False,
+    workers: int = 1,
+    mode: str = "replay",
+    engine: str = "sync",
+    concurrency: int = 4,
+    fsync: bool = False,
+    resume: Optional[str] = None,
+    results_db: Optional[str] = None,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    n_samples: int = 1,
+    structured_output: bool = False,
+    adaptive_concurrency: bool = False,
 ) -> str:
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     scenario_id = getattr(cfg, "scenario_id", None) or "medicine_lost"
-    base_dir = os.path.join(out_dir, "c2", scenario_id)
+    ts, base_dir, out_path, meta_path = _batch_paths(os.path.join(out_dir, "c2", scenario_id), resume)
     os.makedirs(base_dir, exist_ok=True)
-    out_path = os.path.join(base_dir, f"{ts}.jsonl")
 
     llm = client()
 
@@ -289,7 +1133,6 @@ def run_c2_batch(
     allowed_event_classes = vocab.event_types
     allowed_obj_props = vocab.object_properties
 
-    meta_path = os.path.join(base_dir, f"{ts}_meta.json")
     meta = {
         "scenario_id": scenario_id,
         "n_runs": n_runs,
@@ -301,87 +1144,45 @@ def run_c2_batch(
         "base_url": getattr(llm, "base_url", None),
         "started_at": datetime.now().isoformat(),
         "config": "C2",
+        "workers": workers,
+        "mode": mode,
+        "engine": engine,
+        "n_samples": n_samples,
+        "context_window": context_window,
+        "prompt_layout": prompt_layout,
+        "structured_output": structured_output,
     }
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-
-    def append(record: Dict[str, Any]) -> None:
-        with open(out_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-    for run_id in range(1, n_runs + 1):
-        wrote_any = False
-
-        def on_unexplained(payload: Dict[str, Any]) -> None:
-            nonlocal wrote_any
-            step = payload["step"]
-            step_index = payload["step_index"]
-            errors = payload["errors"]
-
-            rt = payload.get("runtime", None) or payload.get("rt", None)
-            known_entities = extract_known_entities_from_runtime(rt) if rt is not None else set()
-
-            for r in getattr(step, "retracts", []) or []:
-                record: Dict[str, Any] = {
-                    "run_id": run_id,
-                    "config": "C2",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": step_index,
-                    "failed_step_name": step.name,
-                    "errors": errors,
-                    "observed_retract": list(r),
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "hops": hops,
-                    "max_ctx_triples": max_ctx_triples,
-                }
-
-                res = generate_hypotheses_c2(
-                    llm=llm,
-                    observed_retract=r,
-                    step_name=step.name,
-                    allowed_entities=known_entities,
-                    allowed_event_classes=allowed_event_classes,
-                    allowed_obj_props=allowed_obj_props,
-                    runtime=rt,
-                    hops=hops,
-                    max_ctx_triples=max_ctx_triples,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-                record.update(res)
-                append(record)
-                wrote_any = True
-
-        run_experiment(cfg, on_unexplained=on_unexplained)
-        print(f"[C2] run {run_id}/{n_runs} finished")
-
-        if not wrote_any:
-            append(
-                {
-                    "run_id": run_id,
-                    "config": "C2",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": None,
-                    "failed_step_name": None,
-                    "errors": [],
-                    "observed_retract": None,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "ok_schema": False,
-                    "schema_error_type": "no_unexplained_trigger",
-                    "schema_error_msg": "No unexplained retracts were detected.",
-                    "candidates": None,
-                    "vocab": None,
-                    "latency_s": None,
-                    "usage": {},
-                    "raw_text": "",
-                    "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": 0},
-                }
-            )
-
-        if sleep_s:
-            time.sleep(sleep_s)
+    meta, run_ids = _start_meta(meta_path, meta, out_path, n_runs, resume)
+
+    with JsonlSink(out_path, fsync=fsync) as sink:
+        timings = _TimingTally(sink.append)
+        stats = _execute_runs(
+            "C2", cfg, n_runs, llm,
+            params={
+                "allowed_event_classes": allowed_event_classes,
+                "allowed_obj_props": allowed_obj_props,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "hops": hops,
+                "max_ctx_triples": max_ctx_triples,
+                "context_window": context_window,
+                "prompt_layout": prompt_layout,
+                "structured_output": structured_output,
+            },
+            append=timings,
+            sleep_s=sleep_s,
+            workers=workers,
+            mode=mode,
+            engine=engine,
+            concurrency=concurrency,
+            graph_path_fn=(lambda run_id: _causal_graph_path(base_dir, ts, run_id)) if export_causal_graph else None,
+            run_ids=run_ids,
+            n_samples=n_samples,
+            adaptive_concurrency=adaptive_concurrency,
+        )
+    _finalize_meta(meta_path, meta, out_path, throughput=stats, sink=sink.stats(), timings=timings.summary(),
+                   **_llm_meta(llm))
+    _mirror_to_store(results_db, out_path)
 
     return out_path
 
@@ -396,19 +1197,29 @@ def run_c3_batch(
     max_ctx_triples: int = 80,
     max_eventtype_items: int = 250,
     sleep_s: float = 0.05,
+    export_causal_graph: bool = False,
+    workers: int = 1,
+    mode: str = "replay",
+    engine: str = "sync",
+    concurrency: int = 4,
+    fsync: bool = False,
+    resume: Optional[str] = None,
+    results_db: Optional[str] = None,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    n_samples: int = 1,
+    structured_output: bool = False,
+    adaptive_concurrency: bool = False,
 ) -> str:
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     scenario_id = getattr(cfg, "scenario_id", None) or "medicine_lost"
-    base_dir = os.path.join(out_dir, "c3", scenario_id)
+    ts, base_dir, out_path, meta_path = _batch_paths(os.path.join(out_dir, "c3", scenario_id), resume)
     os.makedirs(base_dir, exist_ok=True)
-    out_path = os.path.join(base_dir, f"{ts}.jsonl")
 
     llm = client()
 
     vocab = extract_tbox_vocab(cfg.ontology_path)
     allowed_obj_props = vocab.object_properties
 
-    meta_path = os.path.join(base_dir, f"{ts}_meta.json")
     meta = {
         "scenario_id": scenario_id,
         "n_runs": n_runs,
@@ -422,89 +1233,46 @@ def run_c3_batch(
         "started_at": datetime.now().isoformat(),
         "config": "C3",
         "extra_ontology_paths": getattr(cfg, "extra_ontology_paths", []),
+        "workers": workers,
+        "mode": mode,
+        "engine": engine,
+        "n_samples": n_samples,
+        "context_window": context_window,
+        "prompt_layout": prompt_layout,
+        "structured_output": structured_output,
     }
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-
-    def append(record: Dict[str, Any]) -> None:
-        with open(out_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-    for run_id in range(1, n_runs + 1):
-        wrote_any = False
-
-        def on_unexplained(payload: Dict[str, Any]) -> None:
-            nonlocal wrote_any
-            step = payload["step"]
-            step_index = payload["step_index"]
-            errors = payload["errors"]
-
-            rt = payload.get("runtime", None) or payload.get("rt", None)
-            known_entities = extract_known_entities_from_runtime(rt) if rt is not None else set()
-
-            for r in getattr(step, "retracts", []) or []:
-                record: Dict[str, Any] = {
-                    "run_id": run_id,
-                    "config": "C3",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": step_index,
-                    "failed_step_name": step.name,
-                    "errors": errors,
-                    "observed_retract": list(r),
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "hops": hops,
-                    "max_ctx_triples": max_ctx_triples,
-                    "max_eventtype_items": max_eventtype_items,
-                    "extra_ontology_paths": getattr(cfg, "extra_ontology_paths", []),
-                }
-
-                res = generate_hypotheses_c3(
-                    llm=llm,
-                    observed_retract=r,
-                    step_name=step.name,
-                    allowed_entities=known_entities,
-                    allowed_obj_props=allowed_obj_props,
-                    runtime=rt,
-                    hops=hops,
-                    max_ctx_triples=max_ctx_triples,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    max_eventtype_items=max_eventtype_items,
-                )
-                record.update(res)
-                append(record)
-                wrote_any = True
-
-        run_experiment(cfg, on_unexplained=on_unexplained)
-        print(f"[C3] run {run_id}/{n_runs} finished")
-
-        if not wrote_any:
-            append(
-                {
-                    "run_id": run_id,
-                    "config": "C3",
-                    "timestamp": datetime.now().isoformat(),
-                    "failed_step_index": None,
-                    "failed_step_name": None,
-                    "errors": [],
-                    "observed_retract": None,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "ok_schema": False,
-                    "schema_error_type": "no_unexplained_trigger",
-                    "schema_error_msg": "No unexplained retracts were detected.",
-                    "candidates": None,
-                    "vocab": None,
-                    "latency_s": None,
-                    "usage": {},
-                    "raw_text": "",
-                    "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": 0},
-                    "catalog": {"n_types": 0, "max_items": max_eventtype_items},
-                }
-            )
-
-        if sleep_s:
-            time.sleep(sleep_s)
+    meta, run_ids = _start_meta(meta_path, meta, out_path, n_runs, resume)
+
+    with JsonlSink(out_path, fsync=fsync) as sink:
+        timings = _TimingTally(sink.append)
+        repairs = _RepairTally(timings)
+        stats = _execute_runs(
+            "C3", cfg, n_runs, llm,
+            params={
+                "allowed_obj_props": allowed_obj_props,
+                "extra_ontology_paths": getattr(cfg, "extra_ontology_paths", []),
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "hops": hops,
+                "max_ctx_triples": max_ctx_triples,
+                "max_eventtype_items": max_eventtype_items,
+                "context_window": context_window,
+                "prompt_layout": prompt_layout,
+                "structured_output": structured_output,
+            },
+            append=repairs,
+            sleep_s=sleep_s,
+            workers=workers,
+            mode=mode,
+            engine=engine,
+            concurrency=concurrency,
+            graph_path_fn=(lambda run_id: _causal_graph_path(base_dir, ts, run_id)) if export_causal_graph else None,
+            run_ids=run_ids,
+            n_samples=n_samples,
+            adaptive_concurrency=adaptive_concurrency,
+        )
+    _finalize_meta(meta_path, meta, out_path, throughput=stats, sink=sink.stats(), repairs=repairs.summary(),
+                   timings=timings.summary(), **_llm_meta(llm))
+    _mirror_to_store(results_db, out_path)
 
     return out_path
@@ -0,0 +1,323 @@
+# /src/experiments/sweep.py
+import asyncio
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llm.client import client
+from validator.runtime import ExperimentConfig
+from utils.tbox_vocab import extract_tbox_vocab
+from experiments.runner import (
+    _CONFIGS, _OrderedWriter, _TimingTally, _capture_trigger, _symbolic_executor, _execute_runs, _finalize_meta, _llm_meta,
+    _run_jobs,
+)
+from experiments.result_sink import JsonlSink
+
+DEFAULT_PARAMS: Dict[str, Dict[str, Any]] = {
+    "C0": {"temperature": 0.3, "max_tokens": 600},
+    "C1": {"temperature": 0.3, "max_tokens": 700},
+    "C2": {"temperature": 0.3, "max_tokens": 850, "hops": 2, "max_ctx_triples": 80},
+    "C3": {"temperature": 0.3, "max_tokens": 850, "hops": 2, "max_ctx_triples": 80,
+           "max_eventtype_items": 250},
+}
+
+
+def _ontology_set_key(cfg: ExperimentConfig) -> Tuple[str, Tuple[str, ...], bool]:
+    return (
+        cfg.ontology_path,
+        tuple(getattr(cfg, "extra_ontology_paths", []) or []),
+        bool(getattr(cfg, "enable_reasoner", True)),
+    )
+
+
+def config_params(label: str, cfg: ExperimentConfig, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Parámetros completos de una configuración (incluido el vocabulario TBox compartido)."""
+    params = dict(DEFAULT_PARAMS[label])
+    params.update(overrides or {})
+
+    if label == "C0":
+        return params
+
+    vocab = extract_tbox_vocab(cfg.ontology_path)
+    if label == "C1":
+        params["allowed_event_types"] = vocab.event_types
+        params["allowed_obj_props"] = vocab.object_properties
+    elif label == "C2":
+        params["allowed_event_classes"] = vocab.event_types
+        params["allowed_obj_props"] = vocab.object_properties
+    elif label == "C3":
+        params["allowed_obj_props"] = vocab.object_properties
+        params["extra_ontology_paths"] = list(getattr(cfg, "extra_ontology_paths", []) or [])
+    return params
+
+
+def _meta_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in params.items() if not k.startswith("allowed_")}
+
+
+def run_sweep(
+    cfg: ExperimentConfig,
+    out_dir: str,
+    n_runs: int,
+    configs: Sequence[str] = ("C0", "C1", "C2", "C3"),
+    cfg_by_config: Optional[Dict[str, ExperimentConfig]] = None,
+    params_by_config: Optional[Dict[str, Dict[str, Any]]] = None,
+    engine: str = "sync",
+    concurrency: int = 4,
+    fsync: bool = False,
+    n_samples: int = 1,
+    adaptive_concurrency: bool = False,
+) -> Dict[str, str]:
+    """
+    Compara varias configuraciones sobre el mismo escenario con una sola pasada
+    simbólica por conjunto de ontologías: el escenario se ejecuta una vez, y el
+    vocabulario, las entidades conocidas, los catálogos y los subgrafos recuperados
+    se comparten entre las configuraciones que usan ese mismo estado.
+    Cada configuración escribe su .jsonl/_meta.json en la ruta habitual
+    results/<cX>/<scenario_id>/ con el mismo sweep_id. Con n_samples > 1 las
+    runs se piden de n_samples en n_samples como choices de una misma petición.
+    Con adaptive_concurrency (engine="async") `concurrency` es el máximo y el
+    nivel se ajusta por configuración (ver _execute_runs).
+    """
+    cfg_by_config = cfg_by_config or {}
+    params_by_config = params_by_config or {}
+    unknown = [c for c in configs if c not in DEFAULT_PARAMS]
+    if unknown:
+        raise ValueError(f"Unknown configs: {unknown}")
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    scenario_id = getattr(cfg, "scenario_id", None) or "medicine_lost"
+    llm = client()
+
+    # agrupar configuraciones por conjunto de ontologías
+    groups: Dict[Tuple[str, Tuple[str, ...], bool], Tuple[ExperimentConfig, List[str]]] = {}
+    for label in configs:
+        ccfg = cfg_by_config.get(label, cfg)
+        key = _ontology_set_key(ccfg)
+        if key not in groups:
+            groups[key] = (ccfg, [])
+        groups[key][1].append(label)
+
+    outputs: Dict[str, str] = {}
+    index: Dict[str, Any] = {
+        "sweep_id": ts,
+        "scenario_id": scenario_id,
+        "n_runs": n_runs,
+        "started_at": datetime.now().isoformat(),
+        "groups": [],
+    }
+
+    # los grupos se procesan de uno en uno: el world de owlready es compartido y
+    # la pasada del grupo siguiente modificaría el estado congelado del anterior
+    for key, (gcfg, labels) in groups.items():
+        payload = _capture_trigger(gcfg)
+        group_info: Dict[str, Any] = {
+            "ontology_path": key[0],
+            "extra_ontology_paths": list(key[1]),
+            "enable_reasoner": key[2],
+            "configs": labels,
+            "triggered": payload is not None,
+        }
+
+        for label in labels:
+            params = config_params(label, gcfg, params_by_config.get(label))
+            base_dir = os.path.join(out_dir, label.lower(), scenario_id)
+            os.makedirs(base_dir, exist_ok=True)
+            out_path = os.path.join(base_dir, f"{ts}.jsonl")
+            meta_path = os.path.join(base_dir, f"{ts}_meta.json")
+
+            meta = {
+                "scenario_id": scenario_id,
+                "n_runs": n_runs,
+                **_meta_params(params),
+                "model": getattr(llm, "model", None),
+                "base_url": getattr(llm, "base_url", None),
+                "started_at": datetime.now().isoformat(),
+                "config": label,
+                "mode": "snapshot",
+                "engine": engine,
+                "n_samples": n_samples,
+                "sweep_id": ts,
+            }
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+
+            with JsonlSink(out_path, fsync=fsync) as sink:
+                timings = _TimingTally(sink.append)
+                stats = _execute_runs(
+                    label, gcfg, n_runs, llm,
+                    params=params,
+                    append=timings,
+                    mode="snapshot",
+                    engine=engine,
+                    concurrency=concurrency,
+                    payload_fn=lambda: payload,
+                    n_samples=n_samples,
+                    adaptive_concurrency=adaptive_concurrency,
+                )
+            _finalize_meta(meta_path, meta, throughput=stats, sink=sink.stats(), timings=timings.summary(),
+                           **_llm_meta(llm))
+            outputs[label] = out_path
+
+        if payload is not None:
+            group_info["symbolic_cache"] = payload["symbolic_cache"].stats()
+        index["groups"].append(group_info)
+
+    index["outputs"] = outputs
+    index["finished_at"] = datetime.now().isoformat()
+    sweep_dir = os.path.join(out_dir, "sweeps", scenario_id)
+    os.makedirs(sweep_dir, exist_ok=True)
+    with open(os.path.join(sweep_dir, f"{ts}.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    return outputs
+
+
+def expand_grid(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Producto cartesiano de la rejilla, en el orden en que se dan las claves."""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(list(grid[k]) for k in keys))]
+
+
+def run_grid(
+    cfg: ExperimentConfig,
+    out_dir: str,
+    n_runs: int,
+    grid: Dict[str, Sequence[Any]],
+    config: str = "C3",
+    base_params: Optional[Dict[str, Any]] = None,
+    concurrency: int = 8,
+    fsync: bool = False,
+) -> str:
+    """
+    Explora una rejilla de parámetros (temperature, max_tokens, hops,
+    max_ctx_triples, max_eventtype_items) de una configuración.
+    - El escenario se ejecuta una vez y todos los puntos parten del mismo snapshot.
+    - El trabajo simbólico se comparte entre puntos: triples ABox, catálogos y la
+      recuperación por (semillas, hops); un max_ctx_triples menor reutiliza el
+      prefijo del subgrafo ya recuperado con uno mayor.
+    - Las muestras de todos los puntos se generan a la vez con un presupuesto
+      global de `concurrency` llamadas LLM en vuelo.
+    Se escribe un único .jsonl en results/grid/<cX>/<scenario_id>/ con el índice
+    del punto (`grid_point`) en cada registro; el _meta.json lista los puntos.
+    """
+    if config not in DEFAULT_PARAMS:
+        raise ValueError(f"Unknown config: {config}")
+    unknown = [k for k in grid if k not in DEFAULT_PARAMS[config]]
+    if unknown:
+        raise ValueError(f"Parameters not used by {config}: {unknown}")
+
+    points = expand_grid(grid)
+    if not points:
+        raise ValueError("Empty parameter grid")
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    scenario_id = getattr(cfg, "scenario_id", None) or "medicine_lost"
+    base_dir = os.path.join(out_dir, "grid", config.lower(), scenario_id)
+    os.makedirs(base_dir, exist_ok=True)
+    out_path = os.path.join(base_dir, f"{ts}.jsonl")
+    meta_path = os.path.join(base_dir, f"{ts}_meta.json")
+
+    llm = client()
+    point_params = [config_params(config, cfg, {**(base_params or {}), **pt}) for pt in points]
+
+    meta: Dict[str, Any] = {
+        "scenario_id": scenario_id,
+        "config": config,
+        "n_runs": n_runs,
+        "grid": {k: list(v) for k, v in grid.items()},
+        "points": [{"grid_point": i, **_meta_params(p)} for i, p in enumerate(point_params)],
+        "model": getattr(llm, "model", None),
+        "base_url": getattr(llm, "base_url", None),
+        "started_at": datetime.now().isoformat(),
+        "mode": "snapshot",
+        "concurrency": concurrency,
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    payload = _capture_trigger(cfg)
+
+    t0 = time.time()
+    with JsonlSink(out_path, fsync=fsync) as sink:
+        timings = _TimingTally(sink.append)
+        per_point = asyncio.run(_run_grid_async(config, payload, point_params, n_runs, llm,
+                                                timings, max(1, concurrency)))
+    elapsed = time.time() - t0
+
+    for entry, pstats in zip(meta["points"], per_point):
+        entry.update(pstats)
+    total = len(points) * n_runs
+    _finalize_meta(
+        meta_path, meta,
+        throughput={
+            "engine": "async",
+            "mode": "snapshot",
+            "concurrency": concurrency,
+            "elapsed_s": elapsed,
+            "runs": total,
+            "throughput_runs_per_min": (60.0 * total / elapsed) if elapsed > 0 else None,
+        },
+        symbolic_cache=payload["symbolic_cache"].stats() if payload is not None else None,
+        sink=sink.stats(),
+        timings=timings.summary(),
+        **_llm_meta(llm),
+    )
+    return out_path
+
+
+async def _run_grid_async(label: str, payload: Optional[Dict[str, Any]], point_params: List[Dict[str, Any]],
+                          n_runs: int, llm: client, append: Callable[[Dict[str, Any]], None],
+                          concurrency: int) -> List[Dict[str, Any]]:
+    spec = _CONFIGS[label]
+    sem = asyncio.Semaphore(concurrency)
+    # orden de salida: por run_id, y dentro de cada run por punto de la rejilla
+    writer = _OrderedWriter(append, list(range(len(point_params) * n_runs)))
+    per_point: List[Dict[str, Any]] = [{"records": 0, "llm_s": 0.0} for _ in point_params]
+
+    def tag(i: int, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for rec in records:
+            rec["grid_point"] = i
+        per_point[i]["records"] += len(records)
+        return records
+
+    async def generate(i: int, seq: int, jobs: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        t0 = time.time()
+        try:
+            records: List[Dict[str, Any]] = []
+            for record, prepared in jobs:
+                record.update(await spec.acomplete(llm, prepared))
+                records.append(record)
+        finally:
+            sem.release()
+        per_point[i]["llm_s"] += time.time() - t0
+        writer.put(seq, tag(i, records))
+
+    # los puntos con más contexto primero: sus subgrafos sirven de prefijo a los demás
+    order = sorted(range(len(point_params)), key=lambda i: -point_params[i].get("max_ctx_triples", 0))
+
+    # retrieval y prompts en el hilo simbólico (ver _symbolic_executor)
+    loop = asyncio.get_running_loop()
+    executor = _symbolic_executor()
+    tasks = []
+    try:
+        for run_id in range(1, n_runs + 1):
+            for i in order:
+                params = point_params[i]
+                seq = (run_id - 1) * len(point_params) + i
+                jobs = await loop.run_in_executor(executor, _run_jobs, label, run_id, payload, params)
+                if not jobs:
+                    writer.put(seq, tag(i, [spec.no_trigger(run_id, **params)]))
+                    continue
+
+                await sem.acquire()
+                tasks.append(asyncio.create_task(generate(i, seq, jobs)))
+            print(f"[{label}] grid sample {run_id}/{n_runs} scheduled for {len(point_params)} points")
+
+        await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown(wait=True)
+    return per_point
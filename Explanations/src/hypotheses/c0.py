@@ -1,8 +1,11 @@
 # /src/hypotheses/c0.py
-import json
 from typing import Any, Dict, List, Tuple
 
-from llm.client import client
+from llm.client import client, LLMResult, llm_extras
+from llm.json_recovery import loads_tolerant, salvaged_items
+from llm.structured import c0_schema, response_format
+from utils.prompt_budget import prompt_stats
+from utils.stage_timer import StageTimer, timer_for, timings_record
 
 Triple = Tuple[str, str, str]
 
@@ -92,9 +95,7 @@ def try_parse_candidates(raw_text: str) -> Dict[str, Any]:
     txt = _strip_code_fences(raw_text)
 
     try:
-        data = json.loads(txt)
-        ok_json = True
-        json_error = None
+        data, recovered = loads_tolerant(txt)
     except Exception as e:
         return {
             "ok_json": False,
@@ -102,6 +103,7 @@ def try_parse_candidates(raw_text: str) -> Dict[str, Any]:
             "error_type": "json_parse",
             "error_msg": str(e),
             "candidates": None,
+            "json_recovery": None,
         }
 
     try:
@@ -112,6 +114,7 @@ def try_parse_candidates(raw_text: str) -> Dict[str, Any]:
             "error_type": None,
             "error_msg": None,
             "candidates": candidates,
+            "json_recovery": recovered,
         }
     except Exception as e:
         return {
@@ -120,6 +123,8 @@ def try_parse_candidates(raw_text: str) -> Dict[str, Any]:
             "error_type": "schema_validation",
             "error_msg": str(e),
             "candidates": None,
+            "json_recovery": recovered,
+            "salvaged_candidates": salvaged_items(data, recovered),
         }
 
 def _content_checks(candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -130,26 +135,42 @@ def _content_checks(candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
         "event_type_bad_like_property_count": bad_like_property,
     }
 
-def generate_hypotheses_c0(
-    llm: client,
+def prepare_c0(
     observed_retract: Triple,
     step_name: str,
     temperature: float = 0.3,
     max_tokens: int = 600,
+    structured_output: bool = False,
 ) -> Dict[str, Any]:
-    prompt = build_prompt(observed_retract, step_name)
-
-    res = llm.chat(
-        messages=[
-            {"role": "system", "content": SYSTEM},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+    timer = StageTimer()
+    with timer.stage("build_prompt"):
+        prompt = build_prompt(observed_retract, step_name)
+    messages = [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": prompt},
+    ]
+    request = {
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if structured_output:
+        with timer.stage("response_format"):
+            request["response_format"] = response_format(c0_schema())
+    with timer.stage("prompt_stats"):
+        stats = prompt_stats(messages)
+    return {
+        "request": request,
+        "prompt_stats": stats,
+        "timings": timer.stages,
+    }
 
+def finish_c0(prepared: Dict[str, Any], res: LLMResult) -> Dict[str, Any]:
     raw = res.text
-    parsed = try_parse_candidates(raw)
+    timer = timer_for(prepared)
+    timer.add("llm_call", res.latency_s)
+    with timer.stage("json_parse"):
+        parsed = try_parse_candidates(raw)
 
     out = {
         "ok_json": parsed["ok_json"],
@@ -157,14 +178,46 @@ def generate_hypotheses_c0(
         "schema_error_type": parsed["error_type"],
         "schema_error_msg": parsed["error_msg"],
         "candidates": parsed["candidates"],
+        "json_recovery": parsed["json_recovery"],
         "latency_s": res.latency_s,
         "usage": res.usage,
+        **llm_extras(res),
         "raw_text": raw,
     }
 
+    if "salvaged_candidates" in parsed:
+        out["salvaged_candidates"] = parsed["salvaged_candidates"]
+
     if parsed["ok_schema"] and parsed["candidates"] is not None:
-        out["content_checks"] = _content_checks(parsed["candidates"])
+        with timer.stage("content_checks"):
+            out["content_checks"] = _content_checks(parsed["candidates"])
     else:
         out["content_checks"] = None
 
-    return out
\ No newline at end of file
+    out["timings"] = timings_record(prepared, timer)
+    return out
+
+def complete_c0(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return finish_c0(prepared, llm.chat(**prepared["request"]))
+
+async def acomplete_c0(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return finish_c0(prepared, await llm.achat(**prepared["request"]))
+
+def complete_c0_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    """n muestras del mismo prompt (una petición con n choices, o n peticiones si el servidor no admite n)."""
+    return [finish_c0(prepared, res) for res in llm.chat_n(n=n, **prepared["request"])]
+
+async def acomplete_c0_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    return [finish_c0(prepared, res) for res in await llm.achat_n(n=n, **prepared["request"])]
+
+def generate_hypotheses_c0(
+    llm: client,
+    observed_retract: Triple,
+    step_name: str,
+    temperature: float = 0.3,
+    max_tokens: int = 600,
+    structured_output: bool = False,
+) -> Dict[str, Any]:
+    prepared = prepare_c0(observed_retract, step_name, temperature=temperature, max_tokens=max_tokens,
+                          structured_output=structured_output)
+    return complete_c0(llm, prepared)
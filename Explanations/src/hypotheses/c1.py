@@ -1,9 +1,12 @@
 # /src/hypotheses/c1.py
-import json
 from typing import Any, Dict, List, Tuple, Optional
 from owlready2 import get_ontology
 
-from llm.client import client
+from llm.client import client, LLMResult, llm_extras
+from llm.json_recovery import loads_tolerant, salvaged_items
+from llm.structured import hypotheses_schema, hypothesis_schema, response_format
+from utils.prompt_budget import fit_prompt, input_budget, prompt_stats
+from utils.stage_timer import StageTimer, timer_for, timings_record
 
 Triple = Tuple[str, str, str]
 
@@ -25,19 +28,25 @@ def build_prompt(
     allowed_entities: List[str],
     allowed_event_types: List[str],
     allowed_obj_props: List[str],
+    *,
+    max_entities: int = 80,
+    max_event_types: int = 120,
+    max_props: int = 80,
+    layout: str = "default",
 ) -> str:
+    if layout not in ("default", "prefix"):
+        raise ValueError(f"Unknown layout: {layout}")
     s, p, o = observed_retract
 
-    ents = sorted(set(allowed_entities))[:80]
-    evts = sorted(set(allowed_event_types))[:120]
-    props = sorted(set(allowed_obj_props))[:80]
+    ents = sorted(set(allowed_entities))[:max_entities]
+    evts = sorted(set(allowed_event_types))[:max_event_types]
+    props = sorted(set(allowed_obj_props))[:max_props]
 
-    return f"""{ROBOT_CONTEXT}
-
-Observed change (retract) at step '{step_name}':
+    observed = f"""Observed change (retract) at step '{step_name}':
 - retracted triple: ({s}, {p}, {o})
+"""
 
-Allowed entities (ABox individuals from the current scenario; MUST be used verbatim for participants and where):
+    vocab = f"""Allowed entities (ABox individuals from the current scenario; MUST be used verbatim for participants and where):
 {chr(10).join("- " + e for e in ents)}
 
 Allowed event classes (MUST choose one of these verbatim):
@@ -45,8 +54,9 @@ Allowed event classes (MUST choose one of these verbatim):
 
 Allowed object properties (do NOT invent; use only these in proposed_triples):
 {chr(10).join("- " + pr for pr in props)}
+"""
 
-Task:
+    instructions = f"""Task:
 Propose EXACTLY 3 alternative causal hypotheses that could explain the retract.
 
 Return ONLY valid JSON with exactly 3 objects using this schema:
@@ -79,6 +89,11 @@ Rules (STRICT):
 - Keep proposed_triples minimal (2-4 triples). Prefer hasParticipant and hasLocation when applicable.
 """
 
+    if layout == "prefix":
+        # lo invariante entre runs forma un prefijo idéntico (reutilizable por la KV-cache del servidor)
+        return f"{ROBOT_CONTEXT}\n{vocab}\n{instructions}\n{observed}"
+    return f"{ROBOT_CONTEXT}\n\n{observed}\n{vocab}\n{instructions}"
+
 def _strip_code_fences(txt: str) -> str:
     t = txt.strip()
     if t.startswith("```"):
@@ -185,8 +200,7 @@ def compute_vocab_flags(
     )
     return out
 
-def generate_hypotheses_c1(
-    llm: client,
+def prepare_c1(
     observed_retract: Triple,
     step_name: str,
     allowed_entities: set,
@@ -194,71 +208,170 @@ def generate_hypotheses_c1(
     allowed_obj_props: List[str],
     temperature: float = 0.3,
     max_tokens: int = 750,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    structured_output: bool = False,
 ) -> Dict[str, Any]:
-    prompt = build_prompt(
-        observed_retract,
-        step_name,
-        allowed_entities=list(allowed_entities),
-        allowed_event_types=allowed_event_types,
-        allowed_obj_props=allowed_obj_props,
-    )
+    def render(limits: Dict[str, int]) -> List[Dict[str, str]]:
+        prompt = build_prompt(
+            observed_retract,
+            step_name,
+            allowed_entities=list(allowed_entities),
+            allowed_event_types=allowed_event_types,
+            allowed_obj_props=allowed_obj_props,
+            max_entities=limits["entities"],
+            max_event_types=limits["event_classes"],
+            max_props=limits["object_properties"],
+            layout=prompt_layout,
+        )
+        return [{"role": "system", "content": SYSTEM},
+                {"role": "user", "content": prompt}]
+
+    limits = {
+        "entities": min(len(set(allowed_entities)), 80),
+        "event_classes": min(len(set(allowed_event_types)), 120),
+        "object_properties": min(len(set(allowed_obj_props)), 80),
+    }
+    fitted = None
+    timer = StageTimer()
+    with timer.stage("build_prompt"):
+        if context_window is None:
+            messages = render(limits)
+        else:
+            # se recorta primero lo menos prioritario: clases, propiedades y por último entidades
+            messages, limits, fitted = fit_prompt(
+                render, limits, ("event_classes", "object_properties", "entities"),
+                input_budget(context_window, max_tokens),
+                min_items={"event_classes": 10, "object_properties": 5, "entities": 10},
+            )
+
+    request = {
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if structured_output:
+        with timer.stage("response_format"):
+            # mismo rango de triples (2..6) que valida _validate_schema
+            item = hypothesis_schema(allowed_event_types, allowed_entities, allowed_obj_props, min_triples=2, max_triples=6)
+            request["response_format"] = response_format(hypotheses_schema(item))
+    with timer.stage("prompt_stats"):
+        stats = prompt_stats(messages, context_window, max_tokens, limits, fitted)
 
-    res = llm.chat(
-        messages=[{"role": "system", "content": SYSTEM},
-                  {"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+    return {
+        "request": request,
+        "prompt_stats": stats,
+        "timings": timer.stages,
+        "allowed_entities": set(allowed_entities),
+        "allowed_event_classes": set(allowed_event_types),
+        "allowed_obj_props": set(allowed_obj_props),
+    }
 
+def finish_c1(prepared: Dict[str, Any], res: LLMResult) -> Dict[str, Any]:
     raw = res.text
     txt = _strip_code_fences(raw)
+    timer = timer_for(prepared)
+    timer.add("llm_call", res.latency_s)
 
     try:
-        data = json.loads(txt)
+        with timer.stage("json_parse"):
+            data, recovered = loads_tolerant(txt)
     except Exception as e:
         return {
             "ok_schema": False,
             "schema_error_type": "json_parse",
             "schema_error_msg": str(e),
             "candidates": None,
+            "json_recovery": None,
             "latency_s": res.latency_s,
             "usage": res.usage,
+            **llm_extras(res),
             "raw_text": raw,
             "vocab": None,
+            "timings": timings_record(prepared, timer),
         }
 
     try:
-        candidates = _validate_schema(data)
+        with timer.stage("json_parse"):
+            candidates = _validate_schema(data)
     except Exception as e:
         return {
             "ok_schema": False,
             "schema_error_type": "schema_validation",
             "schema_error_msg": str(e),
             "candidates": None,
+            "json_recovery": recovered,
+            "salvaged_candidates": salvaged_items(data, recovered),
             "latency_s": res.latency_s,
             "usage": res.usage,
+            **llm_extras(res),
             "raw_text": raw,
             "vocab": None,
+            "timings": timings_record(prepared, timer),
         }
 
-    vocab = compute_vocab_flags(
-        candidates,
-        allowed_entities=set(allowed_entities),
-        allowed_event_classes=set(allowed_event_types),
-        allowed_obj_props=set(allowed_obj_props),
-    )
+    with timer.stage("compute_vocab_flags"):
+        vocab = compute_vocab_flags(
+            candidates,
+            allowed_entities=prepared["allowed_entities"],
+            allowed_event_classes=prepared["allowed_event_classes"],
+            allowed_obj_props=prepared["allowed_obj_props"],
+        )
 
     return {
         "ok_schema": True,
         "schema_error_type": None,
         "schema_error_msg": None,
         "candidates": candidates,
+        "json_recovery": recovered,
         "latency_s": res.latency_s,
         "usage": res.usage,
+        **llm_extras(res),
         "raw_text": raw,
         "vocab": vocab,
+        "timings": timings_record(prepared, timer),
     }
 
+def complete_c1(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return finish_c1(prepared, llm.chat(**prepared["request"]))
+
+async def acomplete_c1(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return finish_c1(prepared, await llm.achat(**prepared["request"]))
+
+def complete_c1_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    """n muestras del mismo prompt (una petición con n choices, o n peticiones si el servidor no admite n)."""
+    return [finish_c1(prepared, res) for res in llm.chat_n(n=n, **prepared["request"])]
+
+async def acomplete_c1_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    return [finish_c1(prepared, res) for res in await llm.achat_n(n=n, **prepared["request"])]
+
+def generate_hypotheses_c1(
+    llm: client,
+    observed_retract: Triple,
+    step_name: str,
+    allowed_entities: set,
+    allowed_event_types: List[str],
+    allowed_obj_props: List[str],
+    temperature: float = 0.3,
+    max_tokens: int = 750,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    structured_output: bool = False,
+) -> Dict[str, Any]:
+    prepared = prepare_c1(
+        observed_retract,
+        step_name,
+        allowed_entities=allowed_entities,
+        allowed_event_types=allowed_event_types,
+        allowed_obj_props=allowed_obj_props,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        context_window=context_window,
+        prompt_layout=prompt_layout,
+        structured_output=structured_output,
+    )
+    return complete_c1(llm, prepared)
+
 def extract_allowed_event_types(ontology_path: str, roots: Optional[List[str]] = None) -> List[str]:
     roots = roots or ["SOMA.Event"]
     onto = get_ontology("file://" + ontology_path if not ontology_path.startswith("file://") else ontology_path).load()
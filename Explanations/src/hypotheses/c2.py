@@ -1,8 +1,12 @@
 # /src/hypotheses/c2.py
-import json
 from typing import Any, Dict, List, Tuple, Optional, Set
 
-from llm.client import client
+from llm.client import client, LLMResult, llm_extras
+from llm.json_recovery import loads_tolerant, salvaged_items
+from llm.structured import hypotheses_schema, hypothesis_schema, response_format
+from utils.prompt_budget import fit_prompt, input_budget, prompt_stats
+from utils.stage_timer import StageTimer, timer_for, timings_record
+from utils.symbolic_cache import SymbolicCache, cached, cached_prefix
 
 Triple = Tuple[str, str, str]
 
@@ -162,13 +166,21 @@ def build_prompt(
     allowed_event_classes: List[str],
     allowed_obj_props: List[str],
     context_triples: List[Triple],
+    *,
+    max_entities: int = 80,
+    max_event_types: int = 120,
+    max_props: int = 80,
+    max_ctx: int = 90,
+    layout: str = "default",
 ) -> str:
+    if layout not in ("default", "prefix"):
+        raise ValueError(f"Unknown layout: {layout}")
     s, p, o = observed_retract
 
-    ents = sorted(set(allowed_entities))[:80]
-    evts = sorted(set(allowed_event_classes))[:120]
-    props = sorted(set(allowed_obj_props))[:80]
-    ctx = context_triples[:90]
+    ents = sorted(set(allowed_entities))[:max_entities]
+    evts = sorted(set(allowed_event_classes))[:max_event_types]
+    props = sorted(set(allowed_obj_props))[:max_props]
+    ctx = context_triples[:max_ctx]
 
     ctx_block = ""
     if ctx:
@@ -178,12 +190,11 @@ def build_prompt(
             + "\n"
         )
 
-    return f"""{ROBOT_CONTEXT}
-
-Observed change (retract) at step '{step_name}':
+    observed = f"""Observed change (retract) at step '{step_name}':
 - retracted triple: ({s}, {p}, {o})
-{ctx_block}
-Allowed entities (ABox individuals from the current scenario; MUST be used verbatim for participants/where and triple objects):
+"""
+
+    instructions = f"""Allowed entities (ABox individuals from the current scenario; MUST be used verbatim for participants/where and triple objects):
 {chr(10).join("- " + e for e in ents)}
 
 Allowed event classes (MUST choose one of these verbatim):
@@ -220,10 +231,19 @@ Rules (STRICT):
   - s MUST equal event_id
   - p MUST be one of Allowed object properties
   - o MUST be one of Allowed entities
-- FOCUS CONSTRAINT (PER HYPOTHESIS): For EACH hypothesis object, its proposed_triples MUST contain at least one triple whose object (o) is exactly "{s}" OR exactly "{o}". (Do NOT satisfy this by referencing an intermediate episode/id; it must be the exact entity string.)
+"""
+
+    focus = f"""- FOCUS CONSTRAINT (PER HYPOTHESIS): For EACH hypothesis object, its proposed_triples MUST contain at least one triple whose object (o) is exactly "{s}" OR exactly "{o}". (Do NOT satisfy this by referencing an intermediate episode/id; it must be the exact entity string.)
 - Avoid generic/abstract explanations (e.g., "plan failure", "collaboration issue") unless you explicitly connect them to the retract via proposed_triples that mention "{s}" or "{o}".
 """
 
+    if layout == "prefix":
+        # lo invariante entre runs forma un prefijo idéntico (reutilizable por la KV-cache del servidor);
+        # el retract, su contexto recuperado y las reglas que lo citan van al final
+        return (f"{ROBOT_CONTEXT}\n{instructions}\n{observed}{ctx_block}"
+                f"\nRetract-specific rules (STRICT):\n{focus}")
+    return f"{ROBOT_CONTEXT}\n\n{observed}{ctx_block}\n{instructions}{focus}"
+
 
 
 def _strip_code_fences(txt: str) -> str:
@@ -315,8 +335,7 @@ def compute_vocab_flags(
     }
     return out
 
-def generate_hypotheses_c2(
-    llm: client,
+def prepare_c2(
     observed_retract: Triple,
     step_name: str,
     allowed_entities: set,
@@ -327,84 +346,198 @@ def generate_hypotheses_c2(
     max_ctx_triples: int = 80,
     temperature: float = 0.3,
     max_tokens: int = 850,
+    shared: Optional[SymbolicCache] = None,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    structured_output: bool = False,
 ) -> Dict[str, Any]:
-    
+
+    # con `shared` las etapas simbólicas cacheadas cuentan solo la consulta a la caché
+    timer = StageTimer()
     ctx_triples: List[Triple] = []
     if runtime is not None:
-        all_triples = extract_triples_from_runtime(runtime)
+        with timer.stage("extract_triples"):
+            all_triples = cached(shared, ("abox_triples",), lambda: extract_triples_from_runtime(runtime))
         s_seed = _norm(observed_retract[0])
         o_seed = _norm(observed_retract[2])
-        
 
-        seeds = {x for x in (s_seed, o_seed) if x}
-        ctx_triples = retrieve_subgraph(all_triples, seeds, hops=hops, max_triples=max_ctx_triples)
 
+        seeds = {x for x in (s_seed, o_seed) if x}
+        with timer.stage("retrieve_subgraph"):
+            ctx_triples = cached_prefix(
+                shared, ("subgraph", tuple(sorted(seeds)), hops), max_ctx_triples,
+                lambda n: retrieve_subgraph(all_triples, seeds, hops=hops, max_triples=n),
+            )
+
+
+
+    def render(limits: Dict[str, int]) -> List[Dict[str, str]]:
+        prompt = build_prompt(
+            observed_retract=observed_retract,
+            step_name=step_name,
+            allowed_entities=list(allowed_entities),
+            allowed_event_classes=allowed_event_classes,
+            allowed_obj_props=allowed_obj_props,
+            context_triples=ctx_triples,
+            max_entities=limits["entities"],
+            max_event_types=limits["event_classes"],
+            max_props=limits["object_properties"],
+            max_ctx=limits["context_triples"],
+            layout=prompt_layout,
+        )
+        return [{"role": "system", "content": SYSTEM},
+                {"role": "user", "content": prompt}]
+
+    limits = {
+        "entities": min(len(set(allowed_entities)), 80),
+        "event_classes": min(len(set(allowed_event_classes)), 120),
+        "object_properties": min(len(set(allowed_obj_props)), 80),
+        "context_triples": min(len(ctx_triples), 90),
+    }
+    fitted = None
+    with timer.stage("build_prompt"):
+        if context_window is None:
+            messages = render(limits)
+        else:
+            # los triples de contexto se recortan antes que el vocabulario permitido
+            messages, limits, fitted = fit_prompt(
+                render, limits, ("context_triples", "event_classes", "object_properties", "entities"),
+                input_budget(context_window, max_tokens),
+                min_items={"context_triples": 10, "event_classes": 10, "object_properties": 5, "entities": 10},
+            )
+
+    request = {
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if structured_output:
+        with timer.stage("response_format"):
+            item = hypothesis_schema(allowed_event_classes, allowed_entities, allowed_obj_props)
+            request["response_format"] = response_format(hypotheses_schema(item))
+    with timer.stage("prompt_stats"):
+        stats = prompt_stats(messages, context_window, max_tokens, limits, fitted)
 
-    
-    prompt = build_prompt(
-        observed_retract=observed_retract,
-        step_name=step_name,
-        allowed_entities=list(allowed_entities),
-        allowed_event_classes=allowed_event_classes,
-        allowed_obj_props=allowed_obj_props,
-        context_triples=ctx_triples,
-    )
-
-    res = llm.chat(
-        messages=[{"role": "system", "content": SYSTEM},
-                  {"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+    return {
+        "request": request,
+        "prompt_stats": stats,
+        "timings": timer.stages,
+        "allowed_entities": set(allowed_entities),
+        "allowed_event_classes": set(allowed_event_classes),
+        "allowed_obj_props": set(allowed_obj_props),
+        "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
+    }
 
+def finish_c2(prepared: Dict[str, Any], res: LLMResult) -> Dict[str, Any]:
     raw = res.text
     txt = _strip_code_fences(raw)
+    timer = timer_for(prepared)
+    timer.add("llm_call", res.latency_s)
 
     try:
-        data = json.loads(txt)
+        with timer.stage("json_parse"):
+            data, recovered = loads_tolerant(txt)
     except Exception as e:
         return {
             "ok_schema": False,
             "schema_error_type": "json_parse",
             "schema_error_msg": str(e),
             "candidates": None,
+            "json_recovery": None,
             "latency_s": res.latency_s,
             "usage": res.usage,
+            **llm_extras(res),
             "raw_text": raw,
             "vocab": None,
-            "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
+            "retrieval": dict(prepared["retrieval"]),
+            "timings": timings_record(prepared, timer),
         }
 
     try:
-        candidates = _validate_schema(data)
+        with timer.stage("json_parse"):
+            candidates = _validate_schema(data)
     except Exception as e:
         return {
             "ok_schema": False,
             "schema_error_type": "schema_validation",
             "schema_error_msg": str(e),
             "candidates": None,
+            "json_recovery": recovered,
+            "salvaged_candidates": salvaged_items(data, recovered),
             "latency_s": res.latency_s,
             "usage": res.usage,
+            **llm_extras(res),
             "raw_text": raw,
             "vocab": None,
-            "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
+            "retrieval": dict(prepared["retrieval"]),
+            "timings": timings_record(prepared, timer),
         }
 
-    vocab = compute_vocab_flags(
-        candidates,
-        allowed_entities=set(allowed_entities),
-        allowed_event_classes=set(allowed_event_classes),
-        allowed_obj_props=set(allowed_obj_props),
-    )
+    with timer.stage("compute_vocab_flags"):
+        vocab = compute_vocab_flags(
+            candidates,
+            allowed_entities=prepared["allowed_entities"],
+            allowed_event_classes=prepared["allowed_event_classes"],
+            allowed_obj_props=prepared["allowed_obj_props"],
+        )
 
     return {
         "ok_schema": True,
         "schema_error_type": None,
         "schema_error_msg": None,
         "candidates": candidates,
+        "json_recovery": recovered,
         "latency_s": res.latency_s,
         "usage": res.usage,
+        **llm_extras(res),
         "raw_text": raw,
         "vocab": vocab,
-        "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
+        "retrieval": dict(prepared["retrieval"]),
+        "timings": timings_record(prepared, timer),
     }
+
+def complete_c2(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return finish_c2(prepared, llm.chat(**prepared["request"]))
+
+async def acomplete_c2(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return finish_c2(prepared, await llm.achat(**prepared["request"]))
+
+def complete_c2_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    """n muestras del mismo prompt (una petición con n choices, o n peticiones si el servidor no admite n)."""
+    return [finish_c2(prepared, res) for res in llm.chat_n(n=n, **prepared["request"])]
+
+async def acomplete_c2_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    return [finish_c2(prepared, res) for res in await llm.achat_n(n=n, **prepared["request"])]
+
+def generate_hypotheses_c2(
+    llm: client,
+    observed_retract: Triple,
+    step_name: str,
+    allowed_entities: set,
+    allowed_event_classes: List[str],
+    allowed_obj_props: List[str],
+    runtime: Optional[Any] = None,
+    hops: int = 2,
+    max_ctx_triples: int = 80,
+    temperature: float = 0.3,
+    max_tokens: int = 850,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    structured_output: bool = False,
+) -> Dict[str, Any]:
+    prepared = prepare_c2(
+        observed_retract=observed_retract,
+        step_name=step_name,
+        allowed_entities=allowed_entities,
+        allowed_event_classes=allowed_event_classes,
+        allowed_obj_props=allowed_obj_props,
+        runtime=runtime,
+        hops=hops,
+        max_ctx_triples=max_ctx_triples,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        context_window=context_window,
+        prompt_layout=prompt_layout,
+        structured_output=structured_output,
+    )
+    return complete_c2(llm, prepared)
@@ -1,9 +1,16 @@
 # /src/hypotheses/c3.py
+import asyncio
 import json
 from typing import Any, Dict, List, Tuple, Optional, Set
 from owlready2 import ThingClass
 
-from llm.client import client
+from llm.client import client, LLMResult, llm_extras
+from hypotheses.local_repair import repair_candidates
+from llm.json_recovery import loads_tolerant, salvaged_items
+from llm.structured import hypotheses_schema, hypothesis_schema, response_format
+from utils.prompt_budget import fit_prompt, input_budget, prompt_stats
+from utils.stage_timer import StageTimer, timer_for, timings_record
+from utils.symbolic_cache import SymbolicCache, cached, cached_prefix
 
 Triple = Tuple[str, str, str]
 
@@ -263,15 +270,21 @@ def build_prompt(
     context_triples: List[Triple],
     tmo_catalog_text: str,
     mlo_catalog_text: str,
-
+    *,
+    max_entities: int = 80,
+    max_props: int = 80,
+    max_ctx: int = 90,
+    layout: str = "default",
 ) -> str:
+    if layout not in ("default", "prefix"):
+        raise ValueError(f"Unknown layout: {layout}")
 
     s, p, o = observed_retract
 
-    ents = sorted(set(allowed_entities))[:80]
+    ents = sorted(set(allowed_entities))[:max_entities]
     evts = list(dict.fromkeys(allowed_event_classes))
-    props = sorted(set(allowed_obj_props))[:80]
-    ctx = context_triples[:90]
+    props = sorted(set(allowed_obj_props))[:max_props]
+    ctx = context_triples[:max_ctx]
 
     ctx_block = ""
     if ctx:
@@ -296,13 +309,11 @@ def build_prompt(
         )
 
 
-    return f"""{ROBOT_CONTEXT}
-
-Observed change (retract) at step '{step_name}':
+    observed = f"""Observed change (retract) at step '{step_name}':
 - retracted triple: ({s}, {p}, {o})
-{ctx_block}
-{catalog_block}
-Allowed entities (ABox individuals from the current scenario; MUST be used verbatim for participants/where and triple objects):
+"""
+
+    instructions = f"""Allowed entities (ABox individuals from the current scenario; MUST be used verbatim for participants/where and triple objects):
 {chr(10).join("- " + e for e in ents)}
 
 Allowed object properties (do NOT invent; use only these in proposed_triples):
@@ -347,16 +358,27 @@ Rules (STRICT):
   - s MUST equal event_id
   - p MUST be one of Allowed object properties
   - o MUST be one of Allowed entities
-- FOCUS CONSTRAINT (PER HYPOTHESIS):
+"""
+
+    focus = f"""- FOCUS CONSTRAINT (PER HYPOTHESIS):
   proposed_triples MUST include
   (at least one triple whose object (o) is exactly "{s}")
   AND
   (at least one triple whose object (o) is exactly "{o}").
 - Avoid generic/abstract explanations unless you explicitly connect them to the retract via proposed_triples that mention "{s}" or "{o}".
-- Prefer the MOST SPECIFIC EventType class from the catalog.
+"""
+
+    closing = """- Prefer the MOST SPECIFIC EventType class from the catalog.
 - Do NOT choose very generic classes unless there is no more specific option.
 """
 
+    if layout == "prefix":
+        # catálogos, vocabulario e instrucciones forman un prefijo idéntico entre runs (KV-cache
+        # del servidor); el retract, su contexto recuperado y las reglas que lo citan van al final
+        return (f"{ROBOT_CONTEXT}\n{catalog_block}\n{instructions}{closing}\n{observed}{ctx_block}"
+                f"\nRetract-specific rules (STRICT):\n{focus}")
+    return f"{ROBOT_CONTEXT}\n\n{observed}{ctx_block}\n{catalog_block}\n{instructions}{focus}{closing}"
+
 
 
 def _strip_code_fences(txt: str) -> str:
@@ -456,8 +478,7 @@ def compute_vocab_flags(
     }
     return out
 
-def generate_hypotheses_c3(
-    llm: client,
+def prepare_c3(
     observed_retract: Triple,
     step_name: str,
     allowed_entities: set,
@@ -468,14 +489,25 @@ def generate_hypotheses_c3(
     temperature: float = 0.3,
     max_tokens: int = 850,
     max_eventtype_items: int = 250,
+    shared: Optional[SymbolicCache] = None,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    structured_output: bool = False,
 ) -> Dict[str, Any]:
+    # con `shared` las etapas simbólicas cacheadas cuentan solo la consulta a la caché
+    timer = StageTimer()
     ctx_triples: List[Triple] = []
     if runtime is not None:
-        all_triples = extract_triples_from_runtime(runtime)
+        with timer.stage("extract_triples"):
+            all_triples = cached(shared, ("abox_triples",), lambda: extract_triples_from_runtime(runtime))
         s_seed = _norm(observed_retract[0])
         o_seed = _norm(observed_retract[2])
         seeds = {x for x in (s_seed, o_seed) if x}
-        ctx_triples = retrieve_subgraph(all_triples, seeds, hops=hops, max_triples=max_ctx_triples)
+        with timer.stage("retrieve_subgraph"):
+            ctx_triples = cached_prefix(
+                shared, ("subgraph", tuple(sorted(seeds)), hops), max_ctx_triples,
+                lambda n: retrieve_subgraph(all_triples, seeds, hops=hops, max_triples=n),
+            )
         print("[C3] GraphRAG seeds:", s_seed, o_seed)
         print("[C3] ctx_triples_n =", len(ctx_triples))
         print("[C3] ctx_triples_sample =", ctx_triples[:8])
@@ -490,13 +522,14 @@ def generate_hypotheses_c3(
         onto_main = getattr(runtime, "onto", None)
         extra_ontos = list(getattr(runtime, "extra_ontos", []) or [])
 
-        if extra_ontos:
-            tmo_catalog = extract_eventtype_catalog_from_ontos(extra_ontos)
-            tmo_text = format_eventtype_catalog(tmo_catalog, max_items=max_eventtype_items)
+        with timer.stage("catalog"):
+            if extra_ontos:
+                tmo_catalog = cached(shared, ("catalog", "extra"), lambda: extract_eventtype_catalog_from_ontos(extra_ontos))
+                tmo_text = format_eventtype_catalog(tmo_catalog, max_items=max_eventtype_items)
 
-        if onto_main is not None:
-            mlo_catalog = extract_eventtype_catalog_from_ontos([onto_main])
-            mlo_text = format_eventtype_catalog(mlo_catalog, max_items=120)
+            if onto_main is not None:
+                mlo_catalog = cached(shared, ("catalog", "main"), lambda: extract_eventtype_catalog_from_ontos([onto_main]))
+                mlo_text = format_eventtype_catalog(mlo_catalog, max_items=120)
 
     allowed_event_classes = [e["name"] for e in tmo_catalog] + [e["name"] for e in mlo_catalog]
     allowed_event_classes = list(dict.fromkeys(allowed_event_classes))
@@ -532,66 +565,169 @@ def generate_hypotheses_c3(
 
 
 
-    prompt = build_prompt(
-        observed_retract=observed_retract,
-        step_name=step_name,
-        allowed_entities=list(allowed_entities),
-        allowed_event_classes=allowed_event_classes,
-        allowed_obj_props=allowed_obj_props,
-        context_triples=ctx_triples,
-        tmo_catalog_text=tmo_text,
-        mlo_catalog_text=mlo_text,
-    )
+    def render(limits: Dict[str, int]) -> List[Dict[str, str]]:
+        # el texto de los catálogos solo se regenera si se recortan
+        tmo = tmo_text
+        if tmo_catalog and limits["catalog_preferred"] != full["catalog_preferred"]:
+            tmo = format_eventtype_catalog(tmo_catalog, max_items=limits["catalog_preferred"])
+        mlo = mlo_text
+        if mlo_catalog and limits["catalog_fallback"] != full["catalog_fallback"]:
+            mlo = format_eventtype_catalog(mlo_catalog, max_items=limits["catalog_fallback"])
+        prompt = build_prompt(
+            observed_retract=observed_retract,
+            step_name=step_name,
+            allowed_entities=list(allowed_entities),
+            allowed_event_classes=allowed_event_classes,
+            allowed_obj_props=allowed_obj_props,
+            context_triples=ctx_triples,
+            tmo_catalog_text=tmo,
+            mlo_catalog_text=mlo,
+            max_entities=limits["entities"],
+            max_props=limits["object_properties"],
+            max_ctx=limits["context_triples"],
+            layout=prompt_layout,
+        )
+        return [{"role": "system", "content": SYSTEM},
+                {"role": "user", "content": prompt}]
+
+    full = {
+        "entities": min(len(set(allowed_entities)), 80),
+        "object_properties": min(len(set(allowed_obj_props)), 80),
+        "context_triples": min(len(ctx_triples), 90),
+        "catalog_preferred": min(len(tmo_catalog), max_eventtype_items),
+        "catalog_fallback": min(len(mlo_catalog), 120),
+    }
+    limits, fitted = dict(full), None
+    with timer.stage("build_prompt"):
+        if context_window is None:
+            messages = render(limits)
+        else:
+            # prioridad (de menor a mayor): catálogo MLO, contexto, catálogo TMO, propiedades, entidades
+            messages, limits, fitted = fit_prompt(
+                render, limits,
+                ("catalog_fallback", "context_triples", "catalog_preferred", "object_properties", "entities"),
+                input_budget(context_window, max_tokens),
+                min_items={"catalog_preferred": 20, "context_triples": 10, "object_properties": 5, "entities": 10},
+            )
+    prompt = messages[-1]["content"]
 
-    res = llm.chat(
-        messages=[{"role": "system", "content": SYSTEM},
-                  {"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+    tmo_set = {e["name"] for e in tmo_catalog}
+    request = {
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if structured_output:
+        with timer.stage("response_format"):
+            # Agent_Shadow como primer participante y, si hay catálogo TMO, dos hipótesis TMO:
+            # lo que hoy fuerza la llamada de reparación queda garantizado por la gramática
+            shadow = "Agent_Shadow" if "Agent_Shadow" in set(allowed_entities) else None
+            item = hypothesis_schema(allowed_event_classes, allowed_entities, allowed_obj_props, shadow=shadow)
+            preferred = None
+            if tmo_set:
+                preferred = hypothesis_schema(tmo_set, allowed_entities, allowed_obj_props, shadow=shadow)
+            request["response_format"] = response_format(
+                hypotheses_schema(item, preferred_item=preferred, n_preferred=2 if preferred else 0))
+    with timer.stage("prompt_stats"):
+        stats = prompt_stats(messages, context_window, max_tokens, limits, fitted)
 
-    raw = res.text
-    txt = _strip_code_fences(raw)
+    return {
+        "request": request,
+        "prompt": prompt,
+        "prompt_stats": stats,
+        "timings": timer.stages,
+        "allowed_entities": set(allowed_entities),
+        "allowed_event_classes": list(allowed_event_classes),
+        "allowed_obj_props": set(allowed_obj_props),
+        "tmo_set": tmo_set,
+        "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
+        "catalog": {"n_types": len(allowed_event_classes), "max_items": max_eventtype_items},
+    }
+
+
+def _error_out_c3(prepared: Dict[str, Any], res: LLMResult, error_type: str, error_msg: str,
+                  json_recovery: Optional[List[str]] = None) -> Dict[str, Any]:
+    return {
+        "ok_schema": False,
+        "schema_error_type": error_type,
+        "schema_error_msg": error_msg,
+        "candidates": None,
+        "json_recovery": json_recovery,
+        "latency_s": res.latency_s,
+        "usage": res.usage,
+        **llm_extras(res),
+        "raw_text": res.text,
+        "vocab": None,
+        "retrieval": dict(prepared["retrieval"]),
+        "catalog": dict(prepared["catalog"]),
+    }
+
+
+def parse_first_c3(
+    prepared: Dict[str, Any], res: LLMResult,
+) -> Tuple[Optional[Dict[str, Any]], str, Optional[List[Dict[str, Any]]], List[str]]:
+    """
+    Devuelve (salida_de_error | None, texto_sin_fences, candidatos, reparaciones del JSON).
+    """
+    txt = _strip_code_fences(res.text)
 
     try:
-        data = json.loads(txt)
+        data, recovered = loads_tolerant(txt)
     except Exception as e:
-        return {
-            "ok_schema": False,
-            "schema_error_type": "json_parse",
-            "schema_error_msg": str(e),
-            "candidates": None,
-            "latency_s": res.latency_s,
-            "usage": res.usage,
-            "raw_text": raw,
-            "vocab": None,
-            "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
-            "catalog": {"n_types": len(allowed_event_classes), "max_items": max_eventtype_items},
-        }
+        return _error_out_c3(prepared, res, "json_parse", str(e)), txt, None, []
 
     try:
         candidates = _validate_schema(data)
     except Exception as e:
-        return {
-            "ok_schema": False,
-            "schema_error_type": "schema_validation",
-            "schema_error_msg": str(e),
-            "candidates": None,
-            "latency_s": res.latency_s,
-            "usage": res.usage,
-            "raw_text": raw,
-            "vocab": None,
-            "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
-            "catalog": {"n_types": len(allowed_event_classes), "max_items": max_eventtype_items},
-        }
-
-    allowed_evt_set = set(allowed_event_classes)
-    
+        err = _error_out_c3(prepared, res, "schema_validation", str(e), recovered)
+        err["salvaged_candidates"] = salvaged_items(data, recovered)
+        return err, txt, None, recovered
+
+    if recovered:
+        # la reparación con el LLM parte del JSON ya saneado
+        txt = json.dumps(candidates, ensure_ascii=False, indent=2)
+    return None, txt, candidates, recovered
+
+
+def repair_reasons_c3(prepared: Dict[str, Any], candidates: List[Dict[str, Any]]) -> List[str]:
+    """Restricciones que incumplen los candidatos (vacío si no hace falta reparar)."""
+    reasons = []
+    if _invalid_event_classes(candidates, set(prepared["allowed_event_classes"])):
+        reasons.append("event_class")
+    if "Agent_Shadow" in set(prepared["allowed_entities"]) and _shadow_missing(candidates, "Agent_Shadow"):
+        reasons.append("shadow")
+    for h in candidates:
+        ec, eid = h.get("event_class"), h.get("event_id")
+        if isinstance(ec, str) and isinstance(eid, str) and eid not in {f"{ec}_H1", f"{ec}_H2", f"{ec}_H3"}:
+            reasons.append("event_id")
+            break
+    tmo_set = prepared["tmo_set"]
+    if tmo_set and sum(1 for h in candidates if h.get("event_class") in tmo_set) < 2:
+        reasons.append("tmo_coverage")
+    return reasons
+
+
+def local_repair_c3(prepared: Dict[str, Any], candidates: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Arreglos deterministas (vocabulario más parecido, event_id, Agent_Shadow) antes de pedir reparación al LLM."""
+    allowed_entities = prepared["allowed_entities"]
+    return repair_candidates(
+        candidates,
+        allowed_entities=allowed_entities,
+        allowed_event_classes=prepared["allowed_event_classes"],
+        allowed_obj_props=prepared["allowed_obj_props"],
+        shadow="Agent_Shadow" if "Agent_Shadow" in set(allowed_entities) else None,
+    )
+
+
+def build_repair_request_c3(prepared: Dict[str, Any], txt: str, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    allowed_entities = prepared["allowed_entities"]
+    allowed_evt_set = set(prepared["allowed_event_classes"])
+
     bad_classes = _invalid_event_classes(candidates, allowed_evt_set)
 
     require_shadow = "Agent_Shadow" in set(allowed_entities)
     shadow_missing = require_shadow and _shadow_missing(candidates, "Agent_Shadow")
-    
+
     bad_ids = []
     for h in candidates:
         ec = h.get("event_class")
@@ -601,75 +737,242 @@ def generate_hypotheses_c3(
                 bad_ids.append(eid)
 
     id_mismatch = bool(bad_ids)
-    tmo_set = {e["name"] for e in tmo_catalog}
+    tmo_set = prepared["tmo_set"]
     tmo_count = sum(1 for h in candidates if h.get("event_class") in tmo_set)
     tmo_missing = bool(tmo_set) and (tmo_count < 2)
 
 
 
-    if bad_classes or shadow_missing or id_mismatch or tmo_missing:
-        repair_instructions = []
-        if bad_classes:
-            repair_instructions.append(
-                "Some event_class values are not in Allowed event classes: "
-                + ", ".join(bad_classes)
-                + ". Replace each invalid event_class with the closest EXACT string from Allowed event classes."
-            )
-        if shadow_missing:
-            repair_instructions.append(
-                'For EACH hypothesis, ensure "participants" includes "Agent_Shadow" (verbatim) in addition to any others.'
-            )
-        if id_mismatch:
-            repair_instructions.append(
-                'For EACH hypothesis, set "event_id" to exactly one of: "<event_class>_H1", "<event_class>_H2", "<event_class>_H3".'
-            )
-        if tmo_missing:
-            repair_instructions.append(
-                "COVERAGE FIX: At least 2 hypotheses must use an event_class from the Preferred (TMO) catalog. "
-                'Change event_class (and event_id accordingly) to satisfy this.'
-            )
+    if not (bad_classes or shadow_missing or id_mismatch or tmo_missing):
+        return None
 
-        repair_prompt = (
-            "Your JSON is valid but violates constraints.\n"
-            + "\n".join(repair_instructions)
-            + "\nReturn ONLY the corrected JSON. Do not change any other fields unless required by these fixes."
+    repair_instructions = []
+    if bad_classes:
+        repair_instructions.append(
+            "Some event_class values are not in Allowed event classes: "
+            + ", ".join(bad_classes)
+            + ". Replace each invalid event_class with the closest EXACT string from Allowed event classes."
         )
-
-        res2 = llm.chat(
-            messages=[
-                {"role": "system", "content": SYSTEM},
-                {"role": "user", "content": prompt},
-                {"role": "assistant", "content": txt},
-                {"role": "user", "content": repair_prompt},
-            ],
-            temperature=0.0,
-            max_tokens=max_tokens,
+    if shadow_missing:
+        repair_instructions.append(
+            'For EACH hypothesis, ensure "participants" includes "Agent_Shadow" (verbatim) in addition to any others.'
+        )
+    if id_mismatch:
+        repair_instructions.append(
+            'For EACH hypothesis, set "event_id" to exactly one of: "<event_class>_H1", "<event_class>_H2", "<event_class>_H3".'
+        )
+    if tmo_missing:
+        repair_instructions.append(
+            "COVERAGE FIX: At least 2 hypotheses must use an event_class from the Preferred (TMO) catalog. "
+            'Change event_class (and event_id accordingly) to satisfy this.'
         )
-        raw2 = res2.text
-        txt2 = _strip_code_fences(raw2)
-        data2 = json.loads(txt2)
-        candidates2 = _validate_schema(data2)
 
-        raw, txt, candidates = raw2, txt2, candidates2
-        res = res2 
+    repair_prompt = (
+        "Your JSON is valid but violates constraints.\n"
+        + "\n".join(repair_instructions)
+        + "\nReturn ONLY the corrected JSON. Do not change any other fields unless required by these fixes."
+    )
+
+    request = {
+        "messages": [
+            {"role": "system", "content": SYSTEM},
+            {"role": "user", "content": prepared["prompt"]},
+            {"role": "assistant", "content": txt},
+            {"role": "user", "content": repair_prompt},
+        ],
+        "temperature": 0.0,
+        "max_tokens": prepared["request"]["max_tokens"],
+    }
+    if "response_format" in prepared["request"]:
+        request["response_format"] = prepared["request"]["response_format"]
+    return request
+
+
+def parse_repair_c3(res2: LLMResult) -> Tuple[List[Dict[str, Any]], List[str]]:
+    txt2 = _strip_code_fences(res2.text)
+    data2, recovered = loads_tolerant(txt2)
+    return _validate_schema(data2), recovered
 
 
-    vocab = compute_vocab_flags(
+def _vocab_flags_c3(prepared: Dict[str, Any], candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return compute_vocab_flags(
         candidates,
-        allowed_entities=set(allowed_entities),
-        allowed_event_classes=set(allowed_event_classes),
-        allowed_obj_props=set(allowed_obj_props),
+        allowed_entities=prepared["allowed_entities"],
+        allowed_event_classes=set(prepared["allowed_event_classes"]),
+        allowed_obj_props=prepared["allowed_obj_props"],
     )
 
-    return {
+
+def finish_c3(prepared: Dict[str, Any], res: LLMResult, candidates: List[Dict[str, Any]],
+              json_recovery: Optional[List[str]] = None, timer: Optional[StageTimer] = None,
+              repaired: Optional[List[Dict[str, Any]]] = None, repair_res: Optional[LLMResult] = None,
+              repair_recovery: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    `candidates` y `vocab` describen siempre la primera respuesta del modelo (la
+    de raw_text), como en C0–C2. Si hubo reparación, local o con el LLM, el
+    resultado final va en `repaired_candidates` con sus flags en `vocab_repaired`;
+    la respuesta de la llamada de reparación, en `repair_raw_text`/`repair_usage`.
+    """
+    if timer is None:
+        timer = timer_for(prepared)
+    with timer.stage("compute_vocab_flags"):
+        vocab = _vocab_flags_c3(prepared, candidates)
+        vocab_repaired = _vocab_flags_c3(prepared, repaired) if repaired is not None else None
+
+    out = {
         "ok_schema": True,
         "schema_error_type": None,
         "schema_error_msg": None,
         "candidates": candidates,
+        "json_recovery": json_recovery or [],
         "latency_s": res.latency_s,
         "usage": res.usage,
-        "raw_text": raw,
+        **llm_extras(res),
+        "raw_text": res.text,
         "vocab": vocab,
-        "retrieval": {"hops": hops, "max_ctx_triples": max_ctx_triples, "ctx_triples_n": len(ctx_triples)},
-        "catalog": {"n_types": len(allowed_event_classes), "max_items": max_eventtype_items},
+        "retrieval": dict(prepared["retrieval"]),
+        "catalog": dict(prepared["catalog"]),
     }
+    if repaired is not None:
+        out["repaired_candidates"] = repaired
+        out["vocab_repaired"] = vocab_repaired
+    if repair_res is not None:
+        out["repair_raw_text"] = repair_res.text
+        out["repair_json_recovery"] = repair_recovery or []
+        out["repair_latency_s"] = repair_res.latency_s
+        out["repair_usage"] = repair_res.usage
+    out["timings"] = timings_record(prepared, timer)
+    return out
+
+
+def _with_repair(out: Dict[str, Any], reasons: List[str], fixes: List[Dict[str, Any]],
+                 remaining: List[str], structured: Optional[bool]) -> Dict[str, Any]:
+    # reasons: restricciones incumplidas por la primera respuesta; remaining: las que quedan tras
+    # la reparación local (solo entonces hay llamada al LLM). avoided: llamada que no hizo falta,
+    # por la salida restringida o porque la reparación local bastó
+    out["repair"] = {
+        "reasons": reasons,
+        "local_fixes": fixes,
+        "remaining": remaining,
+        "llm_call": bool(remaining),
+        "avoided": out["ok_schema"] and ((bool(structured) and not reasons) or (bool(reasons) and not remaining)),
+    }
+    return out
+
+
+def _local_stage_c3(
+    prepared: Dict[str, Any], txt: str, candidates: List[Dict[str, Any]],
+) -> Tuple[List[str], List[Dict[str, Any]], List[str], List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    reasons = repair_reasons_c3(prepared, candidates)
+    if not reasons:
+        # nada que reparar: los candidatos del modelo quedan tal cual
+        return reasons, [], [], candidates, None
+    candidates, fixes = local_repair_c3(prepared, candidates)
+    remaining = repair_reasons_c3(prepared, candidates) if fixes else reasons
+    if fixes:
+        # el LLM corrige sobre la versión ya reparada
+        txt = json.dumps(candidates, ensure_ascii=False, indent=2)
+    repair = build_repair_request_c3(prepared, txt, candidates) if remaining else None
+    return reasons, fixes, remaining, candidates, repair
+
+
+def _complete_sample_c3(llm: client, prepared: Dict[str, Any], res: LLMResult) -> Dict[str, Any]:
+    structured = res.structured
+    timer = timer_for(prepared)
+    timer.add("llm_call", res.latency_s)
+    with timer.stage("json_parse"):
+        err, txt, candidates, recovered = parse_first_c3(prepared, res)
+    if err is not None:
+        err["timings"] = timings_record(prepared, timer)
+        return _with_repair(err, [], [], [], structured)
+
+    with timer.stage("local_repair"):
+        reasons, fixes, remaining, repaired, repair = _local_stage_c3(prepared, txt, candidates)
+    # candidates/json_recovery describen raw_text; lo reparado (local o LLM) va en repaired_candidates
+    if repair is not None:
+        with timer.stage("repair_call"):
+            res2 = llm.chat(**repair)
+        with timer.stage("json_parse"):
+            repaired, recovered2 = parse_repair_c3(res2)
+        out = finish_c3(prepared, res, candidates, recovered, timer,
+                        repaired=repaired, repair_res=res2, repair_recovery=recovered2)
+    else:
+        out = finish_c3(prepared, res, candidates, recovered, timer, repaired=repaired if fixes else None)
+    return _with_repair(out, reasons, fixes, remaining, structured)
+
+
+async def _acomplete_sample_c3(llm: client, prepared: Dict[str, Any], res: LLMResult) -> Dict[str, Any]:
+    structured = res.structured
+    timer = timer_for(prepared)
+    timer.add("llm_call", res.latency_s)
+    with timer.stage("json_parse"):
+        err, txt, candidates, recovered = parse_first_c3(prepared, res)
+    if err is not None:
+        err["timings"] = timings_record(prepared, timer)
+        return _with_repair(err, [], [], [], structured)
+
+    with timer.stage("local_repair"):
+        reasons, fixes, remaining, repaired, repair = _local_stage_c3(prepared, txt, candidates)
+    # candidates/json_recovery describen raw_text; lo reparado (local o LLM) va en repaired_candidates
+    if repair is not None:
+        with timer.stage("repair_call"):
+            res2 = await llm.achat(**repair)
+        with timer.stage("json_parse"):
+            repaired, recovered2 = parse_repair_c3(res2)
+        out = finish_c3(prepared, res, candidates, recovered, timer,
+                        repaired=repaired, repair_res=res2, repair_recovery=recovered2)
+    else:
+        out = finish_c3(prepared, res, candidates, recovered, timer, repaired=repaired if fixes else None)
+    return _with_repair(out, reasons, fixes, remaining, structured)
+
+
+def complete_c3(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return _complete_sample_c3(llm, prepared, llm.chat(**prepared["request"]))
+
+
+async def acomplete_c3(llm: client, prepared: Dict[str, Any]) -> Dict[str, Any]:
+    return await _acomplete_sample_c3(llm, prepared, await llm.achat(**prepared["request"]))
+
+
+def complete_c3_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    """n muestras del mismo prompt; cada una se repara por separado si hace falta."""
+    return [_complete_sample_c3(llm, prepared, res) for res in llm.chat_n(n=n, **prepared["request"])]
+
+
+async def acomplete_c3_n(llm: client, prepared: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    results = await llm.achat_n(n=n, **prepared["request"])
+    return list(await asyncio.gather(*(_acomplete_sample_c3(llm, prepared, res) for res in results)))
+
+
+def generate_hypotheses_c3(
+    llm: client,
+    observed_retract: Triple,
+    step_name: str,
+    allowed_entities: set,
+    allowed_obj_props: List[str],
+    runtime: Optional[Any] = None,
+    hops: int = 2,
+    max_ctx_triples: int = 80,
+    temperature: float = 0.3,
+    max_tokens: int = 850,
+    max_eventtype_items: int = 250,
+    context_window: Optional[int] = None,
+    prompt_layout: str = "default",
+    structured_output: bool = False,
+) -> Dict[str, Any]:
+    prepared = prepare_c3(
+        observed_retract=observed_retract,
+        step_name=step_name,
+        allowed_entities=allowed_entities,
+        allowed_obj_props=allowed_obj_props,
+        runtime=runtime,
+        hops=hops,
+        max_ctx_triples=max_ctx_triples,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        max_eventtype_items=max_eventtype_items,
+        context_window=context_window,
+        prompt_layout=prompt_layout,
+        structured_output=structured_output,
+    )
+    return complete_c3(llm, prepared)
@@ -0,0 +1,106 @@
+# /src/hypotheses/local_repair.py
+import copy
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.fuzzy_index import FuzzyIndex, fuzzy_index
+
+# sufijo de individuo que el modelo a veces deja en event_class ("Action_H1")
+_INSTANCE_SUFFIX = re.compile(r"_H[123]$")
+
+
+def _snap(index: FuzzyIndex, value: Any) -> Optional[str]:
+    if not isinstance(value, str) or value in index:
+        return None
+    snapped, _ = index.lookup(value)
+    return snapped
+
+
+def repair_candidates(
+    candidates: List[Dict[str, Any]],
+    allowed_entities: Iterable[str],
+    allowed_event_classes: Iterable[str],
+    allowed_obj_props: Iterable[str],
+    shadow: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Reparación determinista de hipótesis ya validadas por esquema, sin volver a
+    llamar al LLM: event_class/entidades/propiedades fuera del vocabulario se
+    ajustan al nombre permitido más parecido (índice de trigramas), un event_id
+    inválido o repetido pasa al primer "<event_class>_H<k>" libre, el sujeto de
+    los triples al event_id y, si se pide, `shadow` se añade como primer
+    participante. Lo que no se puede ajustar con confianza se deja igual (queda
+    para la reparación con el LLM).
+    Devuelve (copia reparada, lista de cambios {hypothesis, field, from, to}).
+    """
+    entities = fuzzy_index(allowed_entities)
+    classes = fuzzy_index(allowed_event_classes)
+    props = fuzzy_index(allowed_obj_props)
+
+    out = copy.deepcopy(candidates)
+    fixes: List[Dict[str, Any]] = []
+
+    def fix(i: int, field: str, old: Any, new: Any) -> None:
+        fixes.append({"hypothesis": i, "field": field, "from": old, "to": new})
+
+    for i, h in enumerate(out):
+        ec = h["event_class"]
+        if ec not in classes:
+            base = _INSTANCE_SUFFIX.sub("", ec)
+            snapped = base if base in classes else _snap(classes, base)
+            if snapped is not None:
+                fix(i, "event_class", ec, snapped)
+                h["event_class"] = snapped
+
+    # event_id: se conservan los válidos no repetidos; el resto toma el primer
+    # "<event_class>_H<k>" libre (si no queda ninguno se deja para el LLM)
+    used: Set[str] = set()
+    pending: List[int] = []
+    for i, h in enumerate(out):
+        ec, eid = h["event_class"], h["event_id"]
+        if eid in {f"{ec}_H1", f"{ec}_H2", f"{ec}_H3"} and eid not in used:
+            used.add(eid)
+        else:
+            pending.append(i)
+    for i in pending:
+        h = out[i]
+        ec = h["event_class"]
+        free = [f"{ec}_H{k}" for k in (1, 2, 3) if f"{ec}_H{k}" not in used]
+        if free:
+            fix(i, "event_id", h["event_id"], free[0])
+            h["event_id"] = free[0]
+            used.add(free[0])
+
+    for i, h in enumerate(out):
+        parts: List[str] = []
+        for p in h["participants"]:
+            snapped = _snap(entities, p)
+            if snapped is not None:
+                fix(i, "participants", p, snapped)
+                p = snapped
+            if p not in parts:
+                parts.append(p)
+        if shadow and shadow not in parts:
+            fix(i, "participants", None, shadow)
+            parts.insert(0, shadow)
+        h["participants"] = parts
+
+        snapped = _snap(entities, h["where"])
+        if snapped is not None:
+            fix(i, "where", h["where"], snapped)
+            h["where"] = snapped
+
+        for t in h["proposed_triples"]:
+            if t[0] != h["event_id"]:
+                fix(i, "triple_subject", t[0], h["event_id"])
+                t[0] = h["event_id"]
+            snapped = _snap(props, t[1])
+            if snapped is not None:
+                fix(i, "triple_property", t[1], snapped)
+                t[1] = snapped
+            snapped = _snap(entities, t[2])
+            if snapped is not None:
+                fix(i, "triple_object", t[2], snapped)
+                t[2] = snapped
+
+    return out, fixes
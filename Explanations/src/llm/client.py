@@ -1,11 +1,24 @@
 # /src/llm/client.py
+import asyncio
 import os
+import random
+import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, BadRequestError, OpenAI, RateLimitError,
+)
+
+from llm.concurrency import AdaptiveConcurrency
+from llm.endpoints import Endpoint, EndpointPool
+from llm.response_cache import ResponseCache, cache_entry
+from llm.streaming import JsonArrayScanner
 
 
 @dataclass
@@ -14,6 +27,59 @@ class LLMResult:
     usage: Dict[str, int]
     latency_s: float
     raw: Any
+    # solo con caché de respuestas activa: hit, latency_saved_s, hit_rate...
+    cache: Optional[Dict[str, Any]] = None
+    # intentos de la llamada: attempts, retries, hedged, hedge_won, errors
+    attempts: Optional[Dict[str, Any]] = None
+    # solo en modo streaming: ttft_s, time_to_valid_json_s, early_stop...
+    stream: Optional[Dict[str, Any]] = None
+    # solo con varias muestras por prompt (chat_n): n, index, batched
+    sample: Optional[Dict[str, Any]] = None
+    # solo si se pidió salida estructurada: si el servidor aplicó la restricción
+    structured: Optional[bool] = None
+    # URL del servidor que respondió (se registra solo con varios endpoints)
+    endpoint: Optional[str] = None
+
+
+def llm_extras(res: LLMResult) -> Dict[str, Any]:
+    """Campos opcionales del registro que dependen de la llamada (vacío si no aplican)."""
+    out: Dict[str, Any] = {}
+    if res.cache is not None:
+        out["llm_cache"] = res.cache
+    if res.attempts is not None:
+        out["llm_attempts"] = res.attempts
+    if res.stream is not None:
+        out["llm_stream"] = res.stream
+    if res.sample is not None:
+        out["llm_sample"] = res.sample
+    if res.structured is not None:
+        out["llm_structured"] = res.structured
+    if res.endpoint is not None:
+        out["llm_endpoint"] = res.endpoint
+    return out
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    v = os.getenv(name)
+    return float(v) if v not in (None, "") else default
+
+
+def _retryable(e: BaseException) -> bool:
+    if isinstance(e, (APITimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(e, APIStatusError) and getattr(e, "status_code", 0) >= 500
+
+
+def _cached_tokens(resp: Any, usage_obj: Any) -> Optional[int]:
+    """Tokens de prompt reutilizados de la caché de prefijos, si el servidor lo informa."""
+    details = getattr(usage_obj, "prompt_tokens_details", None)
+    cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    if cached is None:
+        # llama.cpp server: "timings": {"cache_n": ...}
+        timings = getattr(resp, "timings", None)
+        if isinstance(timings, dict):
+            cached = timings.get("cache_n")
+    return int(cached) if cached is not None else None
 
 
 class client:
@@ -22,9 +88,17 @@ class client:
         base_url_env: str = "LOCAL_OPENAI_BASE_URL",
         api_key_env: str = "LOCAL_OPENAI_API_KEY",
         model_env: str = "LOCAL_OPENAI_MODEL",
+        cache_dir_env: str = "LOCAL_OPENAI_CACHE_DIR",
+        cache: Optional[ResponseCache] = None,
+        timeout_s: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        hedge_percentile: Optional[float] = None,
+        stream: Optional[bool] = None,
     ):
         load_dotenv()
-        self.base_url = os.getenv(base_url_env)
+        # varios servidores: LOCAL_OPENAI_BASE_URLS=url1,url2,... (tiene prioridad sobre la URL única)
+        urls = [u.strip() for u in os.getenv(f"{base_url_env}S", "").split(",") if u.strip()]
+        self.base_url = urls[0] if urls else os.getenv(base_url_env)
         self.api_key = os.getenv(api_key_env, "ollama")
         self.model = os.getenv(model_env)
 
@@ -33,24 +107,63 @@ class client:
         if not self.model:
             raise RuntimeError(f"Falta {model_env} en el .env")
 
-        self.client = OpenAI(base_url=self.base_url, api_key=self.api_key)
+        # política de llamada: timeout por petición, reintentos con backoff y jitter,
+        # y petición duplicada (hedge) si la primera supera el percentil de latencia
+        self.timeout_s = timeout_s if timeout_s is not None else _env_float("LOCAL_OPENAI_TIMEOUT_S", 120.0)
+        self.max_retries = max_retries if max_retries is not None else int(_env_float("LOCAL_OPENAI_MAX_RETRIES", 2))
+        self.backoff_s = 0.5
+        self.hedge_percentile = (hedge_percentile if hedge_percentile is not None
+                                 else _env_float("LOCAL_OPENAI_HEDGE_PERCENTILE", None))
+        self.hedge_min_samples = 20
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
 
-    def chat(
-        self,
-        messages: List[Dict[str, str]],
-        temperature: float = 0.0,
-        max_tokens: Optional[int] = None,
-    ) -> LLMResult:
-        t0 = time.time()
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
+        # límite adaptativo de peticiones en vuelo (lo activa el runner); None = sin límite propio
+        self.concurrency: Optional[AdaptiveConcurrency] = None
+
+        # varias muestras por prompt: parámetro n de la API; None = aún no se sabe si el servidor lo admite
+        self.n_supported: Optional[bool] = None
+        self._sample_pool: Optional[ThreadPoolExecutor] = None
+
+        # salida estructurada (response_format json_schema); False si el servidor la rechaza
+        self.structured_supported: Optional[bool] = None
+
+        # streaming: se corta la generación en cuanto se cierra el array JSON de respuesta
+        self.stream = stream if stream is not None else os.getenv("LOCAL_OPENAI_STREAM", "") in ("1", "true", "yes")
+        self._stream_usage = True
+
+        # pool de servidores (uno solo si no hay LOCAL_OPENAI_BASE_URLS); cada petición va al
+        # endpoint elegido por la política de reparto y los que fallan se expulsan un tiempo
+        self.endpoints = EndpointPool(
+            urls or [self.base_url], self.api_key, timeout_s=self.timeout_s,
+            policy=os.getenv("LOCAL_OPENAI_ROUTING", "least_outstanding"),
+            fail_threshold=int(_env_float("LOCAL_OPENAI_EJECT_AFTER", 3)),
+            eject_s=_env_float("LOCAL_OPENAI_EJECT_S", 30.0),
         )
-        latency = time.time() - t0
+        if len(self.endpoints) > 1:
+            self.endpoints.check_all()
+        self.client = self.endpoints.endpoints[0].client
 
-        text = resp.choices[0].message.content or ""
+        # caché de respuestas opcional (solo peticiones deterministas: temperature=0 o seed)
+        if cache is None and os.getenv(cache_dir_env):
+            max_mb = float(os.getenv("LOCAL_OPENAI_CACHE_MAX_MB", "256"))
+            cache = ResponseCache(os.getenv(cache_dir_env), max_bytes=int(max_mb * 1024 * 1024))
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_coalesced = 0
+        self.cache_latency_saved_s = 0.0
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+        self._ainflight: Dict[str, asyncio.Event] = {}
+
+        # reutilización del prefijo (KV-cache) en el servidor, si lo informa
+        self.prefix_responses = 0
+        self.prefix_reporting = 0
+        self.prefix_prompt_tokens = 0
+        self.prefix_cached_tokens = 0
+
+    def _usage_dict(self, resp: Any) -> Dict[str, int]:
         usage_obj = getattr(resp, "usage", None)
 
         usage = {}
@@ -60,5 +173,638 @@ class client:
                 "completion_tokens": int(getattr(usage_obj, "completion_tokens", 0) or 0),
                 "total_tokens": int(getattr(usage_obj, "total_tokens", 0) or 0),
             }
+            cached = _cached_tokens(resp, usage_obj)
+            if cached is not None:
+                usage["cached_tokens"] = cached
+        return usage
+
+    def _note_prefix(self, usage: Dict[str, int]) -> None:
+        with self._inflight_lock:
+            self.prefix_responses += 1
+            if "cached_tokens" in usage:
+                self.prefix_reporting += 1
+                self.prefix_prompt_tokens += usage.get("prompt_tokens", 0)
+                self.prefix_cached_tokens += usage["cached_tokens"]
+
+    def prefix_cache_stats(self) -> Dict[str, Any]:
+        """Tokens de prompt servidos desde la caché de prefijos del servidor (solo respuestas que lo informan)."""
+        return {
+            "responses": self.prefix_responses,
+            "reporting": self.prefix_reporting,
+            "prompt_tokens": self.prefix_prompt_tokens,
+            "cached_tokens": self.prefix_cached_tokens,
+            "hit_rate": (self.prefix_cached_tokens / self.prefix_prompt_tokens) if self.prefix_prompt_tokens else None,
+        }
+
+    # --- caché de respuestas ---
+
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float,
+                   max_tokens: Optional[int], seed: Optional[int],
+                   response_format: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        # con temperature > 0 y sin seed cada llamada es una muestra distinta: no se cachea
+        if self.cache is None or (temperature and seed is None):
+            return None
+        return ResponseCache.make_key(self.model, messages, temperature, max_tokens, seed,
+                                      self._effective_format(response_format))
+
+    def _effective_format(self, response_format: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return response_format if self.structured_supported is not False else None
+
+    def cache_stats(self) -> Dict[str, Any]:
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "coalesced": self.cache_coalesced,
+            "hit_rate": (self.cache_hits / total) if total else 0.0,
+            "latency_saved_s": self.cache_latency_saved_s,
+            **(self.cache.stats() if self.cache is not None else {}),
+        }
+
+    # --- workers de otros procesos ---
+
+    def settings(self) -> Dict[str, Any]:
+        """Parámetros (serializables) para crear un cliente equivalente en otro proceso (from_settings)."""
+        return {
+            "timeout_s": self.timeout_s,
+            "max_retries": self.max_retries,
+            "hedge_percentile": self.hedge_percentile,
+            "stream": self.stream,
+            "cache_dir": self.cache.cache_dir if self.cache is not None else None,
+            "cache_max_bytes": self.cache.max_bytes if self.cache is not None else None,
+        }
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> "client":
+        settings = dict(settings)
+        cache_dir = settings.pop("cache_dir", None)
+        max_bytes = settings.pop("cache_max_bytes", None)
+        cache = ResponseCache(cache_dir, max_bytes=max_bytes) if cache_dir else None
+        return cls(cache=cache, **settings)
+
+    def counters(self) -> Dict[str, Any]:
+        """Contadores acumulados (caché, prefijos, endpoints) para sumarlos al cliente de otro proceso (absorb)."""
+        with self._inflight_lock:
+            return {
+                "cache": {"hits": self.cache_hits, "misses": self.cache_misses,
+                          "coalesced": self.cache_coalesced, "latency_saved_s": self.cache_latency_saved_s,
+                          "evictions": self.cache.evictions if self.cache is not None else 0},
+                "prefix": {"responses": self.prefix_responses, "reporting": self.prefix_reporting,
+                           "prompt_tokens": self.prefix_prompt_tokens, "cached_tokens": self.prefix_cached_tokens},
+                "endpoints": {ep.url: {"requests": ep.requests, "errors": ep.errors, "ejections": ep.ejections}
+                              for ep in self.endpoints.endpoints},
+            }
+
+    def absorb(self, counters: Dict[str, Any]) -> None:
+        """Suma los contadores de otro cliente (p. ej. un worker del pool) a los de este."""
+        with self._inflight_lock:
+            c = counters["cache"]
+            self.cache_hits += c["hits"]
+            self.cache_misses += c["misses"]
+            self.cache_coalesced += c["coalesced"]
+            self.cache_latency_saved_s += c["latency_saved_s"]
+            if self.cache is not None:
+                self.cache.evictions += c["evictions"]
+            p = counters["prefix"]
+            self.prefix_responses += p["responses"]
+            self.prefix_reporting += p["reporting"]
+            self.prefix_prompt_tokens += p["prompt_tokens"]
+            self.prefix_cached_tokens += p["cached_tokens"]
+        for ep in self.endpoints.endpoints:
+            e = counters["endpoints"].get(ep.url)
+            if e:
+                ep.requests += e["requests"]
+                ep.errors += e["errors"]
+                ep.ejections += e["ejections"]
+
+    def _cache_info(self, hit: bool, latency_saved_s: float = 0.0, coalesced: bool = False) -> Dict[str, Any]:
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hit": hit,
+            "coalesced": coalesced,
+            "latency_saved_s": latency_saved_s,
+            "hit_rate": (self.cache_hits / total) if total else 0.0,
+            "total_latency_saved_s": self.cache_latency_saved_s,
+        }
+
+    def _cache_lookup(self, key: str, t0: float, coalesced: bool = False) -> Optional[LLMResult]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        saved = float(entry.get("latency_s") or 0.0)
+        with self._inflight_lock:
+            self.cache_hits += 1
+            self.cache_coalesced += int(coalesced)
+            self.cache_latency_saved_s += saved
+            info = self._cache_info(True, saved, coalesced)
+        return LLMResult(text=entry["text"], usage=dict(entry.get("usage") or {}),
+                         latency_s=time.time() - t0, raw=None, cache=info)
+
+    def _cache_store(self, key: str, res: LLMResult) -> LLMResult:
+        self.cache.put(key, cache_entry(res.text, res.usage, res.latency_s))
+        with self._inflight_lock:
+            self.cache_misses += 1
+            res.cache = self._cache_info(False)
+        return res
+
+    # --- llamadas ---
+
+    def _request_kwargs(self, messages: List[Dict[str, str]], temperature: float,
+                        max_tokens: Optional[int], seed: Optional[int], n: int = 1,
+                        response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if seed is not None:
+            kwargs["seed"] = seed
+        if n > 1:
+            kwargs["n"] = n
+        if self._effective_format(response_format) is not None:
+            kwargs["response_format"] = response_format
+        return kwargs
+
+    def _format_rejected(self, kwargs: Dict[str, Any], e: BaseException) -> bool:
+        # servidor sin salida estructurada: se recuerda y se quita de la petición, que se repite sin restricción
+        if "response_format" in kwargs and isinstance(e, BadRequestError):
+            self.structured_supported = False
+            del kwargs["response_format"]
+            return True
+        return False
+
+    def _served(self, ep: Endpoint, res: LLMResult) -> LLMResult:
+        self.endpoints.release(ep, latency_s=res.latency_s)
+        if len(self.endpoints) > 1:
+            res.endpoint = ep.url
+        return res
+
+    def _create_once(self, kwargs: Dict[str, Any]) -> LLMResult:
+        ep = self.endpoints.acquire()
+        try:
+            if self.stream and "n" not in kwargs:
+                return self._served(ep, self._stream_once(ep.client, kwargs))
+
+            t0 = time.time()
+            resp = ep.client.chat.completions.create(**kwargs)
+            latency = time.time() - t0
+        except Exception as e:
+            # solo los fallos del servidor cuentan para expulsarlo (no un 400 de la petición)
+            self.endpoints.release(ep, failed=_retryable(e))
+            raise
+
+        text = resp.choices[0].message.content or ""
+        return self._served(ep, LLMResult(text=text, usage=self._usage_dict(resp), latency_s=latency, raw=resp))
+
+    async def _acreate_once(self, kwargs: Dict[str, Any]) -> LLMResult:
+        ep = self.endpoints.acquire()
+        try:
+            if self.stream and "n" not in kwargs:
+                return self._served(ep, await self._astream_once(ep.aclient, kwargs))
+
+            t0 = time.time()
+            resp = await ep.aclient.chat.completions.create(**kwargs)
+            latency = time.time() - t0
+        except BaseException as e:
+            # también cancelaciones (hedge perdedor): la petición deja de estar en vuelo
+            self.endpoints.release(ep, failed=isinstance(e, Exception) and _retryable(e))
+            raise
+
+        text = resp.choices[0].message.content or ""
+        return self._served(ep, LLMResult(text=text, usage=self._usage_dict(resp), latency_s=latency, raw=resp))
+
+    # --- streaming ---
+
+    def _stream_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(kwargs, stream=True)
+        if self._stream_usage:
+            out["stream_options"] = {"include_usage": True}
+        return out
+
+    def _stream_options_rejected(self, kwargs: Dict[str, Any], e: BadRequestError) -> bool:
+        # un 400 con response_format puede deberse a la salida estructurada (lo trata
+        # _format_rejected); solo se deja de pedir usage si el error es de stream_options
+        if not self._stream_usage:
+            return False
+        if "stream_options" in str(e).lower() or "response_format" not in kwargs:
+            self._stream_usage = False
+            return True
+        return False
+
+    def _stream_state(self, t0: float) -> Dict[str, Any]:
+        return {"scanner": JsonArrayScanner(), "t0": t0, "ttft": None, "t_valid": None,
+                "chunks": 0, "usage": {}}
+
+    def _stream_chunk(self, st: Dict[str, Any], chunk: Any) -> bool:
+        """Procesa un chunk; True si el array de respuesta ya está completo."""
+        if getattr(chunk, "usage", None) is not None:
+            st["usage"] = self._usage_dict(chunk)
+        choices = getattr(chunk, "choices", None) or []
+        delta = getattr(getattr(choices[0], "delta", None), "content", None) if choices else None
+        if not delta:
+            return False
+        if st["ttft"] is None:
+            st["ttft"] = time.time() - st["t0"]
+        st["chunks"] += 1
+        if st["scanner"].feed(delta) is not None:
+            st["t_valid"] = time.time() - st["t0"]
+            return True
+        return False
+
+    def _stream_result(self, st: Dict[str, Any], early_stop: bool) -> LLMResult:
+        scanner: JsonArrayScanner = st["scanner"]
+        text = scanner.text()
+        if early_stop:
+            text = text[: scanner.end]
+        usage = st["usage"]
+        estimated = not usage
+        if estimated:
+            # al cortar el stream no llega el chunk de usage: ~1 token por chunk
+            usage = {"prompt_tokens": 0, "completion_tokens": st["chunks"], "total_tokens": st["chunks"]}
+        res = LLMResult(text=text, usage=usage, latency_s=time.time() - st["t0"], raw=None)
+        res.stream = {
+            "ttft_s": st["ttft"],
+            "time_to_valid_json_s": st["t_valid"],
+            "early_stop": early_stop,
+            "chunks": st["chunks"],
+            "usage_estimated": estimated,
+        }
+        return res
+
+    def _stream_once(self, api: OpenAI, kwargs: Dict[str, Any]) -> LLMResult:
+        t0 = time.time()
+        try:
+            stream = api.chat.completions.create(**self._stream_kwargs(kwargs))
+        except BadRequestError as e:
+            if not self._stream_options_rejected(kwargs, e):
+                raise
+            # servidor sin stream_options: se repite sin pedir usage
+            return self._stream_once(api, kwargs)
+
+        st = self._stream_state(t0)
+        early_stop = False
+        try:
+            for chunk in stream:
+                if self._stream_chunk(st, chunk):
+                    early_stop = True
+                    break
+        finally:
+            stream.close()
+        return self._stream_result(st, early_stop)
+
+    async def _astream_once(self, api: AsyncOpenAI, kwargs: Dict[str, Any]) -> LLMResult:
+        t0 = time.time()
+        try:
+            stream = await api.chat.completions.create(**self._stream_kwargs(kwargs))
+        except BadRequestError as e:
+            if not self._stream_options_rejected(kwargs, e):
+                raise
+            return await self._astream_once(api, kwargs)
+
+        st = self._stream_state(t0)
+        early_stop = False
+        try:
+            async for chunk in stream:
+                if self._stream_chunk(st, chunk):
+                    early_stop = True
+                    break
+        finally:
+            await stream.close()
+        return self._stream_result(st, early_stop)
+
+    # --- reintentos y hedging ---
+
+    def _hedge_threshold(self) -> Optional[float]:
+        if self.hedge_percentile is None or len(self._latencies) < self.hedge_min_samples:
+            return None
+        xs = sorted(self._latencies)
+        return xs[min(len(xs) - 1, int(self.hedge_percentile * len(xs)))]
+
+    def _backoff(self, retry: int) -> float:
+        # full jitter: uniforme en [0, base * 2^retry]
+        return random.uniform(0.0, self.backoff_s * (2 ** retry))
+
+    def _attempt(self, kwargs: Dict[str, Any]) -> Tuple[LLMResult, int, bool]:
+        """Una petición, duplicada si no responde antes del umbral. -> (res, nº peticiones, ganó el hedge)."""
+        thr = self._hedge_threshold()
+        if thr is None:
+            return self._create_once(kwargs), 1, False
+
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+        primary = self._hedge_pool.submit(self._create_once, kwargs)
+        try:
+            return primary.result(timeout=thr), 1, False
+        except FuturesTimeout:
+            pass
+
+        hedge = self._hedge_pool.submit(self._create_once, kwargs)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        other = hedge if first is primary else primary
+        if first.exception() is not None:
+            # la otra petición sigue en vuelo: se usa su resultado (o su error)
+            first, other = other, first
+        # la perdedora sigue hasta terminar en su hilo; su respuesta se descarta
+        return first.result(), 2, first is hedge
+
+    async def _aattempt(self, kwargs: Dict[str, Any]) -> Tuple[LLMResult, int, bool]:
+        thr = self._hedge_threshold()
+        primary = asyncio.ensure_future(self._acreate_once(kwargs))
+        if thr is None:
+            return await primary, 1, False
+
+        done, _ = await asyncio.wait({primary}, timeout=thr)
+        if done:
+            return primary.result(), 1, False
+
+        hedge = asyncio.ensure_future(self._acreate_once(kwargs))
+        done, _ = await asyncio.wait({primary, hedge}, return_when=asyncio.FIRST_COMPLETED)
+        first = done.pop()
+        other = hedge if first is primary else primary
+        if first.exception() is not None:
+            first, other = other, first
+            await asyncio.wait({first})
+        else:
+            other.cancel()
+        return first.result(), 2, first is hedge
+
+    def _limited_attempt(self, kwargs: Dict[str, Any]) -> Tuple[LLMResult, int, bool]:
+        if self.concurrency is None:
+            return self._attempt(kwargs)
+        with self.concurrency.slot() as outcome:
+            try:
+                out = self._attempt(kwargs)
+            except Exception as e:
+                # solo los fallos del servidor hacen bajar el límite
+                outcome["ok"] = not _retryable(e)
+                raise
+            outcome["ok"] = True
+            return out
+
+    async def _alimited_attempt(self, kwargs: Dict[str, Any]) -> Tuple[LLMResult, int, bool]:
+        if self.concurrency is None:
+            return await self._aattempt(kwargs)
+        async with self.concurrency.aslot() as outcome:
+            try:
+                out = await self._aattempt(kwargs)
+            except Exception as e:
+                outcome["ok"] = not _retryable(e)
+                raise
+            outcome["ok"] = True
+            return out
+
+    def _finish_attempts(self, res: LLMResult, t0: float, requests: int, retries: int,
+                         hedged: bool, hedge_won: bool, errors: List[str]) -> LLMResult:
+        res.latency_s = time.time() - t0
+        self._latencies.append(res.latency_s)
+        self._note_prefix(res.usage)
+        res.attempts = {
+            "attempts": requests,
+            "retries": retries,
+            "hedged": hedged,
+            "hedge_won": hedge_won,
+            "errors": errors,
+        }
+        return res
+
+    def _chat_uncached(self, messages: List[Dict[str, str]], temperature: float,
+                       max_tokens: Optional[int], seed: Optional[int], n: int = 1,
+                       response_format: Optional[Dict[str, Any]] = None) -> LLMResult:
+        kwargs = self._request_kwargs(messages, temperature, max_tokens, seed, n, response_format)
+        requests, errors, retry = 0, [], 0
+        t0 = time.time()
+        while True:
+            try:
+                res, sent, hedge_won = self._limited_attempt(kwargs)
+            except Exception as e:
+                requests += 1
+                errors.append(type(e).__name__)
+                if self._format_rejected(kwargs, e):
+                    # repetición sin response_format: no gasta reintento, y la latencia
+                    # y los intentos del registro incluyen la petición rechazada
+                    continue
+                if retry >= self.max_retries or not _retryable(e):
+                    raise
+                time.sleep(self._backoff(retry))
+                retry += 1
+                t0 = time.time()
+                continue
+            return self._finish_attempts(res, t0, requests + sent, retry, sent > 1, hedge_won, errors)
+
+    async def _achat_uncached(self, messages: List[Dict[str, str]], temperature: float,
+                              max_tokens: Optional[int], seed: Optional[int], n: int = 1,
+                              response_format: Optional[Dict[str, Any]] = None) -> LLMResult:
+        kwargs = self._request_kwargs(messages, temperature, max_tokens, seed, n, response_format)
+        requests, errors, retry = 0, [], 0
+        t0 = time.time()
+        while True:
+            try:
+                res, sent, hedge_won = await self._alimited_attempt(kwargs)
+            except Exception as e:
+                requests += 1
+                errors.append(type(e).__name__)
+                if self._format_rejected(kwargs, e):
+                    # repetición sin response_format: no gasta reintento, y la latencia
+                    # y los intentos del registro incluyen la petición rechazada
+                    continue
+                if retry >= self.max_retries or not _retryable(e):
+                    raise
+                await asyncio.sleep(self._backoff(retry))
+                retry += 1
+                t0 = time.time()
+                continue
+            return self._finish_attempts(res, t0, requests + sent, retry, sent > 1, hedge_won, errors)
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        seed: Optional[int] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        res = self._chat_cached(messages, temperature, max_tokens, seed, response_format)
+        return self._tag_structured(res, response_format)
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        seed: Optional[int] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> LLMResult:
+        res = await self._achat_cached(messages, temperature, max_tokens, seed, response_format)
+        return self._tag_structured(res, response_format)
+
+    def _tag_structured(self, res: LLMResult, response_format: Optional[Dict[str, Any]]) -> LLMResult:
+        if response_format is not None:
+            res.structured = self.structured_supported is not False
+        return res
+
+    def _chat_cached(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int],
+                     seed: Optional[int], response_format: Optional[Dict[str, Any]]) -> LLMResult:
+        key = self._cache_key(messages, temperature, max_tokens, seed, response_format)
+        if key is None:
+            return self._chat_uncached(messages, temperature, max_tokens, seed, 1, response_format)
+
+        t0 = time.time()
+        hit = self._cache_lookup(key, t0)
+        if hit is not None:
+            return hit
+
+        # single-flight: la primera petición llama al servidor, las idénticas esperan
+        with self._inflight_lock:
+            ev = self._inflight.get(key)
+            leader = ev is None
+            if leader:
+                ev = self._inflight[key] = threading.Event()
+        if not leader:
+            ev.wait()
+            hit = self._cache_lookup(key, t0, coalesced=True)
+            if hit is not None:
+                return hit
+            return self._cache_store(key, self._chat_uncached(messages, temperature, max_tokens, seed,
+                                                              1, response_format))
+
+        try:
+            return self._cache_store(key, self._chat_uncached(messages, temperature, max_tokens, seed,
+                                                              1, response_format))
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            ev.set()
+
+    async def _achat_cached(self, messages: List[Dict[str, str]], temperature: float, max_tokens: Optional[int],
+                            seed: Optional[int], response_format: Optional[Dict[str, Any]]) -> LLMResult:
+        key = self._cache_key(messages, temperature, max_tokens, seed, response_format)
+        if key is None:
+            return await self._achat_uncached(messages, temperature, max_tokens, seed, 1, response_format)
+
+        t0 = time.time()
+        hit = self._cache_lookup(key, t0)
+        if hit is not None:
+            return hit
+
+        ev = self._ainflight.get(key)
+        if ev is not None:
+            await ev.wait()
+            hit = self._cache_lookup(key, t0, coalesced=True)
+            if hit is not None:
+                return hit
+            return self._cache_store(key, await self._achat_uncached(messages, temperature, max_tokens, seed,
+                                                                     1, response_format))
+
+        ev = self._ainflight[key] = asyncio.Event()
+        try:
+            return self._cache_store(key, await self._achat_uncached(messages, temperature, max_tokens, seed,
+                                                                     1, response_format))
+        finally:
+            self._ainflight.pop(key, None)
+            ev.set()
+
+    # --- varias muestras del mismo prompt ---
+
+    def _split_choices(self, res: LLMResult, n: int) -> List[LLMResult]:
+        """Una LLMResult por choice; el prompt se imputa a la primera y los tokens de completion por longitud."""
+        choices = sorted(getattr(res.raw, "choices", None) or [], key=lambda c: getattr(c, "index", 0) or 0)
+        texts = [(c.message.content or "") for c in choices]
+        total_chars = sum(len(t) for t in texts) or 1
+        completion = res.usage.get("completion_tokens", 0)
+
+        out: List[LLMResult] = []
+        for i, text in enumerate(texts):
+            usage = {
+                "prompt_tokens": res.usage.get("prompt_tokens", 0) if i == 0 else 0,
+                "completion_tokens": round(completion * len(text) / total_chars),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            if i == 0 and "cached_tokens" in res.usage:
+                usage["cached_tokens"] = res.usage["cached_tokens"]
+            out.append(LLMResult(text=text, usage=usage, latency_s=res.latency_s, raw=None,
+                                 attempts=res.attempts, sample={"n": n, "index": i, "batched": True},
+                                 endpoint=res.endpoint))
+        return out
+
+    def _batched_ok(self, n: int, key: Optional[str]) -> bool:
+        # las peticiones deterministas (cacheables) van por chat() para reutilizar la caché
+        return n > 1 and key is None and self.n_supported is not False
+
+    def _note_n(self, results: List[LLMResult], n: int) -> None:
+        # un servidor que ignora n devuelve una sola choice: a partir de ahí, peticiones sueltas
+        self.n_supported = len(results) >= n
+
+    @staticmethod
+    def _tag_samples(results: List[LLMResult], n: int, start: int) -> List[LLMResult]:
+        for i, res in enumerate(results, start):
+            res.sample = {"n": n, "index": i, "batched": False}
+        return results
+
+    def chat_n(
+        self,
+        messages: List[Dict[str, str]],
+        n: int,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        seed: Optional[int] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> List[LLMResult]:
+        """
+        n muestras independientes del mismo prompt: una sola petición con `n` choices
+        si el servidor lo admite; si no (o si devuelve menos), peticiones sueltas concurrentes.
+        """
+        if n <= 1:
+            return [self.chat(messages, temperature, max_tokens, seed, response_format)]
+        results: List[LLMResult] = []
+        if self._batched_ok(n, self._cache_key(messages, temperature, max_tokens, seed, response_format)):
+            try:
+                results = self._split_choices(
+                    self._chat_uncached(messages, temperature, max_tokens, seed, n, response_format), n)
+                self._note_n(results, n)
+                if not self.n_supported:
+                    self._tag_samples(results, n, 0)
+                for res in results:
+                    self._tag_structured(res, response_format)
+            except BadRequestError:
+                self.n_supported = False
+        missing = n - len(results)
+        if missing <= 0:
+            return results[:n]
+
+        if self._sample_pool is None:
+            self._sample_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-sample")
+        futures = [self._sample_pool.submit(self.chat, messages, temperature, max_tokens, seed, response_format)
+                   for _ in range(missing)]
+        return results + self._tag_samples([f.result() for f in futures], n, len(results))
+
+    async def achat_n(
+        self,
+        messages: List[Dict[str, str]],
+        n: int,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        seed: Optional[int] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> List[LLMResult]:
+        if n <= 1:
+            return [await self.achat(messages, temperature, max_tokens, seed, response_format)]
+        results: List[LLMResult] = []
+        if self._batched_ok(n, self._cache_key(messages, temperature, max_tokens, seed, response_format)):
+            try:
+                results = self._split_choices(
+                    await self._achat_uncached(messages, temperature, max_tokens, seed, n, response_format), n)
+                self._note_n(results, n)
+                if not self.n_supported:
+                    self._tag_samples(results, n, 0)
+                for res in results:
+                    self._tag_structured(res, response_format)
+            except BadRequestError:
+                self.n_supported = False
+        missing = n - len(results)
+        if missing <= 0:
+            return results[:n]
 
-        return LLMResult(text=text, usage=usage, latency_s=latency, raw=resp)
\ No newline at end of file
+        extra = await asyncio.gather(*(self.achat(messages, temperature, max_tokens, seed, response_format) for _ in range(missing)))
+        return results + self._tag_samples(list(extra), n, len(results))
@@ -0,0 +1,167 @@
+# /src/llm/concurrency.py
+import asyncio
+import statistics
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+
+class AdaptiveConcurrency:
+    """
+    Límite de peticiones LLM en vuelo ajustado por ventanas (AIMD con gradiente
+    de throughput). Cada ventana termina tras `limit` respuestas (mínimo
+    `min_window`) y decide:
+      - errores, o latencia p50 sobre `target_latency_s` o sobre `spike_factor`
+        veces la mejor p50 vista -> limit * decrease (multiplicativo);
+      - throughput mejor que la ventana anterior (> tolerance) -> limit + 1;
+      - peor tras haber subido -> limit - 1 (el servidor ya no escala);
+      - estable -> se mantiene, y tras `probe_after` ventanas se prueba limit + 1.
+    El nivel elegido y la curva (límite, throughput, p50 por ventana) van al _meta.json.
+    """
+
+    def __init__(self, initial: int = 2, min_limit: int = 1, max_limit: int = 32,
+                 target_latency_s: Optional[float] = None, spike_factor: float = 2.0,
+                 decrease: float = 0.7, tolerance: float = 0.05, min_window: int = 4, probe_after: int = 3):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.initial = min(max(initial, self.min_limit), self.max_limit)
+        self.limit = self.initial
+        self.target_latency_s = target_latency_s
+        self.spike_factor = spike_factor
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.min_window = min_window
+        self.probe_after = probe_after
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._acond: Optional[asyncio.Condition] = None
+
+        self._t_start = time.time()
+        self._window_start = self._t_start
+        self._latencies: List[float] = []
+        self._errors = 0
+        self._prev_throughput: Optional[float] = None
+        self._prev_limit = self.limit
+        self._baseline: Optional[float] = None
+        self._holds = 0
+        self.curve: List[Dict[str, Any]] = []
+
+    # --- huecos ---
+
+    @contextmanager
+    def slot(self) -> Iterator[Dict[str, Any]]:
+        """Hueco síncrono; quien llama pone outcome["ok"] = True si la petición fue bien."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self._enter()
+        outcome: Dict[str, Any] = {"ok": False}
+        t0 = time.time()
+        try:
+            yield outcome
+        finally:
+            with self._cond:
+                self._leave(time.time() - t0, outcome["ok"])
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[Dict[str, Any]]:
+        if self._acond is None:
+            self._acond = asyncio.Condition()
+        async with self._acond:
+            await self._acond.wait_for(lambda: self.in_flight < self.limit)
+            with self._lock:
+                self._enter()
+        outcome: Dict[str, Any] = {"ok": False}
+        t0 = time.time()
+        try:
+            yield outcome
+        finally:
+            async with self._acond:
+                with self._lock:
+                    self._leave(time.time() - t0, outcome["ok"])
+                self._acond.notify_all()
+
+    def _enter(self) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _leave(self, latency_s: float, ok: bool) -> None:
+        self.in_flight -= 1
+        if ok:
+            self._latencies.append(latency_s)
+        else:
+            self._errors += 1
+        if len(self._latencies) + self._errors >= max(self.limit, self.min_window):
+            self._adjust()
+
+    # --- control ---
+
+    def _adjust(self) -> None:
+        now = time.time()
+        n = len(self._latencies)
+        duration = max(now - self._window_start, 1e-9)
+        throughput = n / duration
+        p50 = statistics.median(self._latencies) if n else None
+        limit = self.limit
+
+        if self._errors:
+            action = "errors"
+            new = int(limit * self.decrease)
+        elif p50 is not None and ((self.target_latency_s is not None and p50 > self.target_latency_s)
+                                  or (self._baseline is not None and p50 > self.spike_factor * self._baseline)):
+            action = "latency"
+            new = int(limit * self.decrease)
+        elif self._prev_throughput is None or throughput > self._prev_throughput * (1 + self.tolerance):
+            action = "increase"
+            new = limit + 1
+        elif throughput < self._prev_throughput * (1 - self.tolerance) and limit > self._prev_limit:
+            action = "revert"
+            new = limit - 1
+        else:
+            self._holds += 1
+            action = "hold"
+            new = limit
+            if self._holds >= self.probe_after:
+                action, new = "probe", limit + 1
+        if action != "hold":
+            self._holds = 0
+
+        if not self._errors and p50 is not None:
+            self._baseline = p50 if self._baseline is None else min(self._baseline, p50)
+
+        self.curve.append({
+            "t_s": round(now - self._t_start, 3),
+            "limit": limit,
+            "throughput_rps": throughput,
+            "p50_latency_s": p50,
+            "errors": self._errors,
+            "action": action,
+        })
+        self._prev_throughput = throughput
+        self._prev_limit = limit
+        self.limit = min(self.max_limit, max(self.min_limit, new))
+        self._window_start = now
+        self._latencies = []
+        self._errors = 0
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            # nivel elegido: la ventana de mayor throughput sin errores ni latencia excesiva
+            clean = [w for w in self.curve if w["action"] not in ("errors", "latency")]
+            best = max(clean, key=lambda w: w["throughput_rps"], default=None)
+            return {
+                "initial": self.initial,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "target_latency_s": self.target_latency_s,
+                "final_limit": self.limit,
+                "best_limit": best["limit"] if best else None,
+                "best_throughput_rps": best["throughput_rps"] if best else None,
+                "max_in_flight": self.max_in_flight,
+                "windows": len(self.curve),
+                "curve": self.curve,
+            }
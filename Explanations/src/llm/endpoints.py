@@ -0,0 +1,158 @@
+# /src/llm/endpoints.py
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from openai import AsyncOpenAI, OpenAI
+
+ROUTING_POLICIES = ("least_outstanding", "latency")
+
+
+class Endpoint:
+    """Un servidor compatible con OpenAI del pool, con su estado de carga y salud."""
+
+    def __init__(self, url: str, api_key: str, timeout_s: Optional[float]):
+        self.url = url
+        self.api_key = api_key
+        self.timeout_s = timeout_s
+        # los reintentos los gestiona el cliente (max_retries=0 en el SDK)
+        self.client = OpenAI(base_url=url, api_key=api_key, timeout=timeout_s, max_retries=0)
+        self._aclient: Optional[AsyncOpenAI] = None
+
+        self.outstanding = 0
+        self.ewma_latency_s: Optional[float] = None
+        self.failures = 0            # fallos consecutivos
+        self.last_failure = 0.0
+        self.ejected_until = 0.0     # 0 = en servicio
+        self.probing = False
+
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        if self._aclient is None:
+            self._aclient = AsyncOpenAI(base_url=self.url, api_key=self.api_key,
+                                        timeout=self.timeout_s, max_retries=0)
+        return self._aclient
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "ewma_latency_s": self.ewma_latency_s,
+            "ejected": self.ejected_until > 0,
+        }
+
+
+class EndpointPool:
+    """
+    Reparte las peticiones entre varios servidores locales. Con
+    policy="least_outstanding" va al de menos peticiones en vuelo; con
+    "latency" al de menor tiempo esperado ((en vuelo + 1) * latencia media
+    móvil). Tras `fail_threshold` fallos consecutivos (conexión, timeout, 5xx)
+    un endpoint se expulsa `eject_s` segundos; al vencer se comprueba en
+    segundo plano con GET /models y vuelve al pool si responde. Si todos están
+    expulsados se usa el que antes vuelve, para no dejar de intentar.
+    """
+
+    def __init__(self, urls: List[str], api_key: str, timeout_s: Optional[float] = None,
+                 policy: str = "least_outstanding", fail_threshold: int = 3, eject_s: float = 30.0,
+                 health_timeout_s: float = 2.0, ewma_alpha: float = 0.2):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one URL")
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy}")
+        self.endpoints = [Endpoint(u, api_key, timeout_s) for u in urls]
+        self.policy = policy
+        self.fail_threshold = fail_threshold
+        self.eject_s = eject_s
+        self.health_timeout_s = health_timeout_s
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def urls(self) -> List[str]:
+        return [ep.url for ep in self.endpoints]
+
+    def _cost(self, ep: Endpoint) -> float:
+        if self.policy == "latency":
+            # sin muestras aún: coste 0 para que reciba tráfico y se mida
+            return (ep.outstanding + 1) * (ep.ewma_latency_s or 0.0)
+        return float(ep.outstanding)
+
+    def acquire(self) -> Endpoint:
+        now = time.time()
+        with self._lock:
+            healthy = [ep for ep in self.endpoints if not ep.ejected_until]
+            for ep in self.endpoints:
+                if ep.ejected_until and ep.ejected_until <= now and not ep.probing:
+                    ep.probing = True
+                    threading.Thread(target=self._probe, args=(ep,), daemon=True,
+                                     name="llm-health").start()
+            if healthy:
+                # los que han fallado hace menos de eject_s van detrás (un reintento prueba otro
+                # servidor); empate: el que menos peticiones ha servido (turno rotatorio)
+                ep = min(healthy, key=lambda e: (e.failures > 0 and now - e.last_failure < self.eject_s,
+                                                 self._cost(e), e.requests, self.endpoints.index(e)))
+            else:
+                ep = min(self.endpoints, key=lambda e: e.ejected_until)
+            ep.outstanding += 1
+            ep.requests += 1
+            return ep
+
+    def release(self, ep: Endpoint, latency_s: Optional[float] = None, failed: bool = False) -> None:
+        with self._lock:
+            ep.outstanding -= 1
+            if failed:
+                ep.errors += 1
+                ep.failures += 1
+                ep.last_failure = time.time()
+                if ep.failures >= self.fail_threshold and not ep.ejected_until and len(self.endpoints) > 1:
+                    ep.ejected_until = time.time() + self.eject_s
+                    ep.ejections += 1
+                return
+            ep.failures = 0
+            ep.ejected_until = 0.0
+            if latency_s is not None:
+                a = self.ewma_alpha
+                ep.ewma_latency_s = latency_s if ep.ewma_latency_s is None else (1 - a) * ep.ewma_latency_s + a * latency_s
+
+    def healthy(self, ep: Endpoint) -> bool:
+        try:
+            ep.client.with_options(timeout=self.health_timeout_s).models.list()
+            return True
+        except Exception:
+            return False
+
+    def _probe(self, ep: Endpoint) -> None:
+        ok = self.healthy(ep)
+        with self._lock:
+            ep.probing = False
+            if ok:
+                ep.failures = 0
+                ep.ejected_until = 0.0
+            else:
+                ep.ejected_until = time.time() + self.eject_s
+
+    def check_all(self) -> Dict[str, bool]:
+        """Comprobación inicial: los endpoints que no responden empiezan expulsados."""
+        out: Dict[str, bool] = {}
+        for ep in self.endpoints:
+            ok = self.healthy(ep)
+            out[ep.url] = ok
+            if not ok:
+                with self._lock:
+                    ep.ejected_until = time.time() + self.eject_s
+                    ep.ejections += 1
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"policy": self.policy, "endpoints": [ep.stats() for ep in self.endpoints]}
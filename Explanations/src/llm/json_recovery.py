@@ -0,0 +1,118 @@
+# /src/llm/json_recovery.py
+import json
+from typing import Any, List, Optional, Tuple
+
+_DECODER = json.JSONDecoder()
+
+
+def _strip(txt: str, comments: bool) -> Tuple[str, List[str]]:
+    """Quita, fuera de cadenas, los comentarios // y /* */ (comments=True) o las comas finales antes de ] o }."""
+    out: List[str] = []
+    repairs: List[str] = []
+    i, n = 0, len(txt)
+    in_str = escape = False
+    while i < n:
+        ch = txt[i]
+        if in_str:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_str = False
+            i += 1
+            continue
+        if ch == '"':
+            in_str = True
+        elif comments and txt.startswith("//", i):
+            end = txt.find("\n", i)
+            i = n if end < 0 else end
+            repairs = ["comments"]
+            continue
+        elif comments and txt.startswith("/*", i):
+            end = txt.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            repairs = ["comments"]
+            continue
+        elif not comments and ch == ",":
+            j = i + 1
+            while j < n and txt[j] in " \t\r\n":
+                j += 1
+            if j < n and txt[j] in "]}":
+                repairs = ["trailing_commas"]
+                i += 1
+                continue
+        out.append(ch)
+        i += 1
+    return "".join(out), repairs
+
+
+def _clean(txt: str) -> Tuple[str, List[str]]:
+    # las comas se buscan tras quitar los comentarios: en "x, // nota\n]" la coma queda final
+    txt, repairs = _strip(txt, comments=True)
+    txt, commas = _strip(txt, comments=False)
+    return txt, repairs + commas
+
+
+def loads_tolerant(txt: str) -> Tuple[Any, List[str]]:
+    """
+    json.loads que recupera los fallos habituales de salida de un LLM y devuelve
+    (datos, reparaciones). Si el texto es JSON válido no se toca (reparaciones
+    vacías). Si no: se quitan comentarios y comas finales, se ignora el texto
+    antes del primer '[' y después del array, y si el array está truncado se
+    conservan los elementos completos ("truncated"). Si no se salva nada se
+    relanza el error original de json.loads.
+    """
+    try:
+        return json.loads(txt), []
+    except ValueError as e:
+        original = e
+
+    cleaned, repairs = _clean(txt)
+    if repairs:
+        try:
+            return json.loads(cleaned), repairs
+        except ValueError:
+            pass
+
+    start = cleaned.find("[")
+    if start < 0:
+        raise original
+    if cleaned[:start].strip():
+        repairs.append("leading_text")
+
+    try:
+        data, end = _DECODER.raw_decode(cleaned, start)
+        if cleaned[end:].strip():
+            repairs.append("trailing_text")
+        return data, repairs
+    except ValueError:
+        pass
+
+    # array incompleto: se decodifican los elementos uno a uno hasta el primero que falla
+    items: List[Any] = []
+    pos = start + 1
+    while True:
+        while pos < len(cleaned) and cleaned[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(cleaned) or cleaned[pos] == "]":
+            break
+        try:
+            item, pos = _DECODER.raw_decode(cleaned, pos)
+        except ValueError:
+            break
+        items.append(item)
+    if not items:
+        raise original
+    # se llegó al ']' de cierre: el fallo era de separadores entre elementos, no de truncado
+    closed = pos < len(cleaned) and cleaned[pos] == "]"
+    repairs.append("separators" if closed else "truncated")
+    return items, repairs
+
+
+def salvaged_items(data: Any, repairs: List[str]) -> Optional[List[Any]]:
+    """Elementos completos de un array recuperado de una salida truncada (None si no hubo truncado)."""
+    if "truncated" in repairs and isinstance(data, list):
+        return data
+    return None
@@ -0,0 +1,116 @@
+# /src/llm/response_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    Caché en disco de respuestas del LLM, direccionada por contenido: la clave
+    es el hash de (model, messages, temperature, max_tokens, seed). Cada entrada
+    es un fichero JSON; el índice LRU se reconstruye al abrir (por mtime) y se
+    expulsan las entradas menos usadas cuando se supera max_bytes.
+    Es thread-safe; la coalescencia de peticiones concurrentes la hace el cliente.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.reload()
+
+    def reload(self) -> None:
+        """Reconstruye el índice desde disco (p. ej. tras escribir en él otros procesos)."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    try:
+                        st = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, name[: -len(".json")], st.st_size))
+        with self._lock:
+            self._index.clear()
+            self.total_bytes = 0
+            for _, key, size in sorted(entries):
+                self._index[key] = size
+                self.total_bytes += size
+
+    @staticmethod
+    def make_key(model: Optional[str], messages: List[Dict[str, str]], temperature: float,
+                 max_tokens: Optional[int], seed: Optional[int],
+                 response_format: Optional[Dict[str, Any]] = None) -> str:
+        req: Dict[str, Any] = {"model": model, "messages": messages, "temperature": temperature,
+                               "max_tokens": max_tokens, "seed": seed}
+        if response_format is not None:
+            # solo si hay restricción, para no invalidar las claves ya guardadas
+            req["response_format"] = response_format
+        blob = json.dumps(req, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._index:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.total_bytes -= self._index.pop(key)
+                return None
+            self._index.move_to_end(key)
+        try:
+            # el mtime hace de marca LRU entre procesos/reaperturas
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                old, size = self._index.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+def cache_entry(text: str, usage: Dict[str, int], latency_s: float) -> Dict[str, Any]:
+    return {"text": text, "usage": usage, "latency_s": latency_s, "created_at": time.time()}
@@ -0,0 +1,385 @@
+# /src/llm/standin_server.py
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Servidor local compatible con /v1/chat/completions para medir el runner sin modelo:
+# - mode="replay": devuelve raw_text/usage de resultados ya guardados (results/*/*/*.jsonl)
+# - mode="synth": genera respuestas válidas a partir de las listas "Allowed ..." del prompt
+
+
+@dataclass
+class LatencyModel:
+    """
+    Latencia = tiempo hasta el primer token (lognormal, mediana ttft_ms) +
+    tokens de completion / tokens_per_s (normal, truncada a >= 1 tok/s).
+    Con prefill_tokens_per_s > 0 el TTFT suma además el prefill de los tokens
+    de prompt que no están en la caché de prefijos.
+    """
+    ttft_ms: float = 150.0
+    ttft_sigma: float = 0.3
+    tokens_per_s: float = 40.0
+    tokens_per_s_std: float = 5.0
+    time_scale: float = 1.0
+    prefill_tokens_per_s: float = 0.0
+
+    def sample(self, rng: random.Random, completion_tokens: int,
+               uncached_prompt_tokens: int = 0) -> Tuple[float, float]:
+        ttft = self.ttft_ms / 1000.0 * math.exp(rng.gauss(0.0, self.ttft_sigma))
+        if self.prefill_tokens_per_s > 0:
+            ttft += uncached_prompt_tokens / self.prefill_tokens_per_s
+        rate = max(1.0, rng.gauss(self.tokens_per_s, self.tokens_per_s_std))
+        return ttft * self.time_scale, (completion_tokens / rate) * self.time_scale
+
+
+def detect_config(prompt: str) -> str:
+    """Configuración que generó el prompt (según las secciones que contiene)."""
+    if "EventType class catalog" in prompt or "Allowed EventType classes" in prompt:
+        return "C3"
+    if "Retrieved context triples" in prompt:
+        return "C2"
+    if "proposed_triples" in prompt:
+        return "C1"
+    return "C0"
+
+
+def _section(prompt: str, heading: str) -> List[str]:
+    """Elementos '- X' que siguen a la primera línea que contiene `heading`."""
+    lines = prompt.splitlines()
+    for i, line in enumerate(lines):
+        if heading in line:
+            out: List[str] = []
+            for nxt in lines[i + 1:]:
+                nxt = nxt.strip()
+                if not nxt.startswith("- "):
+                    if out or nxt:
+                        break
+                    continue
+                out.append(nxt[2:].split(":", 1)[0].strip())
+            return out
+    return []
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    # búsqueda binaria sobre comparaciones de slices (en C) en lugar de carácter a carácter
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+_RETRACT_RE = re.compile(r"retracted triple:\s*\(([^,]+),\s*([^,]+),\s*([^)]+)\)")
+
+
+def synthesise_answer(prompt: str, rng: random.Random) -> str:
+    """3 hipótesis con el esquema del prompt, usando solo vocabulario permitido."""
+    m = _RETRACT_RE.search(prompt)
+    s, _, o = (x.strip() for x in m.groups()) if m else ("Entity1", "p", "Entity2")
+
+    entities = _section(prompt, "Allowed entities") or [s, o]
+    classes = (_section(prompt, "Allowed EventType classes") or _section(prompt, "Allowed event classes")
+               or ["MovedToDifferentLocation"])
+    props = _section(prompt, "Allowed object properties") or ["hasParticipant"]
+
+    shadow = "Agent_Shadow"
+    out: List[Dict[str, Any]] = []
+    for i in (1, 2, 3):
+        cls = rng.choice(classes)
+        participants = [e for e in dict.fromkeys([shadow, s]) if e in entities or e == shadow]
+        where = o if o in entities else rng.choice(entities)
+        if '"proposed_triples"' in prompt:
+            eid = f"{cls}_H{i}"
+            prop = next((p for p in ("affects", "hasParticipant", "isExecutedIn") if p in props), rng.choice(props))
+            out.append({
+                "title": f"Hypothesis {i}: {cls}",
+                "event_class": cls,
+                "event_id": eid,
+                "participants": participants,
+                "where": where,
+                "proposed_triples": [[eid, prop, s], [eid, prop, o]],
+            })
+        else:
+            out.append({"title": f"Hypothesis {i}", "event_type": cls, "participants": participants, "where": where})
+    return json.dumps(out, ensure_ascii=False, indent=2)
+
+
+class StandinBackend:
+    """
+    Elige/genera la respuesta y su latencia de forma determinista por (seed, prompt, nº de repetición).
+    Emula la caché de prefijos de vLLM/llama.cpp: el prefijo común más largo con los últimos
+    `prefix_cache_entries` prompts (en bloques de `prefix_block` tokens) se informa como
+    usage.prompt_tokens_details.cached_tokens. Con supports_n=False ignora el parámetro n
+    (como algunos servidores locales) y devuelve una sola choice; con supports_structured=False
+    rechaza con 400 las peticiones con response_format.
+    """
+
+    def __init__(self, mode: str = "replay", results_dir: str = "results", config: Optional[str] = None,
+                 latency: Optional[LatencyModel] = None, seed: int = 0, only_valid: bool = False,
+                 prefix_cache_entries: int = 64, prefix_block: int = 16, supports_n: bool = True,
+                 supports_structured: bool = True):
+        if mode not in ("replay", "synth"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.mode = mode
+        self.config = config
+        self.latency = latency or LatencyModel()
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._repeats: Dict[str, int] = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prefix_block = prefix_block
+        self.supports_n = supports_n
+        self.supports_structured = supports_structured
+        self.structured_requests = 0
+        self._prefixes: Deque[str] = deque(maxlen=max(0, prefix_cache_entries))
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+        self.pools: Dict[str, List[Dict[str, Any]]] = {}
+        if mode == "replay":
+            for path in sorted(glob.glob(os.path.join(results_dir, "*", "*", "*.jsonl"))):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            rec = json.loads(line)
+                        except ValueError:
+                            continue
+                        if not rec.get("raw_text") or (only_valid and not rec.get("ok_schema")):
+                            continue
+                        self.pools.setdefault(rec.get("config") or "C0", []).append(
+                            {"text": rec["raw_text"], "usage": rec.get("usage") or {}}
+                        )
+            if not self.pools:
+                raise RuntimeError(f"No replayable records under {results_dir}")
+
+    def _rng(self, messages: List[Dict[str, Any]]) -> random.Random:
+        key = hashlib.sha1(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            n = self._repeats.get(key, 0)
+            self._repeats[key] = n + 1
+        return random.Random(f"{self.seed}:{key}:{n}")
+
+    def _cached_tokens(self, prompt: str) -> Optional[int]:
+        if self._prefixes.maxlen == 0:
+            return None
+        with self._lock:
+            seen = list(self._prefixes)
+            self._prefixes.append(prompt)
+        best = max((_common_prefix_len(prompt, prev) for prev in seen), default=0)
+        # ~4 caracteres por token, redondeado a bloques completos de la KV-cache
+        return (best // 4) // self.prefix_block * self.prefix_block
+
+    def answer(self, messages: List[Dict[str, Any]], max_tokens: Optional[int], first: bool = True) -> Dict[str, Any]:
+        """Una choice; con first=False es una choice adicional de la misma petición (sin prefill propio)."""
+        rng = self._rng(messages)
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        config = self.config or detect_config(prompt)
+
+        if self.mode == "replay":
+            pool = self.pools.get(config) or [r for p in self.pools.values() for r in p]
+            rec = rng.choice(pool)
+            text, usage = rec["text"], dict(rec["usage"])
+        else:
+            text = synthesise_answer(prompt, rng)
+            usage = {}
+        completion = int(usage.get("completion_tokens") or max(1, len(text) // 4))
+        prompt_tokens = int(usage.get("prompt_tokens") or max(1, len(prompt) // 4))
+
+        finish = "stop"
+        if max_tokens and completion > max_tokens:
+            # se trunca como lo haría el modelo (aprox. 4 caracteres por token)
+            text = text[: max_tokens * 4]
+            completion = max_tokens
+            finish = "length"
+
+        cached = self._cached_tokens(prompt) if first else None
+        if cached is not None:
+            cached = min(cached, prompt_tokens)
+            with self._lock:
+                self.prompt_tokens += prompt_tokens
+                self.cached_tokens += cached
+
+        ttft, gen = self.latency.sample(rng, completion, (prompt_tokens - (cached or 0)) if first else 0)
+        usage: Dict[str, Any] = {"prompt_tokens": prompt_tokens, "completion_tokens": completion,
+                                 "total_tokens": prompt_tokens + completion}
+        if cached is not None:
+            usage["prompt_tokens_details"] = {"cached_tokens": cached}
+        return {
+            "text": text,
+            "finish_reason": finish,
+            "usage": usage,
+            "ttft_s": ttft,
+            "gen_s": gen,
+            "config": config,
+        }
+
+    def enter(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "structured_requests": self.structured_requests,
+                "pools": {k: len(v) for k, v in self.pools.items()},
+            }
+
+
+def _completion_body(model: str, answers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # el prompt se procesa una vez; los tokens de completion son la suma de las choices
+    usage = dict(answers[0]["usage"])
+    usage["completion_tokens"] = sum(a["usage"]["completion_tokens"] for a in answers)
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    return {
+        "id": f"chatcmpl-standin-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": i, "message": {"role": "assistant", "content": a["text"]},
+                     "finish_reason": a["finish_reason"]} for i, a in enumerate(answers)],
+        "usage": usage,
+    }
+
+
+def _chunk(model: str, delta: Dict[str, Any], finish: Optional[str] = None,
+           usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "id": "chatcmpl-standin",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage is not None else [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }
+    if usage is not None:
+        out["usage"] = usage
+    return out
+
+
+def make_handler(backend: StandinBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _json(self, code: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/").endswith("/models"):
+                self._json(200, {"object": "list", "data": [{"id": "standin", "object": "model"}]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                self._json(200, backend.stats())
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self) -> None:
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            model = body.get("model") or "standin"
+
+            if body.get("response_format"):
+                if not backend.supports_structured:
+                    self._json(400, {"error": {"message": "response_format is not supported",
+                                               "type": "invalid_request_error"}})
+                    return
+                # las respuestas sintéticas ya siguen el esquema; solo se cuenta
+                with backend._lock:
+                    backend.structured_requests += 1
+
+            n = max(1, int(body.get("n") or 1)) if backend.supports_n else 1
+            backend.enter()
+            try:
+                messages = body.get("messages") or []
+                ans = backend.answer(messages, body.get("max_tokens"))
+                if body.get("stream"):
+                    self._stream(model, ans, bool((body.get("stream_options") or {}).get("include_usage")))
+                else:
+                    answers = [ans] + [backend.answer(messages, body.get("max_tokens"), first=False)
+                                       for _ in range(n - 1)]
+                    # las choices se generan en paralelo (batch): cuenta la más lenta
+                    time.sleep(ans["ttft_s"] + max(a["gen_s"] for a in answers))
+                    self._json(200, _completion_body(model, answers))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                backend.leave()
+
+        def _stream(self, model: str, ans: Dict[str, Any], include_usage: bool) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(payload: str) -> None:
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            text = ans["text"]
+            n_tokens = max(1, ans["usage"]["completion_tokens"])
+            step = max(1, math.ceil(len(text) / n_tokens))
+            per_token = ans["gen_s"] / n_tokens
+
+            time.sleep(ans["ttft_s"])
+            send(json.dumps(_chunk(model, {"role": "assistant", "content": ""})))
+            for i in range(0, len(text), step):
+                send(json.dumps(_chunk(model, {"content": text[i:i + step]})))
+                time.sleep(per_token)
+            send(json.dumps(_chunk(model, {}, finish=ans["finish_reason"])))
+            if include_usage:
+                send(json.dumps(_chunk(model, {}, usage=ans["usage"])))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8089, backend: Optional[StandinBackend] = None) -> ThreadingHTTPServer:
+    """Crea el servidor (llamar a .serve_forever(), o usar serve_in_thread)."""
+    server = ThreadingHTTPServer((host, port), make_handler(backend or StandinBackend()))
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_thread(host: str = "127.0.0.1", port: int = 0,
+                    backend: Optional[StandinBackend] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """Arranca el servidor en un hilo; devuelve (server, base_url) para LOCAL_OPENAI_BASE_URL."""
+    server = serve(host, port, backend)
+    threading.Thread(target=server.serve_forever, name="standin-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
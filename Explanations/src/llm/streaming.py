@@ -0,0 +1,74 @@
+# /src/llm/streaming.py
+import json
+from typing import Any, Optional
+
+
+class JsonArrayScanner:
+    """
+    Detecta de forma incremental el cierre del primer array JSON de nivel
+    superior en un texto que llega por trozos (p. ej. tokens de un stream).
+    Lleva la cuenta de [ ] { } fuera de cadenas (con escapes), así que cada
+    trozo se procesa una sola vez. El texto previo (```json, explicaciones) se
+    ignora hasta el primer '[' fuera de un objeto.
+    """
+
+    def __init__(self):
+        self.buf: list = []
+        self.pos = 0          # caracteres ya examinados
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None  # índice exclusivo tras el ']' de cierre
+        self._depth = 0
+        self._outer = 0
+        self._in_str = False
+        self._escape = False
+
+    def text(self) -> str:
+        return "".join(self.buf)
+
+    def feed(self, chunk: str) -> Optional[int]:
+        """Añade un trozo; devuelve `end` cuando el array se ha cerrado y es JSON válido."""
+        if self.end is not None:
+            return self.end
+        self.buf.append(chunk)
+        for ch in chunk:
+            i = self.pos
+            self.pos += 1
+            if self.start is None:
+                # antes del array solo se siguen las llaves: un '[' dentro de un
+                # objeto previo no es el array de nivel superior
+                if ch == "{":
+                    self._outer += 1
+                elif ch == "}":
+                    self._outer = max(0, self._outer - 1)
+                elif ch == "[" and self._outer == 0:
+                    self.start = i
+                    self._depth = 1
+                continue
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._valid(i + 1):
+                        self.end = i + 1
+                        return self.end
+                    # no era el array de respuesta: se busca el siguiente '['
+                    self.start = None
+        return None
+
+    def _valid(self, end: int) -> bool:
+        try:
+            data: Any = json.loads(self.text()[self.start:end])
+        except ValueError:
+            return False
+        return isinstance(data, list)
@@ -0,0 +1,90 @@
+# /src/llm/structured.py
+from typing import Any, Dict, Iterable, List, Optional
+
+# Esquemas JSON para salida estructurada (response_format de tipo json_schema en
+# vLLM / llama.cpp / servidores compatibles con OpenAI). Se construyen a partir del
+# vocabulario permitido, así que el servidor solo puede generar clases, entidades
+# y propiedades válidas. Lo que JSON Schema no puede relacionar (event_id con su
+# event_class, sujeto de los triples = event_id) lo sigue comprobando compute_vocab_flags.
+
+
+def _enum(values: Iterable[str]) -> Dict[str, Any]:
+    return {"enum": sorted(set(values))}
+
+
+def event_ids(event_classes: Iterable[str]) -> List[str]:
+    return [f"{c}_H{i}" for c in sorted(set(event_classes)) for i in (1, 2, 3)]
+
+
+def hypothesis_schema(
+    event_classes: Iterable[str],
+    entities: Iterable[str],
+    obj_props: Iterable[str],
+    shadow: Optional[str] = None,
+    min_triples: int = 1,
+    max_triples: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Una hipótesis de C1–C3 (event_class, event_id, participants, where, proposed_triples)."""
+    entities = sorted(set(entities))
+    ids = event_ids(event_classes)
+
+    participants: Dict[str, Any] = {"type": "array", "items": _enum(entities), "minItems": 1}
+    if shadow:
+        # el participante obligatorio va primero (prefixItems lo admiten los conversores a gramática)
+        participants["prefixItems"] = [{"const": shadow}]
+
+    triples: Dict[str, Any] = {
+        "type": "array",
+        "items": {
+            "type": "array",
+            "prefixItems": [_enum(ids), _enum(obj_props), _enum(entities)],
+            "items": False,
+            "minItems": 3,
+            "maxItems": 3,
+        },
+        "minItems": min_triples,
+    }
+    if max_triples is not None:
+        triples["maxItems"] = max_triples
+
+    return {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "event_class": _enum(event_classes),
+            "event_id": _enum(ids),
+            "participants": participants,
+            "where": _enum(entities),
+            "proposed_triples": triples,
+        },
+        "required": ["title", "event_class", "event_id", "participants", "where", "proposed_triples"],
+        "additionalProperties": False,
+    }
+
+
+def hypotheses_schema(item: Dict[str, Any], n: int = 3,
+                      preferred_item: Optional[Dict[str, Any]] = None, n_preferred: int = 0) -> Dict[str, Any]:
+    """Array de exactamente n hipótesis; las n_preferred primeras con preferred_item (p. ej. cobertura TMO)."""
+    schema: Dict[str, Any] = {"type": "array", "items": item, "minItems": n, "maxItems": n}
+    if preferred_item is not None and n_preferred > 0:
+        schema["prefixItems"] = [preferred_item] * n_preferred
+    return schema
+
+
+def c0_schema() -> Dict[str, Any]:
+    item = {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "event_type": {"type": "string"},
+            "participants": {"type": "array", "items": {"type": "string"}, "minItems": 1, "maxItems": 2},
+            "where": {"type": "string"},
+        },
+        "required": ["title", "event_type", "participants", "where"],
+        "additionalProperties": False,
+    }
+    return hypotheses_schema(item)
+
+
+def response_format(schema: Dict[str, Any], name: str = "hypotheses") -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
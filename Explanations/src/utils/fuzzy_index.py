@@ -0,0 +1,89 @@
+# /src/utils/fuzzy_index.py
+import difflib
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(name: str) -> str:
+    """Clave de comparación: sin prefijo de ontología (SOMA., DUL.), minúsculas y solo alfanuméricos."""
+    local = name.strip().rsplit(".", 1)[-1].rsplit("#", 1)[-1]
+    return _NON_ALNUM.sub("", local.lower())
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    """
+    Índice de trigramas sobre un vocabulario cerrado (entidades, clases o
+    propiedades permitidas). lookup() devuelve el nombre permitido más
+    parecido: primero coincidencia exacta o normalizada, luego el mejor
+    coeficiente de Dice de trigramas (desempate con difflib y por nombre,
+    así que el resultado es determinista).
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names = sorted({n for n in names if isinstance(n, str) and n.strip()})
+        self._exact = set(self.names)
+        self._by_key: Dict[str, str] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, List[str]] = {}
+        for name in self.names:
+            key = normalize_name(name)
+            # varios nombres con la misma clave: se queda el primero en orden
+            self._by_key.setdefault(key, name)
+            grams = _trigrams(key)
+            self._grams[name] = grams
+            for g in grams:
+                self._postings.setdefault(g, []).append(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._exact
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def lookup(self, query: str, min_score: float = 0.6) -> Tuple[Optional[str], float]:
+        """(nombre permitido más parecido, puntuación 0..1); (None, mejor puntuación) si no llega a min_score."""
+        if query in self._exact:
+            return query, 1.0
+        key = normalize_name(query)
+        if key in self._by_key:
+            return self._by_key[key], 1.0
+        if not key:
+            return None, 0.0
+
+        grams = _trigrams(key)
+        shared: Dict[str, int] = {}
+        for g in grams:
+            for name in self._postings.get(g, ()):
+                shared[name] = shared.get(name, 0) + 1
+
+        # orden: mayor Dice, mayor ratio de difflib, nombre
+        best: Optional[Tuple[float, float, str]] = None
+        for name, n in shared.items():
+            dice = 2.0 * n / (len(grams) + len(self._grams[name]))
+            if best is not None and -dice > best[0]:
+                continue
+            ratio = difflib.SequenceMatcher(None, key, normalize_name(name)).ratio()
+            cand = (-dice, -ratio, name)
+            if best is None or cand < best:
+                best = cand
+        if best is None or -best[0] < min_score:
+            return None, (-best[0] if best else 0.0)
+        return best[2], -best[0]
+
+
+@lru_cache(maxsize=32)
+def _index_for(names: FrozenSet[str]) -> FuzzyIndex:
+    return FuzzyIndex(names)
+
+
+def fuzzy_index(names: Iterable[str]) -> FuzzyIndex:
+    """Índice compartido por vocabulario (las runs de un batch reutilizan el mismo)."""
+    return _index_for(frozenset(names))
@@ -0,0 +1,139 @@
+# /src/utils/prompt_budget.py
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:  # tokenizador BPE local si está instalado; si no, aproximación por regex
+    import tiktoken
+except ImportError:  # pragma: no cover - dependencia opcional
+    tiktoken = None
+
+# margen de tokens del formato de chat (roles, separadores) por mensaje
+_MESSAGE_OVERHEAD = 4
+
+# títulos de sección de los prompts C1–C3, en el orden en que se buscan
+SECTION_HEADINGS: Sequence[Tuple[str, str]] = (
+    ("retract", "Observed change"),
+    ("context_triples", "Retrieved context triples"),
+    ("catalog_preferred", "Preferred EventType class catalog"),
+    ("catalog_fallback", "Fallback EventType class catalog"),
+    ("entities", "Allowed entities"),
+    ("object_properties", "Allowed object properties"),
+    ("event_classes", "Allowed event classes"),
+    ("event_classes", "Allowed EventType classes"),
+    ("task", "Task:"),
+    ("rules", "Rules"),
+    ("rules", "Retract-specific rules"),
+)
+
+# solo cuentan los títulos al inicio de línea (las descripciones del catálogo pueden contener "Task:")
+_HEADING_RES = [(name, re.compile(r"^[ \t]*" + re.escape(heading), re.M)) for name, heading in SECTION_HEADINGS]
+
+_PIECE_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d{1,3}|[^\w\s]|_")
+_ENCODING: Any = None
+
+
+def tokenizer_name() -> str:
+    if tiktoken is None:
+        return "approx-regex"
+    return os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Nº de tokens de `text` con tiktoken, o una aproximación BPE (trozos CamelCase/dígitos/puntuación)."""
+    global _ENCODING
+    if tiktoken is not None:
+        if _ENCODING is None:
+            _ENCODING = tiktoken.get_encoding(tokenizer_name())
+        return len(_ENCODING.encode(text))
+    n = 0
+    for piece in _PIECE_RE.findall(text):
+        n += 1 + (len(piece) - 1) // 6
+    return n
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(m.get("content") or "") + _MESSAGE_OVERHEAD for m in messages)
+
+
+def section_breakdown(messages: List[Dict[str, str]]) -> Dict[str, int]:
+    """Tokens por sección del prompt (según SECTION_HEADINGS); lo anterior a la primera sección es 'preamble'."""
+    out: Dict[str, int] = {}
+    for m in messages:
+        content = m.get("content") or ""
+        if m.get("role") == "system":
+            out["system"] = out.get("system", 0) + count_tokens(content) + _MESSAGE_OVERHEAD
+            continue
+
+        marks: List[Tuple[int, str]] = []
+        for name, pattern in _HEADING_RES:
+            hit = pattern.search(content)
+            if hit:
+                marks.append((hit.start(), name))
+        marks.sort()
+
+        bounds = [(0, "preamble")] + marks + [(len(content), "")]
+        for (start, name), (end, _) in zip(bounds, bounds[1:]):
+            if end > start:
+                out[name] = out.get(name, 0) + count_tokens(content[start:end])
+        out["preamble"] = out.get("preamble", 0) + _MESSAGE_OVERHEAD
+    return out
+
+
+def fit_prompt(
+    render: Callable[[Dict[str, int]], List[Dict[str, str]]],
+    limits: Dict[str, int],
+    cut_order: Sequence[str],
+    budget: int,
+    min_items: Optional[Dict[str, int]] = None,
+) -> Tuple[List[Dict[str, str]], Dict[str, int], bool]:
+    """
+    Ajusta los límites de elementos por sección para que los mensajes quepan en
+    `budget` tokens. Se parte de `limits` (todo lo disponible) y se recortan las
+    secciones en `cut_order` (primero la de menor prioridad), cada una con
+    búsqueda binaria del mayor nº de elementos que cabe, sin bajar de min_items.
+    Devuelve (mensajes, límites usados, cabe en el presupuesto).
+    """
+    min_items = min_items or {}
+    limits = dict(limits)
+    messages = render(limits)
+    if count_message_tokens(messages) <= budget:
+        return messages, limits, True
+
+    for name in cut_order:
+        lo, hi = min(min_items.get(name, 0), limits[name]), limits[name]
+        best = lo
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if count_message_tokens(render({**limits, name: mid})) <= budget:
+                best, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+        limits[name] = best
+        messages = render(limits)
+        if count_message_tokens(messages) <= budget:
+            return messages, limits, True
+    return messages, limits, False
+
+
+def prompt_stats(messages: List[Dict[str, str]], context_window: Optional[int] = None,
+                 max_tokens: Optional[int] = None, limits: Optional[Dict[str, int]] = None,
+                 fitted: Optional[bool] = None) -> Dict[str, Any]:
+    """Resumen del tamaño del prompt para el registro."""
+    out: Dict[str, Any] = {
+        "tokenizer": tokenizer_name(),
+        "tokens": count_message_tokens(messages),
+        "sections": section_breakdown(messages),
+    }
+    if context_window is not None:
+        out["context_window"] = context_window
+        out["budget"] = input_budget(context_window, max_tokens)
+        out["limits"] = dict(limits or {})
+        out["fitted"] = fitted
+    return out
+
+
+def input_budget(context_window: int, max_tokens: Optional[int], reserve: int = 32) -> int:
+    """Tokens disponibles para el prompt: ventana - max_tokens de respuesta - margen."""
+    return max(0, context_window - int(max_tokens or 0) - reserve)
+
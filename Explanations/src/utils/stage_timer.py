@@ -0,0 +1,54 @@
+# /src/utils/stage_timer.py
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# etapas que son tiempo de espera al LLM; el resto es sobrecoste simbólico/CPU
+LLM_STAGES = ("llm_call", "repair_call")
+
+
+class StageTimer:
+    """
+    Tiempo de pared por etapa de la generación de hipótesis (extracción de
+    triples, recuperación, catálogo, prompt, parseo, reparación, vocabulario).
+    Una etapa repetida acumula (p. ej. el parseo de la respuesta y el de la
+    reparación).
+    """
+
+    def __init__(self, stages: Optional[Dict[str, float]] = None):
+        self.stages: Dict[str, float] = dict(stages or {})
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name: str, seconds: Optional[float]) -> None:
+        if seconds is not None:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record(self, messages: List[Dict[str, str]], prompt_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Objeto `timings` del registro: etapas, totales simbólico/LLM y tamaño del prompt."""
+        return {
+            "stages_s": dict(self.stages),
+            "symbolic_s": sum(v for k, v in self.stages.items() if k not in LLM_STAGES),
+            "llm_s": sum(v for k, v in self.stages.items() if k in LLM_STAGES),
+            "prompt_tokens": prompt_tokens,
+            "prompt_chars": sum(len(m.get("content") or "") for m in messages),
+        }
+
+
+def timer_for(prepared: Dict[str, Any]) -> StageTimer:
+    """
+    Temporizador de una muestra: copia las etapas medidas en prepare_cX, así cada
+    muestra de un prompt compartido (n_samples) añade las suyas por separado.
+    """
+    return StageTimer(prepared.get("timings"))
+
+
+def timings_record(prepared: Dict[str, Any], timer: StageTimer) -> Dict[str, Any]:
+    stats = prepared.get("prompt_stats") or {}
+    return timer.record(prepared["request"]["messages"], stats.get("tokens"))
@@ -0,0 +1,57 @@
+# /src/utils/symbolic_cache.py
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class SymbolicCache:
+    """
+    Memo de resultados simbólicos (triples ABox, subgrafos recuperados, catálogos)
+    asociado a un estado congelado del runtime. Se comparte entre las muestras de
+    un snapshot y entre configuraciones de un sweep.
+    """
+
+    def __init__(self):
+        self._store: Dict[Hashable, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        if key in self._store:
+            self.hits += 1
+            return self._store[key]
+        self.misses += 1
+        val = fn()
+        self._store[key] = val
+        return val
+
+    def get_or_compute_prefix(self, key: Hashable, n: int, fn: Callable[[int], List[Any]]) -> List[Any]:
+        """
+        Para resultados truncables (el resultado con límite n es prefijo del de
+        cualquier límite mayor): se reutiliza la entrada calculada con el mayor
+        límite pedido hasta ahora.
+        """
+        entry = self._store.get(key)
+        if entry is not None:
+            limit, val = entry
+            # len(val) < limit: el resultado ya estaba completo antes de llegar al límite
+            if n <= limit or len(val) < limit:
+                self.hits += 1
+                return val[:n]
+        self.misses += 1
+        val = fn(n)
+        self._store[key] = (n, val)
+        return val
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._store)}
+
+
+def cached(cache: Optional[SymbolicCache], key: Hashable, fn: Callable[[], Any]) -> Any:
+    if cache is None:
+        return fn()
+    return cache.get_or_compute(key, fn)
+
+
+def cached_prefix(cache: Optional[SymbolicCache], key: Hashable, n: int, fn: Callable[[int], List[Any]]) -> List[Any]:
+    if cache is None:
+        return fn(n)
+    return cache.get_or_compute_prefix(key, n, fn)
@@ -1,7 +1,7 @@
 # /src/utils/tbox_vocab.py
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple
 import types
 from owlready2 import get_ontology, ThingClass
 
@@ -22,10 +22,23 @@ def _get_class_by_local(onto, local: str) -> Optional[ThingClass]:
             return c
     return None
 
+# vocabularios ya extraídos en este proceso (la TBox no cambia entre runs/configs)
+_VOCAB_CACHE: Dict[Tuple[str, Tuple[str, ...], int], TBoxVocab] = {}
+
 def extract_tbox_vocab(
     ontology_path: str,
     event_root_locals: Optional[List[str]] = None,
     max_event_types: int = 120,
+) -> TBoxVocab:
+    key = (ontology_path, tuple(event_root_locals or ()), max_event_types)
+    if key not in _VOCAB_CACHE:
+        _VOCAB_CACHE[key] = _extract_tbox_vocab(ontology_path, event_root_locals, max_event_types)
+    return _VOCAB_CACHE[key]
+
+def _extract_tbox_vocab(
+    ontology_path: str,
+    event_root_locals: Optional[List[str]],
+    max_event_types: int,
 ) -> TBoxVocab:
     onto = _load_onto(ontology_path)
 
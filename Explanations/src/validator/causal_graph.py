@@ -0,0 +1,222 @@
+# /src/validator/causal_graph.py
+
+import json
+import os
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# relativa a Explanations/, no al directorio de trabajo
+DEFAULT_CAUSAL_PROPERTIES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data", "mappings", "causal_properties.txt",
+)
+
+# propiedades cuyo sentido es efecto -> causa (se invierten al indexar)
+INVERSE_CAUSAL_PROPS = {"isCausedByEvent", "isReactionTo", "isDirectReactionTo"}
+
+Edge = Tuple[str, str, str]
+
+
+def _local_name(iri: str) -> str:
+    return iri.strip().rsplit("#", 1)[-1].rsplit("/", 1)[-1]
+
+
+def load_causal_property_names(path: Optional[str] = None) -> List[str]:
+    """
+    Nombres locales de las propiedades causales del fichero de mapeo. Un fichero
+    pedido explícitamente que no existe es un error; si falta el de por defecto
+    se avisa y se indexa solo `causes`.
+    """
+    if path is None:
+        path = DEFAULT_CAUSAL_PROPERTIES_PATH
+        if not os.path.exists(path):
+            print(f"[causal_graph] WARNING: {path} not found, indexing only 'causes'")
+            return ["causes"]
+    elif not os.path.exists(path):
+        raise FileNotFoundError(f"Causal properties mapping not found: {path}")
+    names: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            names.append(_local_name(line))
+    return list(dict.fromkeys(names))
+
+
+class CausalGraph:
+    """
+    Índice en memoria de las relaciones causales del ABox.
+    Todas las aristas se normalizan al sentido causa -> efecto.
+    """
+
+    def __init__(self, forward_props: Iterable[str], inverse_props: Iterable[str] = ()):
+        self.forward_props: Set[str] = set(forward_props)
+        self.inverse_props: Set[str] = set(inverse_props)
+        self._effects: Dict[str, Dict[str, Set[str]]] = {}
+        self._causes: Dict[str, Dict[str, Set[str]]] = {}
+
+    @classmethod
+    def from_property_names(cls, names: Iterable[str], rt: Any = None) -> "CausalGraph":
+        names = list(names)
+        forward: Set[str] = set()
+        inverse: Set[str] = set()
+        for n in names:
+            if n in INVERSE_CAUSAL_PROPS:
+                inverse.add(n)
+            else:
+                forward.add(n)
+
+        # los inversos declarados en la ontología (owl:inverseOf) también se indexan
+        ns = getattr(rt, "ns", None)
+        if ns is not None:
+            for n in list(forward):
+                prop = getattr(ns, n, None)
+                inv_name = getattr(getattr(prop, "inverse_property", None), "name", None)
+                if inv_name and inv_name not in forward:
+                    inverse.add(inv_name)
+        return cls(forward, inverse)
+
+    @classmethod
+    def from_mapping_file(cls, path: Optional[str] = None, rt: Any = None) -> "CausalGraph":
+        return cls.from_property_names(load_causal_property_names(path), rt=rt)
+
+    # --- construcción ---
+
+    @property
+    def property_names(self) -> List[str]:
+        return sorted(self.forward_props | self.inverse_props)
+
+    def add_relation(self, s: str, prop: str, o: str) -> bool:
+        if prop in self.inverse_props:
+            return self.add_edge(o, s, prop)
+        if prop in self.forward_props:
+            return self.add_edge(s, o, prop)
+        return False
+
+    def add_edge(self, cause: str, effect: str, prop: str = "causes") -> bool:
+        props = self._effects.setdefault(cause, {}).setdefault(effect, set())
+        if prop in props:
+            return False
+        props.add(prop)
+        self._causes.setdefault(effect, {}).setdefault(cause, set()).add(prop)
+        return True
+
+    def remove_node(self, node: str) -> int:
+        removed = 0
+        for eff in self._effects.pop(node, {}):
+            self._causes.get(eff, {}).pop(node, None)
+            if not self._causes.get(eff):
+                self._causes.pop(eff, None)
+            removed += 1
+        for cause in self._causes.pop(node, {}):
+            self._effects.get(cause, {}).pop(node, None)
+            if not self._effects.get(cause):
+                self._effects.pop(cause, None)
+            removed += 1
+        return removed
+
+    def rebuild_from_runtime(self, rt: Any) -> int:
+        self._effects.clear()
+        self._causes.clear()
+        ns = getattr(rt, "ns", None)
+        if ns is None:
+            return 0
+        n = 0
+        for pname in self.property_names:
+            prop = getattr(ns, pname, None)
+            if prop is None:
+                continue
+            try:
+                pairs = list(prop.get_relations())
+            except Exception:
+                continue
+            for s, o in pairs:
+                s_name, o_name = getattr(s, "name", None), getattr(o, "name", None)
+                if s_name and o_name and self.add_relation(s_name, pname, o_name):
+                    n += 1
+        return n
+
+    # --- consultas ---
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._effects or node in self._causes
+
+    def n_edges(self) -> int:
+        return sum(len(v) for v in self._effects.values())
+
+    def direct_causes(self, node: str) -> List[str]:
+        return sorted(self._causes.get(node, {}))
+
+    def direct_effects(self, node: str) -> List[str]:
+        return sorted(self._effects.get(node, {}))
+
+    def _reachable(self, node: str, adj: Dict[str, Dict[str, Set[str]]], max_hops: Optional[int]) -> Dict[str, int]:
+        dist = {node: 0}
+        q = deque([node])
+        while q:
+            cur = q.popleft()
+            d = dist[cur]
+            if max_hops is not None and d >= max_hops:
+                continue
+            for nxt in adj.get(cur, {}):
+                if nxt not in dist:
+                    dist[nxt] = d + 1
+                    q.append(nxt)
+        dist.pop(node, None)
+        return dist
+
+    def root_causes(self, node: str) -> List[str]:
+        ancestors = self._reachable(node, self._causes, None)
+        return sorted(a for a in ancestors if not self._causes.get(a))
+
+    def effect_set(self, node: str, max_hops: Optional[int] = None) -> Set[str]:
+        return set(self._reachable(node, self._effects, max_hops))
+
+    def cause_set(self, node: str, max_hops: Optional[int] = None) -> Set[str]:
+        return set(self._reachable(node, self._causes, max_hops))
+
+    def causal_chains(self, node: str, k: int, direction: str = "causes") -> List[List[str]]:
+        """
+        Cadenas simples de hasta k saltos desde node.
+        direction="causes" recorre hacia atrás (cadena causa -> ... -> node),
+        direction="effects" hacia delante (node -> ... -> efecto).
+        """
+        adj = self._causes if direction == "causes" else self._effects
+        chains: List[List[str]] = []
+        stack: List[List[str]] = [[node]]
+        while stack:
+            path = stack.pop()
+            nxts = [n for n in sorted(adj.get(path[-1], {})) if n not in path]
+            if len(path) - 1 >= k or not nxts:
+                if len(path) > 1:
+                    chains.append(path[::-1] if direction == "causes" else path)
+                continue
+            for n in reversed(nxts):
+                stack.append(path + [n])
+        return chains
+
+    def edges(self) -> List[Edge]:
+        out: List[Edge] = []
+        for cause, effs in self._effects.items():
+            for eff, props in effs.items():
+                for p in props:
+                    out.append((cause, p, eff))
+        return sorted(out)
+
+    # --- exportación ---
+
+    def to_dict(self) -> Dict[str, Any]:
+        nodes = sorted(set(self._effects) | set(self._causes))
+        return {
+            "properties": {"forward": sorted(self.forward_props), "inverse": sorted(self.inverse_props)},
+            "nodes": nodes,
+            "edges": [list(e) for e in self.edges()],
+            "roots": sorted(n for n in nodes if not self._causes.get(n)),
+        }
+
+    def export_json(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
@@ -1,9 +1,13 @@
 # /src/validator/causal_validator.py
 
+import time
 from dataclasses import dataclass
 from typing import List, Tuple, Dict, Optional, Any
 from owlready2 import Thing
 
+from validator.causal_graph import CausalGraph
+from validator.explanation_cache import ExplanationCache, Fingerprint, digest_int
+
 Triple = Tuple[str, str, str]
 
 
@@ -14,6 +18,20 @@ class Explanation:
     reason: str
 
 
+@dataclass
+class RetentionPolicy:
+    """
+    Política de retención del historial de eventos.
+    - max_age_steps: expulsa eventos nacidos hace más de N steps.
+    - max_events: nº máximo de eventos rastreados (se expulsan los más antiguos).
+    - max_bytes: presupuesto aproximado (tamaño serializado de sus aserciones).
+    Los eventos dentro de la ventana de candidatos del validador nunca se expulsan.
+    """
+    max_age_steps: Optional[int] = None
+    max_events: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+
 class causal_validator:
 
     def __init__(self,
@@ -21,7 +39,10 @@ class causal_validator:
                  event_class_qnames: Optional[List[str]] = None,
                  participant_prop_names: Optional[List[str]] = None,
                  location_prop_names: Optional[List[str]] = None,
-                 change_event_class_qname: Optional[str] = None):
+                 change_event_class_qname: Optional[str] = None,
+                 retention: Optional[RetentionPolicy] = None,
+                 causal_properties_path: Optional[str] = None,
+                 explanation_cache: Optional[ExplanationCache] = None):
 
         self.rt = runtime
 
@@ -34,9 +55,30 @@ class causal_validator:
         self.location_prop_names = location_prop_names or ["hasLocation", "occursIn"]
         self.causal_prop_names = ["causes"]
 
+        self.causal_graph = CausalGraph.from_mapping_file(causal_properties_path, rt=runtime)
+        self.causal_graph.rebuild_from_runtime(runtime)
+
         self.event_birth_step: Dict[Thing, int] = {}
         self.event_tags: Dict[Thing, List[str]] = {}
 
+        # eventos de cambio (Ep_*) derivados de retracts y su causa asignada
+        self.change_event_step: Dict[Thing, int] = {}
+        self.change_event_cause: Dict[Thing, Thing] = {}
+
+        self.candidate_window = 2
+
+        self.explanation_cache = explanation_cache
+        # digest XOR del registro de eventos (se actualiza en altas/bajas)
+        self._registry_digest = 0
+        self.retention = retention
+        self.eviction_stats: Dict[str, Any] = {
+            "evictions": 0,
+            "evicted_events": 0,
+            "evicted_change_events": 0,
+            "evicted_bytes_est": 0,
+            "by_reason": {"age": 0, "count": 0, "bytes": 0},
+        }
+
 
     def _get_event_roots(self):
         if self._event_root_classes is None:
@@ -83,6 +125,8 @@ class causal_validator:
                 continue
             if observed_ev not in col:
                 col.append(observed_ev)
+                self.change_event_cause[observed_ev] = cause_ev
+                self.causal_graph.add_relation(cause_ev.name, prop.name, observed_ev.name)
                 return True
         return False
 
@@ -114,7 +158,7 @@ class causal_validator:
                         getattr(ep, prop.name).append(old_loc)
                         break
 
-
+        self.change_event_step.setdefault(ep, step_index)
         return ep
 
     def register_new_types(self, step: Any, step_index: int):
@@ -131,6 +175,7 @@ class causal_validator:
             if inst not in self.event_birth_step:
                 self.event_birth_step[inst] = step_index
                 self.event_tags[inst] = list(getattr(step, "tags", []) or [])
+                self._registry_digest ^= self._event_digest(inst)
 
     def has_hl_changes(self, step: Any) -> bool:
         return bool(step.retracts)
@@ -146,7 +191,12 @@ class causal_validator:
             if prop_local != "hasLocation":
                 continue
 
+            t0 = time.time()
+            hits0 = self.explanation_cache.hits if self.explanation_cache is not None else 0
             explained, exp = self._explain_retract_hasLocation(r, step_index)
+            if self.explanation_cache is not None:
+                outcome = "hit" if self.explanation_cache.hits > hits0 else "miss"
+                self.rt.record_timing(f"{step_index}:{step.name}:explain_cache_{outcome}", time.time() - t0)
             if explained and exp is not None:
                 explanations.append(exp)
             else:
@@ -162,9 +212,105 @@ class causal_validator:
         to_remove = [e for e in self.event_birth_step.keys()
                     if getattr(e, "name", None) in locals_to_remove]
         for e in to_remove:
+            self._registry_digest ^= self._event_digest(e)
             del self.event_birth_step[e]
+            self.event_tags.pop(e, None)
+            self.causal_graph.remove_node(e.name)
             print(f"[Validator] Removed event from birth map: {e.name}")
 
+    # --- retención / expulsión de eventos antiguos ---
+
+    def _estimate_event_bytes(self, ev: Thing) -> int:
+        size = len(getattr(ev, "iri", "") or "")
+        try:
+            props = list(ev.get_properties())
+        except Exception:
+            return size
+        for prop in props:
+            try:
+                vals = prop[ev]
+            except Exception:
+                continue
+            for v in vals:
+                size += len(prop.name) + len(str(getattr(v, "name", v)))
+        return size
+
+    def _tracked_events(self) -> List[Tuple[int, Thing]]:
+        tracked = [(b, e) for e, b in self.event_birth_step.items()]
+        tracked += [(b, e) for e, b in self.change_event_step.items()]
+        tracked.sort(key=lambda x: (x[0], getattr(x[1], "name", "")))
+        return tracked
+
+    def _select_evictions(self, step_index: int) -> Dict[Thing, str]:
+        pol = self.retention
+        protected_from = step_index - self.candidate_window
+        tracked = self._tracked_events()
+        evictable = [(b, e) for b, e in tracked if b < protected_from]
+
+        selected: Dict[Thing, str] = {}
+        if pol.max_age_steps is not None:
+            for b, e in evictable:
+                if step_index - b > pol.max_age_steps:
+                    selected[e] = "age"
+
+        remaining = [(b, e) for b, e in evictable if e not in selected]
+        if pol.max_events is not None:
+            n_over = (len(tracked) - len(selected)) - pol.max_events
+            while n_over > 0 and remaining:
+                _, e = remaining.pop(0)
+                selected[e] = "count"
+                n_over -= 1
+
+        if pol.max_bytes is not None:
+            kept = [e for _, e in tracked if e not in selected]
+            sizes = {e: self._estimate_event_bytes(e) for e in kept}
+            total = sum(sizes.values())
+            while total > pol.max_bytes and remaining:
+                _, e = remaining.pop(0)
+                if e in selected:
+                    continue
+                selected[e] = "bytes"
+                total -= sizes.get(e, 0)
+
+        # los Ep_* derivados de un evento expulsado se expulsan con él
+        for ep, cause in list(self.change_event_cause.items()):
+            if cause in selected and ep not in selected:
+                selected[ep] = selected[cause]
+        return selected
+
+    def apply_retention(self, step_index: int) -> int:
+        if self.retention is None:
+            return 0
+
+        selected = self._select_evictions(step_index)
+        if not selected:
+            return 0
+
+        bytes_est = 0
+        for ev, why in selected.items():
+            bytes_est += self._estimate_event_bytes(ev)
+            if ev in self.change_event_step:
+                del self.change_event_step[ev]
+                self.eviction_stats["evicted_change_events"] += 1
+            else:
+                self._registry_digest ^= self._event_digest(ev)
+                self.event_birth_step.pop(ev, None)
+                self.event_tags.pop(ev, None)
+                self.eviction_stats["evicted_events"] += 1
+            self.change_event_cause.pop(ev, None)
+            self.causal_graph.remove_node(ev.name)
+            self.eviction_stats["by_reason"][why] += 1
+
+        for ep, cause in list(self.change_event_cause.items()):
+            if cause in selected:
+                del self.change_event_cause[ep]
+
+        self.rt.destroy_individuals(list(selected.keys()))
+        self.eviction_stats["evictions"] += 1
+        self.eviction_stats["evicted_bytes_est"] += bytes_est
+        print(f"[Validator] Retention evicted {len(selected)} events (step {step_index})")
+        return len(selected)
+
 
 
     def _explain_retract_hasLocation(self, retract: Triple, step_index: int) -> Tuple[bool, Optional[Explanation]]:
@@ -179,6 +325,62 @@ class causal_validator:
 
         candidate_events = self._get_candidate_events_upto(step_index)
 
+        if self.explanation_cache is None:
+            return self._explain_uncached(retract, step_index, ep, subj, old_loc, candidate_events)
+
+        key = self._retract_fingerprint(retract, step_index, subj, old_loc, candidate_events)
+        cached = self.explanation_cache.get(key)
+        if cached is not None:
+            return self._replay_cached(cached, retract, ep, candidate_events)
+
+        explained, exp = self._explain_uncached(retract, step_index, ep, subj, old_loc, candidate_events)
+        payload = None
+        if explained and exp is not None:
+            payload = {"event_iri": exp.event_iri, "reason": exp.reason}
+        self.explanation_cache.put(key, explained, payload)
+        return explained, exp
+
+    # --- memo de explicaciones ---
+
+    def _event_digest(self, ev: Thing) -> int:
+        return digest_int(getattr(ev, "name", None),
+                          self.event_birth_step.get(ev),
+                          tuple(self.event_tags.get(ev, []) or []))
+
+    def _names(self, ents: List[Thing]) -> List[str]:
+        return [getattr(e, "name", str(e)) for e in ents]
+
+    def _retract_fingerprint(self, retract: Triple, step_index: int,
+                             subj: Thing, old_loc: Thing,
+                             candidate_events: List[Thing]) -> str:
+        fp = Fingerprint(self._registry_digest)
+        fp.update(tuple(retract), step_index, self._requires_object_anchor(subj))
+        fp.update_sorted(self._names(self._collect_locations(old_loc)))
+        # el orden importa: desempata la selección del mejor candidato
+        for ev in candidate_events:
+            fp.update(
+                ev.name,
+                self._fmt_entity(self._get_location(ev)),
+                tuple(sorted(set(self._names(self._get_participants(ev))))),
+                tuple(sorted(set(self._get_event_types(ev)))),
+            )
+        return fp.hexdigest()
+
+    def _replay_cached(self, cached, retract: Triple, ep: Thing,
+                       candidate_events: List[Thing]) -> Tuple[bool, Optional[Explanation]]:
+        explained, payload = cached
+        if not explained or payload is None:
+            return False, None
+        best_event = next((e for e in candidate_events if e.iri == payload["event_iri"]), None)
+        if best_event is None:
+            return False, None
+        if self._assert_causal_link(best_event, ep):
+            print(f"[CAUSAL-LINK] Added causal link (cached): {best_event.name} -> {ep.name}")
+        return True, Explanation(retract=retract, event_iri=payload["event_iri"], reason=payload["reason"])
+
+    def _explain_uncached(self, retract: Triple, step_index: int, ep: Thing,
+                          subj: Thing, old_loc: Thing,
+                          candidate_events: List[Thing]) -> Tuple[bool, Optional[Explanation]]:
         scored_candidates = []
         for ev in candidate_events:
             if "background" in (self.event_tags.get(ev, []) or []):
@@ -287,7 +489,9 @@ class causal_validator:
 
 
 
-    def _get_candidate_events_upto(self, step_index: int, window: int = 2) -> List[Thing]:
+    def _get_candidate_events_upto(self, step_index: int, window: Optional[int] = None) -> List[Thing]:
+        if window is None:
+            window = self.candidate_window
         lo = max(1, step_index - window)
         return [e for e, b_step in self.event_birth_step.items()
                 if lo <= b_step <= step_index]
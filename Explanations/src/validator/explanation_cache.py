@@ -0,0 +1,81 @@
+# /src/validator/explanation_cache.py
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+def digest_int(*parts: Any) -> int:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(repr(p).encode("utf-8"))
+        h.update(b"\x1f")
+    return int.from_bytes(h.digest()[:8], "big")
+
+
+class Fingerprint:
+    """
+    Huella incremental: se alimenta por partes y se puede combinar con un
+    digest de registro mantenido por XOR (altas/bajas en O(1)).
+    """
+
+    def __init__(self, base: int = 0):
+        self._h = hashlib.sha1(base.to_bytes(8, "big"))
+
+    def update(self, *parts: Any) -> "Fingerprint":
+        for p in parts:
+            self._h.update(repr(p).encode("utf-8"))
+            self._h.update(b"\x1f")
+        return self
+
+    def update_sorted(self, items: Iterable[Any]) -> "Fingerprint":
+        return self.update(tuple(sorted(repr(x) for x in items)))
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+
+class ExplanationCache:
+    """
+    Memo de veredictos de explicación (explicado con evento/razón, o no explicado)
+    indexado por la huella del retract y su vecindario ABox.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._store: "OrderedDict[str, Tuple[bool, Optional[Dict[str, str]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[bool, Optional[Dict[str, str]]]]:
+        val = self._store.get(key)
+        if val is None:
+            self.misses += 1
+            return None
+        self._store.move_to_end(key)
+        self.hits += 1
+        return val
+
+    def put(self, key: str, explained: bool, payload: Optional[Dict[str, str]]) -> None:
+        self._store[key] = (explained, payload)
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_entries:
+            self._store.popitem(last=False)
+
+    def clear(self) -> None:
+        self._store.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._store),
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+# compartida entre validadores del mismo proceso (las runs de un batch)
+shared_explanation_cache = ExplanationCache()
@@ -6,7 +6,8 @@ from dataclasses import dataclass, field
 from typing import List, Tuple, Callable, Optional, Dict, Any
 from owlready2 import *
 
-from validator.causal_validator import causal_validator
+from validator.causal_validator import causal_validator, RetentionPolicy
+from validator.explanation_cache import shared_explanation_cache
 
 Triple = Tuple[str, str, str]
 
@@ -28,6 +29,8 @@ class ExperimentConfig:
     steps: List[Step]
     extra_ontology_paths: List[str] = field(default_factory=list)
     enable_reasoner: bool = True
+    retention: Optional[RetentionPolicy] = None
+    explanation_cache: bool = True
 
 class OntologyRuntime:
     def __init__(self, ont_path: str, extra_paths: Optional[List[str]] = None):
@@ -308,6 +311,16 @@ class OntologyRuntime:
                     destroy_entity(inst)
                     print(f"[Delete] Destroyed individual: {local}")
 
+    def destroy_individuals(self, insts: List[Any]) -> int:
+        n = 0
+        with self.onto:
+            for inst in insts:
+                if inst is None:
+                    continue
+                destroy_entity(inst)
+                n += 1
+        return n
+
     def apply_types(self, typings: List[Tuple[str, str]]):
         for inst_name, class_qn in typings:
             cls = self._get_class(class_qn)
@@ -389,9 +402,15 @@ def on_unexplained():
 
 
 
-def run_experiment(cfg: ExperimentConfig, on_unexplained: Optional[OnUnexplainedFn] = None):
+def run_experiment(cfg: ExperimentConfig,
+                   on_unexplained: Optional[OnUnexplainedFn] = None,
+                   causal_graph_path: Optional[str] = None):
     rt = OntologyRuntime(cfg.ontology_path, extra_paths=getattr(cfg, "extra_ontology_paths", []))
-    validator = causal_validator(rt)
+    validator = causal_validator(
+        rt,
+        retention=getattr(cfg, "retention", None),
+        explanation_cache=shared_explanation_cache if getattr(cfg, "explanation_cache", True) else None,
+    )
 
     print("\n=== START EXPERIMENT ===")
     for i, step in enumerate(cfg.steps, 1):
@@ -433,6 +452,9 @@ def run_experiment(cfg: ExperimentConfig, on_unexplained: Optional[OnUnexplained
                         "errors": errors,
                         "timing": list(rt.timing),
                         "runtime": rt,
+                        "retention": dict(validator.eviction_stats),
+                        "causal_graph": validator.causal_graph,
+                        "explanation_cache": validator.explanation_cache.stats() if validator.explanation_cache else None,
                     })
                 rt.record_timing(f"{i}:{step.name}:step_total", time.time() - t_step0)
                 break
@@ -446,10 +468,21 @@ def run_experiment(cfg: ExperimentConfig, on_unexplained: Optional[OnUnexplained
             validator.unregister_deleted(step.deletes)
             rt.delete_instances(step.deletes)
 
+        t0 = time.time()
+        if validator.apply_retention(i):
+            rt.record_timing(f"{i}:{step.name}:retention", time.time() - t0)
+
         rt.record_timing(f"{i}:{step.name}:step_total", time.time() - t_step0)
 
     print("\n=== END EXPERIMENT ===")
     print("Timings:")
     for label, dt in rt.timing:
         print(f"  {label}: {dt:.3f}s")
+    if validator.explanation_cache is not None:
+        print("Explanation cache:", validator.explanation_cache.stats())
+    if validator.retention is not None:
+        print("Retention:", validator.eviction_stats)
+    if causal_graph_path:
+        validator.causal_graph.export_json(causal_graph_path)
+        print(f"[CausalGraph] {validator.causal_graph.n_edges()} edges -> {causal_graph_path}")
 